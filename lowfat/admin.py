@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from simple_history.admin import SimpleHistoryAdmin
 
@@ -398,3 +399,29 @@ class BlogSentMailAdmin(SimpleHistoryAdmin):
 @admin.register(TermsAndConditions)
 class TermsAndConditionsAdmin(SimpleHistoryAdmin):
     pass
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = [
+        'subject',
+        'recipient',
+        'status',
+        'attempts',
+        'next_attempt',
+        'added',
+        'sent',
+    ]
+    list_filter = [
+        'status',
+        'recipient',
+    ]
+    actions = [
+        'retry',
+    ]
+
+    def retry(self, request, queryset):
+        """Queue the selected dead messages again."""
+        queued = queryset.filter(status="D").update(status="P", attempts=0, next_attempt=timezone.now())
+        self.message_user(request, "{} messages queued again.".format(queued))
+    retry.short_description = "Send the selected dead messages again"
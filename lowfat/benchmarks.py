@@ -0,0 +1,155 @@
+"""Wall time and number of queries of the main views and model methods.
+
+The benchmarks are meant to run with ``manage.py benchmark`` on a database
+filled by ``manage.py generate_synthetic_data``. Every benchmark runs in a
+transaction that is rolled back, so the database is left unchanged.
+"""
+from contextlib import redirect_stdout
+import io
+import statistics
+import time
+
+from constance import config
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .jobs.daily import reminder
+from .models import Claimant, Expense, Fund
+
+#: Relative slowdown over the baseline reported as a regression
+BENCHMARK_TOLERANCE = 0.25
+
+#: Slowdown in milliseconds always ignored, the noise of the fastest benchmarks
+BENCHMARK_NOISE_MS = 2.0
+
+
+class BenchmarkError(Exception):
+    """A benchmark could not run, e.g. the database has no fund."""
+
+
+class BenchmarkData:
+    """Clients and records shared by the benchmarks."""
+    def __init__(self):
+        self.claimant = Claimant.objects.annotate(
+            funds=Count("fund")
+        ).order_by("-funds", "id").first()
+        if self.claimant is None or not self.claimant.funds:
+            raise BenchmarkError("The database has no fund, run generate_synthetic_data first.")
+
+        # The fund with the most expenses, the worst case of its page.
+        self.fund = Fund.objects.annotate(
+            expenses=Count("expense")
+        ).order_by("-expenses", "id").first()
+
+        staff = User.objects.create_user("benchmark-staff", is_staff=True, is_superuser=True)
+        self.staff = Client()
+        self.staff.force_login(staff)
+
+        if self.claimant.user is None:
+            self.claimant.user = User.objects.create_user("benchmark-claimant")
+            self.claimant.save()
+        self.claimant_client = Client()
+        self.claimant_client.force_login(self.claimant.user)
+
+        self.anonymous = Client()
+
+
+def _reminder_job():
+    with redirect_stdout(io.StringIO()):
+        reminder.Job().execute()
+
+
+def benchmarks(data):
+    """Return the (name, function) of every benchmark."""
+    return [
+        ("dashboard_staff", lambda: data.staff.get(reverse("dashboard"))),
+        ("dashboard_claimant", lambda: data.claimant_client.get(reverse("dashboard"))),
+        ("search", lambda: data.staff.post(reverse("search"), {"search": data.claimant.surname})),
+        ("claimant_detail", lambda: data.staff.get(data.claimant.link())),
+        ("fund_detail", lambda: data.staff.get(reverse("fund_detail", args=[data.fund.id]))),
+        ("recent_actions", lambda: data.staff.get(reverse("recent_actions"))),
+        ("geojson", lambda: data.staff.get(reverse("geojson"))),
+        ("fund_ical", lambda: data.anonymous.get(reverse("fund_ical", args=[config.CALENDAR_ACCESS_TOKEN]))),
+        ("claimantship_available", lambda: Claimant.objects.get(pk=data.claimant.pk).claimantship_available()),
+        ("reminder_job", _reminder_job),
+    ]
+
+
+def measure(function, repeat):
+    """Return the median time in milliseconds and the number of queries of function.
+
+    The cache is cleared before each call so the work of the view is
+    measured, not the one of the page cache. The first call fills the
+    caches of the process, e.g. templates and content types, and is not
+    measured.
+    """
+    times = []
+    for _ in range(repeat + 1):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            if getattr(result, "streaming", False):
+                b"".join(result.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+
+        status_code = getattr(result, "status_code", 200)
+        if status_code != 200:
+            raise BenchmarkError("Response with status code {}.".format(status_code))
+        times.append(elapsed)
+
+    return {
+        "time_ms": round(statistics.median(times[1:]), 3),
+        "queries": len(queries),
+    }
+
+
+def run_benchmarks(repeat=5, names=None):
+    """Return the results of the benchmarks, all of them unless names is given."""
+    results = {}
+    # Emails are kept in memory and requests are not recorded by lowfat.metrics.
+    with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            METRICS_DATABASE=None
+    ), transaction.atomic():
+        for name, function in benchmarks(BenchmarkData()):
+            if names and name not in names:
+                continue
+            try:
+                results[name] = measure(function, repeat)
+            except BenchmarkError as exception:
+                raise BenchmarkError("{}: {}".format(name, exception))
+        transaction.set_rollback(True)
+
+    cache.clear()
+    return {
+        "dataset": {
+            model._meta.model_name: model.objects.count()  # pylint: disable=protected-access
+            for model in (Claimant, Fund, Expense)
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """Return one message per benchmark slower or running more queries than in baseline."""
+    regressions = []
+    for name, result in sorted(report["results"].items()):
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+
+        if result["queries"] > expected["queries"]:
+            regressions.append("{}: {} queries instead of {}".format(name, result["queries"], expected["queries"]))
+
+        slowdown = result["time_ms"] - expected["time_ms"]
+        if slowdown > BENCHMARK_NOISE_MS and slowdown > tolerance * expected["time_ms"]:
+            regressions.append("{}: {:.1f} ms instead of {:.1f} ms".format(name, result["time_ms"], expected["time_ms"]))
+
+    return regressions
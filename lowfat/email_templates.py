@@ -0,0 +1,96 @@
+"""Compiled email templates, stored as flat pages under /email/template/.
+
+Each process keeps the compiled template of every flat page it sent, so
+sending one email only costs rendering and converting the HTML to text.
+The text of a flat page without variables or tags is converted once.
+
+Converting the static HTML around the variables once is not done:
+html2text wraps, escapes and numbers text across the variables, so the
+result would differ from html2text_fix() of the rendered email, which is
+also stored as the justification of the request.
+
+Saving or deleting a flat page bumps its cache version (see
+lowfat.models.bump_cache_version): the process that saved it drops its
+templates at once, the others within EMAIL_TEMPLATE_REVISION_TTL seconds.
+"""
+import time
+
+from html2text import html2text
+
+from django.contrib.flatpages.models import FlatPage
+from django.db.models.signals import post_delete, post_save
+from django.template import Context, Template
+from django.template.base import TextNode
+
+from .models import bump_cache_version, cache_versions
+
+#: Seconds a process trusts its templates without checking the flat page revision
+EMAIL_TEMPLATE_REVISION_TTL = 10
+
+
+def html2text_fix(html):
+    """Remove split text in blockquotes."""
+    # Workaround until https://github.com/Alir3z4/html2text/pull/179/files is merged.
+    return html2text(html).replace("\n\n>", "\n>")
+
+
+class EmailTemplate:
+    """Title, compiled HTML template and, if it is static, plain text of one flat page."""
+    def __init__(self, flatpage):
+        self.title = flatpage.title
+        self.html = Template(flatpage.content)
+        self.text = None
+        if all(isinstance(node, TextNode) for node in self.html.nodelist):
+            self.text = html2text_fix(flatpage.content)
+
+    def render(self, context):
+        """Return the HTML and plain text of the email for the dictionary context."""
+        html = self.html.render(Context(context))
+        if self.text is None:
+            return html, html2text_fix(html)
+        return html, self.text
+
+
+class EmailTemplateRegistry:
+    """EmailTemplate of each flat page URL, compiled once per revision of the flat pages."""
+    def __init__(self):
+        self.templates = {}
+        self.revision = None
+        self.checked = None
+
+    def clear(self):
+        self.templates = {}
+        self.revision = None
+        self.checked = None
+
+    def get(self, url):
+        now = time.monotonic()
+        if self.checked is None or now - self.checked > EMAIL_TEMPLATE_REVISION_TTL:
+            revision = cache_versions("flatpage")
+            if revision != self.revision:
+                self.templates = {}
+                self.revision = revision
+            self.checked = now
+
+        template = self.templates.get(url)
+        if template is None:
+            template = self.templates[url] = EmailTemplate(FlatPage.objects.get(url=url))
+        return template
+
+
+TEMPLATES = EmailTemplateRegistry()
+
+
+def email_template(url):
+    """Return the EmailTemplate of the flat page at url."""
+    return TEMPLATES.get(url)
+
+
+def clear_email_templates(sender, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save and post_delete of FlatPage."""
+    TEMPLATES.clear()
+
+
+for _signal in (post_save, post_delete):
+    _signal.connect(bump_cache_version, sender=FlatPage)
+    _signal.connect(clear_email_templates, sender=FlatPage)
@@ -5,16 +5,17 @@ from django.forms import (
     BooleanField,
     CharField,
     CheckboxInput,
-    ChoiceField,
     EmailField,
     FileField,
     Form,
+    ModelChoiceField,
     ModelForm,
     Select,
     SelectMultiple,
     Textarea,
     ValidationError,
 )
+from django.urls import reverse
 
 from datetimewidget.widgets import DateWidget
 
@@ -27,6 +28,54 @@ from .models import *
 TODAY_YEAR = datetime.now().year
 SELECT_DATE_WIDGE_YEARS = [TODAY_YEAR + delta for delta in range(-3, 4)]
 
+# Number of options rendered with the page by the autocomplete widgets,
+# the others are loaded from the autocomplete endpoints while typing.
+AUTOCOMPLETE_PRELOAD = 20
+
+
+class AutocompleteMixin:
+    """Render the selected options and the first AUTOCOMPLETE_PRELOAD ones of a model choice field.
+
+    The other options are fetched by selectize from the JSON endpoint url_name,
+    so the size of the page does not depend on the size of the queryset."""
+    def __init__(self, url_name, attrs=None):
+        super(AutocompleteMixin, self).__init__(dict(attrs or {}, **{"class": "select-autocomplete"}))
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super(AutocompleteMixin, self).get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = reverse(self.url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        queryset = field.queryset
+        records = list(queryset[:AUTOCOMPLETE_PRELOAD])
+        selected = [pk for pk in value if pk not in (None, "")]
+        if selected:
+            try:
+                records.extend(queryset.filter(pk__in=selected).exclude(pk__in=[record.pk for record in records]))
+            except (ValueError, TypeError):
+                pass
+
+        choices = self.choices
+        self.choices = ([("", field.empty_label)] if field.empty_label is not None else []) + [
+            (field.prepare_value(record), field.label_from_instance(record)) for record in records
+        ]
+        try:
+            return super(AutocompleteMixin, self).optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
+class AutocompleteSelect(AutocompleteMixin, Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, SelectMultiple):
+    pass
+
+
 class GarlicForm(ModelForm):
     not_send_email_field = BooleanField(
         widget=CheckboxInput,
@@ -311,7 +360,7 @@ class FundForm(GarlicForm):
         }
 
         widgets = {
-            'claimant': Select(attrs={"class": "select-single-item"}),
+            'claimant': AutocompleteSelect("autocomplete_claimant"),
             'category': Select(attrs={"class": "select-single-item"}),
             'focus': Select(attrs={"class": "select-single-item"}),
             'country': Select(attrs={"class": "select-single-item"}),
@@ -830,7 +879,7 @@ class ExpenseForm(GarlicForm):
         }
 
         widgets = {
-            'fund': Select(attrs={"class": "select-single-item"}),
+            'fund': AutocompleteSelect("autocomplete_fund"),
         }
 
 
@@ -893,7 +942,7 @@ class ExpenseShortlistedForm(GarlicForm):
         }
 
         widgets = {
-            'fund': Select(attrs={"class": "select-single-item"}),
+            'fund': AutocompleteSelect("autocomplete_fund"),
         }
 
 
@@ -1011,22 +1060,17 @@ class BlogForm(GarlicForm):
             }
 
         widgets = {
-            'fund': Select(attrs={"class": "select-single-item"}),
-            'coauthor': SelectMultiple(attrs={"class": "select-many-item"}),
+            'fund': AutocompleteSelect("autocomplete_fund"),
+            'coauthor': AutocompleteSelectMultiple("autocomplete_claimant"),
         }
 
 
     required_css_class = 'form-field-required'
 
-    # workaround for "no such table: lowfat_claimant"
-    try:
-        author_choices = [(this_claimant.id, this_claimant) for this_claimant in Claimant.objects.all()]
-    except:  # pylint: disable=bare-except
-        author_choices = []
-    author = ChoiceField(
-        widget=Select(attrs={"class": "select-single-item"}),
+    author = ModelChoiceField(
+        queryset=Claimant.objects.all(),
+        widget=AutocompleteSelect("autocomplete_claimant"),
         required=False,
-        choices=author_choices,
         label='Main author of draft'
     )
 
@@ -1060,11 +1104,6 @@ class BlogForm(GarlicForm):
         if user:
             self.fields['fund'].queryset = Fund.objects.filter(status__in=FUND_STATUS_APPROVED_SET)
 
-        if self.is_staff:
-            # Force staff to select one author
-            self.fields['author'].widget.choices.insert(0, ('', '---------'))
-            self.fields['author'].initial = ''
-
 
 class BlogReviewForm(GarlicForm):
     class Meta:
@@ -0,0 +1,114 @@
+"""GeoJSON of the claimants and funds with a known location."""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Claimant, Fund, MapCluster
+
+GEOJSON_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def geojson_etag():
+    """Return an ETag that changes whenever a claimant or fund is added, updated or removed."""
+    state = [
+        Claimant.objects.order_by().aggregate(Max("updated"), Count("id")),
+        Fund.objects.order_by().aggregate(Max("updated"), Count("id")),
+    ]
+    return hashlib.md5(bytes(repr(state), 'utf-8')).hexdigest()
+
+
+def geojson_features():
+    """Yield one GeoJSON feature per claimant and fund with a location."""
+    claimants = Claimant.objects.order_by().exclude(
+        home_lon=None
+    ).exclude(
+        home_lat=None
+    ).values_list("forenames", "surname", "application_year", "home_lon", "home_lat")
+    for forenames, surname, application_year, lon, lat in claimants.iterator():
+        yield {
+            "type": "Feature",
+            "properties": {
+                "marker-color": "#ebf722",
+                "marker-size": "medium",
+                "marker-symbol": "star",
+                "Name": "{} {}".format(forenames, surname),
+                "Inauguration": application_year,
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [lon, lat],
+            },
+        }
+
+    funds = Fund.objects.order_by().exclude(
+        lon=None
+    ).exclude(
+        lat=None
+    ).values_list("title", "lon", "lat")
+    for title, lon, lat in funds.iterator():
+        yield {
+            "type": "Feature",
+            "properties": {
+                "marker-color": "#7e7e7e",
+                "marker-size": "medium",
+                "marker-symbol": "",
+                "Fund": title,
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [lon, lat],
+            },
+        }
+
+
+def stream_geojson():
+    """Yield the FeatureCollection as JSON, one feature at a time."""
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = "\n"
+    for feature in geojson_features():
+        yield separator + json.dumps(feature)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+def cache_stream(key, chunks):
+    """Yield chunks and store their concatenation under key once all of them were sent."""
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    cache.set(key, "".join(sent), GEOJSON_CACHE_TIMEOUT)
+
+
+def map_points():
+    """Yield the (kind, lat, lon) of every claimant and fund with a location, see MapCluster.rebuild."""
+    claimants = Claimant.objects.order_by().exclude(home_lat=None).exclude(home_lon=None)
+    for lat, lon in claimants.values_list("home_lat", "home_lon").iterator():
+        yield "claimants", lat, lon
+
+    funds = Fund.objects.order_by().exclude(lat=None).exclude(lon=None)
+    for lat, lon in funds.values_list("lat", "lon").iterator():
+        yield "funds", lat, lon
+
+
+def map_tile(zoom, tile_x, tile_y):
+    """Return the GeoJSON of the clusters in one map tile."""
+    features = []
+    for cluster in MapCluster.objects.filter(zoom=zoom, tile_x=tile_x, tile_y=tile_y).order_by("cell_y", "cell_x"):
+        lat, lon = cluster.centre()
+        features.append({
+            "type": "Feature",
+            "properties": {
+                "count": cluster.claimants + cluster.funds,
+                "claimants": cluster.claimants,
+                "funds": cluster.funds,
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [lon, lat],
+            },
+        })
+
+    return json.dumps({"type": "FeatureCollection", "features": features})
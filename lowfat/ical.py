@@ -0,0 +1,78 @@
+"""ICS calendar of the funds shared in the calendar.
+
+Each event is rendered once and cached until its fund or claimant changes,
+so the shared feed and the feed of each claimant are assembled from the
+same fragments.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+
+from .models import Fund
+
+ICAL_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def calendar_funds(claimant_id=None):
+    """Return the funds included in the calendar, optionally only the ones of one claimant."""
+    funds = Fund.objects.filter(
+        can_be_advertise_after=True,
+        can_be_included_in_calendar=True,
+    )
+    if claimant_id is not None:
+        funds = funds.filter(claimant_id=claimant_id)
+    return funds
+
+
+def calendar_state(claimant_id=None):
+    """Return the (etag, last modified) of the calendar.
+
+    Both change whenever one of its funds, or their claimant, is added,
+    updated or removed."""
+    state = calendar_funds(claimant_id).order_by().aggregate(
+        Max("updated"),
+        Max("claimant__updated"),
+        Count("id")
+    )
+    etag = hashlib.md5(bytes(repr((claimant_id, state)), 'utf-8')).hexdigest()
+    last_modified = max(
+        [value for key, value in state.items() if key != "id__count" and value is not None],
+        default=None
+    )
+    return etag, last_modified
+
+
+def event_key(fund):
+    return "lowfat.ical.event.{}.{}.{}".format(
+        fund.id,
+        fund.updated.timestamp(),
+        fund.claimant.updated.timestamp()
+    )
+
+
+def render_events(funds):
+    """Return the VEVENT of each fund, rendering only the ones missing from the cache."""
+    keys = [(fund, event_key(fund)) for fund in funds]
+    events = cache.get_many([key for _, key in keys])
+    missing = {
+        key: render_to_string('lowfat/ical_event.html', {'fund': fund})
+        for fund, key in keys
+        if key not in events
+    }
+    if missing:
+        cache.set_many(missing, ICAL_CACHE_TIMEOUT)
+        events.update(missing)
+    return [events[key] for _, key in keys]
+
+
+def render_calendar(etag, claimant_id=None):
+    """Return the ICS of the calendar, from the cache when its etag did not change."""
+    key = "lowfat.ical.{}".format(etag)
+    body = cache.get(key)
+    if body is None:
+        funds = calendar_funds(claimant_id).select_related("claimant")
+        body = render_to_string('lowfat/ical.html', {'events': render_events(funds)})
+        cache.set(key, body, ICAL_CACHE_TIMEOUT)
+    return body
@@ -6,10 +6,12 @@ from django_extensions.management.jobs import DailyJob
 
 from ...models import Fund, Expense, Blog
 from ...mail import staff_reminder, staff_follow_up
+from ...metrics import timed
 
 class Job(DailyJob):
     help = "Reminder staffs to review one request."
 
+    @timed("lowfat_job_duration_seconds", job="reminder")
     def execute(self):
         print("""Running {}
 
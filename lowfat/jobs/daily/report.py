@@ -6,9 +6,12 @@ import nbformat
 from nbconvert.preprocessors import ExecutePreprocessor
 from nbconvert import HTMLExporter
 
+from ...metrics import timed
+
 class Job(DailyJob):
     help = "Convert Jupyter Notebook in lowfat/reports to HTML page in lowfat/reports/html."
 
+    @timed("lowfat_job_duration_seconds", job="report")
     def execute(self):
         print("Cleaning lowfat/reports/html ...")
         old_reports = os.listdir("lowfat/reports/html")
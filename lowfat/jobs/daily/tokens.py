@@ -0,0 +1,12 @@
+from django_extensions.management.jobs import DailyJob
+
+from ...metrics import timed
+from ...models import AccessToken
+
+class Job(DailyJob):
+    help = "Purge the expired access tokens of the public links."
+
+    @timed("lowfat_job_duration_seconds", job="tokens")
+    def execute(self):
+        deleted, _ = AccessToken.objects.expired().delete()
+        print("Purged {} expired access tokens.".format(deleted))
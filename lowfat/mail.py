@@ -5,68 +5,105 @@ import ast
 
 from constance import config
 
-from html2text import html2text
-
-from django.contrib.flatpages.models import FlatPage
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMultiAlternatives
-from django.template import Context, Template
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
 
+from .email_templates import email_template
+from .metrics import increment, timer
 from .models import *
-from .settings import DEFAULT_FROM_EMAIL, SITE_ID
-
-def html2text_fix(html):
-    """Remove split text in blockquotes."""
-    # Workaround until https://github.com/Alir3z4/html2text/pull/179/files is merged.
-    return html2text(html).replace("\n\n>", "\n>")
-
-def mail_staffs(subject, message, fail_silently=False, connection=None, html_message=None):
-    """Overwrite of Django mail_staffs()"""
+from .settings import DEFAULT_FROM_EMAIL
+
+def send_message(msg, recipient, fail_silently=False):
+    """Send msg, recording its duration and outcome in lowfat.metrics."""
+    try:
+        with timer("lowfat_mail_duration_seconds", recipient=recipient):
+            sent = msg.send(fail_silently=fail_silently)
+    except Exception:
+        increment("lowfat_mail_total", recipient=recipient, result="failed")
+        raise
+    increment("lowfat_mail_total", recipient=recipient, result="sent" if sent else "failed")
+    return sent
+
+def queue_message(msg, recipient):
+    """Store msg in the outbox, to be sent by send_outbox()."""
+    outbox_message = OutboxMessage.from_message(msg, recipient)
+    outbox_message.save()
+    return outbox_message
+
+def send_outbox(batch_size=50):
+    """Send the messages of the outbox that are due, return the number sent and failed."""
+    now = timezone.now()
+    messages = OutboxMessage.claim(batch_size, now)
+    if not messages:
+        return 0, 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exception:  # pylint: disable=broad-except
+        for message in messages:
+            message.mark_failed(exception, now)
+        return 0, len(messages)
+
+    sent = 0
+    try:
+        for message in messages:
+            try:
+                if not send_message(message.message(connection), message.recipient):
+                    raise ValueError("The email backend did not send the message.")
+            except Exception as exception:  # pylint: disable=broad-except
+                message.mark_failed(exception, now)
+            else:
+                message.mark_sent(now)
+                sent += 1
+    finally:
+        connection.close()
+
+    return sent, len(messages) - sent
+
+def mail_staffs(subject, message, html_message=None):
+    """Overwrite of Django mail_staffs(), the email is queued in the outbox.
+
+    Errors of the mail server are handled by send_outbox(), so there is no
+    fail_silently or connection."""
     msg = EmailMultiAlternatives(
         subject,
         message,
         DEFAULT_FROM_EMAIL,
         ast.literal_eval(config.STAFFS_EMAIL),
-        connection=connection,
         reply_to=[config.FELLOWS_MANAGEMENT_EMAIL]
     )
     msg.attach_alternative(html_message, "text/html")
-    msg.send(fail_silently=fail_silently)
+    queue_message(msg, "staff")
 
 def new_notification(staff_url, email_url, user_email, context, mail):
     if config.STAFF_EMAIL_NOTIFICATION:
         # Email to staff
         context.update({
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         })
 
-        flatemail = FlatPage.objects.get(url=staff_url)
-        template = Template(flatemail.content)
-        jinja_context = Context(context)
-        html = template.render(jinja_context)
-        plain_text = html2text_fix(html)
+        flatemail = email_template(staff_url)
+        html, plain_text = flatemail.render(context)
         mail_staffs(
             flatemail.title,
             plain_text,
-            html_message=html,
-            fail_silently=False
+            html_message=html
         )
 
     if config.CLAIMANT_EMAIL_NOTIFICATION:
         # Email to claimant
         context.update({
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         })
 
-        flatemail = FlatPage.objects.get(url=email_url)
-        template = Template(flatemail.content)
-        jinja_context = Context(context)
-        html = template.render(jinja_context)
-        plain_text = html2text_fix(html)
+        flatemail = email_template(email_url)
+        html, plain_text = flatemail.render(context)
         msg = EmailMultiAlternatives(
             flatemail.title,
             plain_text,
@@ -75,7 +112,7 @@ def new_notification(staff_url, email_url, user_email, context, mail):
             reply_to=[config.FELLOWS_MANAGEMENT_EMAIL]
         )
         msg.attach_alternative(html, "text/html")
-        msg.send(fail_silently=False)
+        queue_message(msg, "claimant")
         mail.justification = plain_text
         mail.save()
 
@@ -140,17 +177,14 @@ def review_notification(email_url, user_email, context, mail, copy_to_staffs=Fal
     """Compose the message and send the email."""
     if config.CLAIMANT_EMAIL_NOTIFICATION and email_url is not None:
         # Generate message
-        flatemail = FlatPage.objects.get(url=email_url)
-        template = Template(flatemail.content)
+        flatemail = email_template(email_url)
         context.update({
             "notes": mail.justification,
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         })
-        context = Context(context)
-        html = template.render(context)
-        plain_text = html2text_fix(html)
+        html, plain_text = flatemail.render(context)
         mail.justification = plain_text
 
         # Email to claimant
@@ -164,7 +198,7 @@ def review_notification(email_url, user_email, context, mail, copy_to_staffs=Fal
             reply_to=[config.FELLOWS_MANAGEMENT_EMAIL]
         )
         msg.attach_alternative(html, "text/html")
-        msg.send(fail_silently=False)
+        queue_message(msg, "claimant")
         # Every email is archived in the database
         mail.save()
 
@@ -261,20 +295,16 @@ def staff_reminder(request):  # pylint: disable=invalid-name
         context = {
             request_type: request,
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         }
 
-        flatemail = FlatPage.objects.get(url=staff_url)
-        template = Template(flatemail.content)
-        jinja_context = Context(context)
-        html = template.render(jinja_context)
-        plain_text = html2text_fix(html)
+        flatemail = email_template(staff_url)
+        html, plain_text = flatemail.render(context)
         mail_staffs(
             flatemail.title,
             plain_text,
-            html_message=html,
-            fail_silently=False
+            html_message=html
         )
 
 def staff_follow_up(requests):  # pylint: disable=invalid-name
@@ -286,20 +316,16 @@ def staff_follow_up(requests):  # pylint: disable=invalid-name
             "expenses": requests[1],
             "blogs": requests[2],
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         }
 
-        flatemail = FlatPage.objects.get(url=staff_url)
-        template = Template(flatemail.content)
-        jinja_context = Context(context)
-        html = template.render(jinja_context)
-        plain_text = html2text_fix(html)
+        flatemail = email_template(staff_url)
+        html, plain_text = flatemail.render(context)
         mail_staffs(
             flatemail.title,
             plain_text,
-            html_message=html,
-            fail_silently=False
+            html_message=html
         )
 
 def claimant_profile_update_notification(claimant):  # pylint: disable=invalid-name
@@ -309,18 +335,14 @@ def claimant_profile_update_notification(claimant):  # pylint: disable=invalid-n
         context = {
             "claimant": claimant,
             "protocol": "https",
-            "site": Site.objects.get(id=SITE_ID),
+            "site": Site.objects.get_current(),
             "FELLOWS_MANAGEMENT_EMAIL": config.FELLOWS_MANAGEMENT_EMAIL,
         }
 
-        flatemail = FlatPage.objects.get(url=staff_url)
-        template = Template(flatemail.content)
-        jinja_context = Context(context)
-        html = template.render(jinja_context)
-        plain_text = html2text_fix(html)
+        flatemail = email_template(staff_url)
+        html, plain_text = flatemail.render(context)
         mail_staffs(
             flatemail.title,
             plain_text,
-            html_message=html,
-            fail_silently=False
+            html_message=html
         )
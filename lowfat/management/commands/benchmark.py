@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lowfat.benchmarks import BENCHMARK_TOLERANCE, BenchmarkError, compare, run_benchmarks
+
+class Command(BaseCommand):
+    help = "Measure the time and queries of the main views and model methods, see lowfat.benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs of each benchmark, the median time is reported"
+        )
+        parser.add_argument(
+            "--output",
+            help="Write the results as JSON to this file, e.g. to be used as baseline later"
+        )
+        parser.add_argument(
+            "--compare",
+            help="JSON file of a previous run, fail if any benchmark regressed"
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=BENCHMARK_TOLERANCE,
+            help="Relative slowdown over the baseline reported as regression"
+        )
+        parser.add_argument(
+            "name",
+            nargs="*",
+            help="Benchmarks to run, by default all of them"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            report = run_benchmarks(options["repeat"], options["name"])
+        except BenchmarkError as exception:
+            raise CommandError(str(exception))
+
+        print("{:30} {:>10} {:>10}".format("Benchmark", "Time (ms)", "Queries"))
+        for name, result in report["results"].items():
+            print("{:30} {:10.2f} {:10}".format(name, result["time_ms"], result["queries"]))
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+
+        if options["compare"]:
+            with open(options["compare"]) as baseline:
+                regressions = compare(report, json.load(baseline), options["tolerance"])
+            for regression in regressions:
+                print("Regression of {}".format(regression))
+            if regressions:
+                raise CommandError("{} benchmarks regressed.".format(len(regressions)))
+            print("No regression.")
@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve
+
+from lowfat.models import Claimant
+
+class Command(BaseCommand):
+    help = "Measure the latency of the public pages with an empty (miss) and a warm (hit) page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Number of requests measured per page and case"
+        )
+        parser.add_argument(
+            "path",
+            nargs="*",
+            help="Pages to measure, by default the index, the previous events and one fellow"
+        )
+
+    @staticmethod
+    def request(path):
+        """Return the time in milliseconds taken by an anonymous request of path."""
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        match = resolve(path)
+
+        start = time.perf_counter()
+        match.func(request, *match.args, **match.kwargs)
+        return (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **options):
+        paths = options["path"]
+        if not paths:
+            paths = ["/", "/fund/previous/"]
+            fellow = Claimant.objects.filter(fellow=True).exclude(slug="").first()
+            if fellow is not None:
+                paths.append("/fellow/{}/".format(fellow.slug))
+
+        print("{:40} {:>10} {:>10}".format("Page", "Miss (ms)", "Hit (ms)"))
+        for path in paths:
+            misses = []
+            hits = []
+            for _ in range(options["repeat"]):
+                cache.clear()
+                misses.append(self.request(path))
+                hits.append(self.request(path))
+            print("{:40} {:10.2f} {:10.2f}".format(
+                path,
+                statistics.median(misses),
+                statistics.median(hits)
+            ))
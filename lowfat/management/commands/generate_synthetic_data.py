@@ -0,0 +1,401 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import itertools
+import random
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.text import slugify
+
+from lowfat.geo import map_points
+from lowfat.jacs import JACS_3_0_PRINCIPAL_SUBJECT_CODES
+from lowfat.models import (
+    CACHE_VERSIONED_MODELS, FUND_STATUS_APPROVED_SET, GRANTS, MODELS_WITH_TOKEN, AccessToken, Blog, BlogSentMail,
+    Claimant, Expense, ExpenseSentMail, Fund, FundSentMail, GeneralSentMail, MapCluster, bump_cache_version
+)
+from lowfat.search import rebuild_index
+
+FORENAMES = (
+    "Ada", "Alan", "Amina", "Anne", "Chen", "Dafydd", "Emma", "Fatima", "Grace", "Hamish",
+    "Ines", "James", "Kofi", "Laura", "Mei", "Niamh", "Olu", "Priya", "Rhys", "Sofia",
+)
+
+SURNAMES = (
+    "Babbage", "Brown", "Davies", "Evans", "Hopper", "Jones", "Khan", "Lovelace", "Macleod", "Murphy",
+    "Nakamura", "Okafor", "Patel", "Roberts", "Smith", "Taylor", "Turing", "Walker", "Williams", "Wilson",
+)
+
+#: City, country, latitude and longitude of the claimants and events
+CITIES = (
+    ("London", "GB", 51.507, -0.128),
+    ("Edinburgh", "GB", 55.953, -3.188),
+    ("Manchester", "GB", 53.481, -2.243),
+    ("Southampton", "GB", 50.910, -1.404),
+    ("Oxford", "GB", 51.752, -1.258),
+    ("Cardiff", "GB", 51.481, -3.179),
+    ("Belfast", "GB", 54.597, -5.930),
+    ("Glasgow", "GB", 55.864, -4.252),
+    ("Berlin", "DE", 52.520, 13.405),
+    ("Austin", "US", 30.267, -97.743),
+)
+
+AFFILIATIONS = (
+    "University of Edinburgh",
+    "University of Manchester",
+    "University of Oxford",
+    "University of Southampton",
+    "Cardiff University",
+    "Queen's University Belfast",
+)
+
+EVENTS = (
+    "Research Software Engineering Conference",
+    "Software Carpentry Workshop",
+    "Collaborations Workshop",
+    "PyCon UK",
+    "Hackathon on Reproducible Research",
+    "Data Carpentry Workshop",
+)
+
+#: Relative frequency of each status, close to the ones of the production database
+FUND_STATUS_WEIGHTS = {"U": 5, "P": 4, "A": 40, "M": 8, "R": 6, "F": 30, "C": 5, "X": 2}
+EXPENSE_STATUS_WEIGHTS = {"S": 10, "C": 8, "A": 72, "R": 6, "X": 4}
+BLOG_STATUS_WEIGHTS = {"U": 8, "R": 6, "C": 4, "G": 3, "L": 3, "P": 60, "M": 2, "D": 5, "O": 7, "X": 2}
+
+#: Fraction of the funds, expenses and blog posts shared with an access token
+ACCESS_TOKEN_FRACTION = 0.1
+
+#: Smallest valid PDF, shared by every synthetic expense
+PLACEHOLDER_NAME = "expenses/synthetic.pdf"
+PLACEHOLDER_PDF = b"""%PDF-1.4
+1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj
+2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj
+3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >> endobj
+trailer << /Root 1 0 R >>
+%%EOF
+"""
+
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def money(rng, maximum):
+    return Decimal(rng.randint(0, int(maximum * 100))) / 100
+
+
+def first_free_id(model):
+    return (model.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+
+def midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+class Command(BaseCommand):
+    help = "Create random claimants, funds, expenses, blog posts, history and sent emails for load tests."
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self.options = {}
+        self.rng = random.Random()
+        self.claim = PLACEHOLDER_NAME
+        self.ids = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--claimants",
+            type=int,
+            default=1000,
+            help="Number of claimants created"
+        )
+        parser.add_argument(
+            "--funds",
+            type=int,
+            default=5,
+            help="Average number of funds per claimant"
+        )
+        parser.add_argument(
+            "--expenses",
+            type=int,
+            default=2,
+            help="Average number of expenses per fund"
+        )
+        parser.add_argument(
+            "--blogs",
+            type=int,
+            default=1,
+            help="Average number of blog posts per fund"
+        )
+        parser.add_argument(
+            "--mails",
+            type=int,
+            default=2,
+            help="Average number of sent emails per fund"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of claimants, with their records, inserted per transaction"
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed of the random generator, to create the same data again"
+        )
+        parser.add_argument(
+            "--no-history",
+            action="store_true",
+            help="Do not create the history rows"
+        )
+
+    def count(self, average):
+        """Return a random number of children whose mean is average."""
+        return self.rng.randint(0, 2 * average)
+
+    def random_date(self, start, days):
+        return start + timedelta(days=self.rng.randint(0, days))
+
+    def share(self, record):
+        """Give some records an access token, as ModelWithToken.new_access_token does."""
+        if self.rng.random() < ACCESS_TOKEN_FRACTION:
+            record.access_token = "{:032x}".format(self.rng.getrandbits(128))
+            record.access_token_expire_date = self.random_date(date.today() - timedelta(days=30), 60)
+
+    def make_claimant(self):
+        rng = self.rng
+        claimant_id = next(self.ids[Claimant])
+        forenames = rng.choice(FORENAMES)
+        surname = rng.choice(SURNAMES)
+        city, country, lat, lon = rng.choice(CITIES)
+        located = rng.random() < 0.9
+        application_year = rng.randint(2012, date.today().year)
+        fellow = rng.random() < 0.4
+        claimant = Claimant(
+            id=claimant_id,
+            forenames=forenames,
+            surname=surname,
+            email="{}.{}.{}@example.com".format(forenames, surname, claimant_id).lower(),
+            phone="0",
+            gender=rng.choice("MFOR"),
+            home_country=country,
+            home_city=city,
+            home_lat=lat + rng.uniform(-0.2, 0.2) if located else None,
+            home_lon=lon + rng.uniform(-0.2, 0.2) if located else None,
+            career_stage_when_apply=rng.choice("1234"),
+            research_area="Research software in {}".format(city),
+            research_area_code=rng.choice(JACS_3_0_PRINCIPAL_SUBJECT_CODES)[0],
+            affiliation=rng.choice(AFFILIATIONS),
+            work_description="Synthetic claimant {}".format(claimant_id),
+            slug=slugify("{}-{}-{}".format(forenames, surname, claimant_id)),
+            application_year=application_year,
+            inauguration_grant_expiration=date(application_year + 2, 3, 31),
+            fellow=fellow,
+            collaborator=not fellow and rng.random() < 0.3,
+            claimantship_grant=3000 if fellow else 0,
+        )
+        claimant._history_date = datetime(application_year, 1, 1)  # pylint: disable=protected-access
+        return claimant
+
+    def make_fund(self, claimant):
+        rng = self.rng
+        fund_id = next(self.ids[Fund])
+        city, country, lat, lon = rng.choice(CITIES)
+        located = rng.random() < 0.8
+        start_date = self.random_date(date(claimant.application_year, 1, 1), 3 * 365)
+        mandatory = rng.random() < 0.1
+        fund = Fund(
+            id=fund_id,
+            claimant=claimant,
+            category=rng.choice("AH"),
+            focus=rng.choice("DC"),
+            mandatory=mandatory,
+            title="{} {}".format(rng.choice(EVENTS), start_date.year),
+            url="https://example.com/events/{}".format(fund_id),
+            country=country,
+            city=city,
+            lat=lat if located else None,
+            lon=lon if located else None,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=rng.randint(0, 4)),
+            budget_request_travel=money(rng, 500),
+            budget_request_attendance_fees=money(rng, 300),
+            budget_request_subsistence_cost=money(rng, 200),
+            justification="Synthetic fund {}".format(fund_id),
+            success_targeted="Present the work of the fellow.",
+            can_be_included_in_calendar=rng.random() < 0.7,
+            status=weighted(rng, FUND_STATUS_WEIGHTS),
+            required_blog_posts=0 if mandatory else 1,
+            grant_heading=rng.choice("CIF"),
+            grant=rng.choice(GRANTS)[0],
+            expenses_claimed_total=Decimal(0),
+            expenses_authorized_total=Decimal(0),
+        )
+        fund.budget_request_total = fund.budget_total()
+        fund.budget_approved = fund.budget_request_total
+        if fund.status in FUND_STATUS_APPROVED_SET:
+            fund.approved = midnight(start_date - timedelta(days=30))
+        fund._history_date = midnight(start_date - timedelta(days=45))  # pylint: disable=protected-access
+        self.share(fund)
+        return fund
+
+    def make_expense(self, fund):
+        rng = self.rng
+        expense_id = next(self.ids[Expense])
+        fund.last_expense_number += 1
+        status = weighted(rng, EXPENSE_STATUS_WEIGHTS)
+        amount_claimed = money(rng, float(fund.budget_request_total) / 2)
+        expense = Expense(
+            id=expense_id,
+            fund=fund,
+            relative_number=fund.last_expense_number,
+            claim=self.claim,
+            amount_claimed=amount_claimed,
+            status=status,
+            amount_authorized_for_payment=amount_claimed if status == "A" else 0,
+            grant_heading="I" if fund.mandatory else fund.grant_heading,
+            grant=fund.grant,
+        )
+        expense._history_date = midnight(fund.end_date + timedelta(days=7))  # pylint: disable=protected-access
+        self.share(expense)
+        return expense
+
+    def make_blog(self, fund):
+        rng = self.rng
+        blog_id = next(self.ids[Blog])
+        status = weighted(rng, BLOG_STATUS_WEIGHTS)
+        blog = Blog(
+            id=blog_id,
+            fund=fund,
+            author=fund.claimant,
+            draft_url="https://docs.google.com/document/d/{}".format(blog_id),
+            final=status != "U",
+            status=status,
+            title="What I learned at {}".format(fund.title),
+            published_url="https://www.software.ac.uk/blog/{}".format(blog_id) if status == "P" else None,
+        )
+        blog._history_date = midnight(fund.end_date + timedelta(days=14))  # pylint: disable=protected-access
+        self.share(blog)
+        return blog
+
+    def make_mail(self, fund, expenses, blogs):
+        """Return an email about fund or one of its expenses or blog posts."""
+        mail_id = next(self.ids[GeneralSentMail])
+        mail = GeneralSentMail(
+            id=mail_id,
+            justification="Synthetic email {} about {}".format(mail_id, fund.title),
+            receiver=fund.claimant,
+            date=self.random_date(fund.start_date - timedelta(days=60), 120),
+        )
+        mail._history_date = midnight(mail.date)  # pylint: disable=protected-access
+        mail.subject = self.rng.choice(
+            [(FundSentMail, fund.id)] +
+            [(ExpenseSentMail, expense.id) for expense in expenses] +
+            [(BlogSentMail, blog.id) for blog in blogs]
+        )
+        return mail
+
+    def make_records(self, claimants):
+        """Return the claimants, funds, expenses, blog posts and emails of one batch."""
+        records = {model: [] for model in self.ids}
+        for _ in range(claimants):
+            claimant = self.make_claimant()
+            records[Claimant].append(claimant)
+            for _ in range(self.count(self.options["funds"])):
+                fund = self.make_fund(claimant)
+                expenses = [self.make_expense(fund) for _ in range(self.count(self.options["expenses"]))]
+                blogs = [self.make_blog(fund) for _ in range(self.count(self.options["blogs"]))]
+                records[Fund].append(fund)
+                records[Expense].extend(expenses)
+                records[Blog].extend(blogs)
+                records[GeneralSentMail].extend(
+                    self.make_mail(fund, expenses, blogs) for _ in range(self.count(self.options["mails"]))
+                )
+
+        return records
+
+    def insert(self, records):
+        """Insert the records of one batch, a dictionary of lists by model."""
+        # The totals of Fund are maintained by the signals of Expense and Blog, not sent by bulk_create.
+        funds = {fund.id: fund for fund in records[Fund]}
+        for record in records[Expense] + records[Blog]:
+            fund = funds[record.fund_id]
+            for field, value in record.fund_totals().items():
+                setattr(fund, field, getattr(fund, field) + value)
+
+        # bulk_create picks the largest batches the database accepts.
+        with transaction.atomic():
+            for model, instances in records.items():
+                model.objects.bulk_create(instances)
+                if not self.options["no_history"]:
+                    model.history.bulk_history_create(instances)
+
+            self.insert_mail_subjects(records[GeneralSentMail])
+
+    @staticmethod
+    def insert_mail_subjects(mails):
+        """Attach each email to its fund, expense or blog post.
+
+        bulk_create does not support multi-table inheritance so the rows of
+        the child tables are inserted directly.
+        """
+        rows = {FundSentMail: [], ExpenseSentMail: [], BlogSentMail: []}
+        for mail in mails:
+            model, subject_id = mail.subject
+            rows[model].append((mail.id, subject_id))
+
+        with connection.cursor() as cursor:
+            for model, values in rows.items():
+                if not values:
+                    continue
+                opts = model._meta  # pylint: disable=protected-access
+                subject = opts.get_field(opts.model_name[:-len("sentmail")])
+                cursor.executemany(
+                    "INSERT INTO {} ({}, {}) VALUES (%s, %s)".format(
+                        connection.ops.quote_name(opts.db_table),
+                        connection.ops.quote_name(opts.parents[GeneralSentMail].column),
+                        connection.ops.quote_name(subject.column)
+                    ),
+                    values
+                )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.claim = PLACEHOLDER_NAME
+        if not default_storage.exists(PLACEHOLDER_NAME):
+            default_storage.save(PLACEHOLDER_NAME, ContentFile(PLACEHOLDER_PDF))
+        self.ids = {
+            model: itertools.count(first_free_id(model))
+            for model in (Claimant, Fund, Expense, Blog, GeneralSentMail)
+        }
+
+        created = {model: 0 for model in self.ids}
+        for start in range(0, options["claimants"], options["batch_size"]):
+            records = self.make_records(min(options["batch_size"], options["claimants"] - start))
+            self.insert(records)
+            for model, instances in records.items():
+                created[model] += len(instances)
+            print("Created {} of {} claimants.".format(created[Claimant], options["claimants"]))
+
+        # bulk_create does not call save() or send signals, so rebuild what they maintain.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(self.ids)):
+                cursor.execute(sql)
+        with transaction.atomic():
+            rebuild_index()
+            AccessToken.rebuild(MODELS_WITH_TOKEN)
+        MapCluster.rebuild(map_points())
+        for model in CACHE_VERSIONED_MODELS:
+            bump_cache_version(model)
+
+        print("Created {}.".format(", ".join(
+            "{} {}".format(count, model._meta.verbose_name_plural)  # pylint: disable=protected-access
+            for model, count in created.items()
+        )))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from lowfat.models import Claimant
+from lowfat.thumbnails import make_thumbnails
+
+class Command(BaseCommand):
+    help = "Create the thumbnails of the photos uploaded before they were created on upload."
+
+    def handle(self, *args, **options):
+        claimants = Claimant.objects.exclude(photo="").exclude(photo=None)
+        for claimant in claimants.iterator():
+            make_thumbnails(claimant.photo)
+        print("Created thumbnails of {} photos.".format(claimants.count()))
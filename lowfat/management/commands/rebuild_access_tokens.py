@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lowfat.models import MODELS_WITH_TOKEN, AccessToken
+
+class Command(BaseCommand):
+    help = "Rebuild the index of the access tokens used by the public links of funds, expenses and blog posts."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = AccessToken.rebuild(MODELS_WITH_TOKEN)
+        print("Indexed {} access tokens.".format(count))
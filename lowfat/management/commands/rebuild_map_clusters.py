@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lowfat.geo import map_points
+from lowfat.models import MapCluster
+
+class Command(BaseCommand):
+    help = "Rebuild the map clusters from the location of claimants and funds."
+
+    def handle(self, *args, **options):
+        MapCluster.rebuild(map_points())
+        print("Rebuilt {} map clusters.".format(MapCluster.objects.count()))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lowfat.search import INDEXES, is_enabled, rebuild_index
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search index of claimants, funds and blog posts."
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            print("Full text search is only available with SQLite.")
+            return
+
+        with transaction.atomic():
+            rebuild_index()
+
+        print("Rebuilt {}.".format(", ".join(search_index.table for search_index in INDEXES.values())))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from lowfat.models import FUND_DENORMALISED_FIELDS, Fund, fund_totals_annotations
+
+class Command(BaseCommand):
+    help = "Verify the totals stored in Fund against its expenses and blog posts and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report the funds with drift, without repairing them."
+        )
+
+    def handle(self, *args, **options):
+        expected_fields = ["expected_{}".format(field) for field in FUND_DENORMALISED_FIELDS]
+        funds = Fund.objects.order_by().annotate(
+            **fund_totals_annotations()
+        ).values_list("id", *(FUND_DENORMALISED_FIELDS + tuple(expected_fields)))
+
+        drifted = {}
+        for row in funds.iterator():
+            fund_id = row[0]
+            stored = row[1:len(FUND_DENORMALISED_FIELDS) + 1]
+            expected = row[len(FUND_DENORMALISED_FIELDS) + 1:]
+            changes = {
+                field: expected_value
+                for field, stored_value, expected_value in zip(FUND_DENORMALISED_FIELDS, stored, expected)
+                if stored_value != expected_value
+            }
+            if changes:
+                print("Fund {} has drifted: {}".format(
+                    fund_id,
+                    ", ".join(
+                        "{} {} != {}".format(field, stored_value, expected_value)
+                        for field, stored_value, expected_value in zip(FUND_DENORMALISED_FIELDS, stored, expected)
+                        if field in changes
+                    )
+                ))
+                drifted[fund_id] = changes
+
+        if options["check"]:
+            if drifted:
+                raise CommandError("{} funds have drifted.".format(len(drifted)))
+            print("All fund totals are correct.")
+            return
+
+        with transaction.atomic():
+            for fund_id, changes in drifted.items():
+                Fund.objects.filter(pk=fund_id).update(**changes)
+
+        print("Repaired {} funds.".format(len(drifted)))
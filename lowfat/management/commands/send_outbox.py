@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lowfat.mail import send_outbox
+
+class Command(BaseCommand):
+    help = "Send the emails queued in the outbox, retrying the failed ones with exponential backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of emails sent with one connection to the email server"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, e.g. as a service, instead of stopping once the outbox is empty"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10,
+            help="Seconds to wait when the outbox is empty, with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_outbox(options["batch_size"])
+            if sent or failed:
+                print("Sent {} emails, {} failed.".format(sent, failed))
+            elif options["loop"]:
+                time.sleep(options["interval"])
+            else:
+                break
@@ -0,0 +1,187 @@
+"""Latency histograms and counters exposed in the Prometheus text format.
+
+The samples are kept in the SQLite database METRICS_DATABASE so the
+endpoint reports the sum of every process serving lowFAT. Recording a
+sample never fails the caller: errors of the store are only logged.
+"""
+import bisect
+from collections import defaultdict
+import contextlib
+import functools
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+#: Upper bounds in seconds of the buckets of the histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+#: Type and description of every metric
+METRICS = {
+    "lowfat_request_duration_seconds": ("histogram", "Time to answer a request by URL name."),
+    "lowfat_responses_total": ("counter", "Responses by URL name and status code."),
+    "lowfat_mail_duration_seconds": ("histogram", "Time to send one email."),
+    "lowfat_mail_total": ("counter", "Emails sent or failed."),
+    "lowfat_geocode_duration_seconds": ("histogram", "Time of one geocoding call to Nominatim."),
+    "lowfat_validator_duration_seconds": ("histogram", "Time of one validator of lowfat.validator."),
+    "lowfat_job_duration_seconds": ("histogram", "Time to run one of the periodic jobs."),
+}
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS metric (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, bucket)
+)"""
+
+UPSERT = """INSERT INTO metric (name, labels, bucket, value) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name, labels, bucket) DO UPDATE SET value = value + excluded.value"""
+
+_local = threading.local()  # pylint: disable=invalid-name
+
+
+def is_enabled():
+    return bool(settings.METRICS_DATABASE)
+
+
+def _connection():
+    """Return the connection of this thread to the store, SQLite connections can not be shared."""
+    if getattr(_local, "database", None) != settings.METRICS_DATABASE:
+        _local.connection = sqlite3.connect(settings.METRICS_DATABASE, timeout=5, isolation_level=None)
+        _local.connection.execute(SCHEMA)
+        _local.database = settings.METRICS_DATABASE
+    return _local.connection
+
+
+def format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in sorted(labels.items())
+    )
+
+
+def _record(rows):
+    if not is_enabled():
+        return
+
+    try:
+        connection = _connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(UPSERT, rows)
+    except sqlite3.Error as exception:
+        logger.warning("Can not record metrics: %s", exception)
+
+
+def _counter_rows(name, amount, labels):
+    return [(name, format_labels(labels), "", amount)]
+
+
+def _histogram_rows(name, value, labels):
+    index = bisect.bisect_left(LATENCY_BUCKETS, value)
+    bucket = repr(LATENCY_BUCKETS[index]) if index < len(LATENCY_BUCKETS) else "+Inf"
+    labels = format_labels(labels)
+    return [
+        (name, labels, bucket, 1),
+        (name, labels, "sum", value),
+    ]
+
+
+def increment(name, amount=1, **labels):
+    """Add amount to a counter."""
+    _record(_counter_rows(name, amount, labels))
+
+
+def observe(name, value, **labels):
+    """Add one sample of value to a histogram."""
+    _record(_histogram_rows(name, value, labels))
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Observe the time taken by the block in the histogram name, even when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator observing the time taken by each call in the histogram name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
+
+
+def clear():
+    if is_enabled():
+        with _connection() as connection:
+            connection.execute("DELETE FROM metric")
+
+
+def exposition():
+    """Return every metric in the Prometheus text format."""
+    samples = defaultdict(lambda: defaultdict(dict))
+    if is_enabled():
+        for name, labels, bucket, value in _connection().execute("SELECT name, labels, bucket, value FROM metric"):
+            samples[name][labels][bucket] = value
+
+    lines = []
+    for name in sorted(samples):
+        kind, description = METRICS.get(name, ("untyped", ""))
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, values in sorted(samples[name].items()):
+            braces = "{{{}}}".format(labels) if labels else ""
+            if kind != "histogram":
+                lines.append("{}{} {:g}".format(name, braces, values.get("", 0)))
+                continue
+
+            cumulative = 0
+            for bound in [repr(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]:
+                cumulative += values.get(bound, 0)
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                    name,
+                    labels + "," if labels else "",
+                    bound,
+                    int(cumulative)
+                ))
+            lines.append("{}_sum{} {:g}".format(name, braces, values.get("sum", 0)))
+            lines.append("{}_count{} {}".format(name, braces, int(cumulative)))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Record the latency and status code of every request by URL name.
+
+    Both are written in one transaction. The middleware is not used unless
+    METRICS_DATABASE is set.
+    """
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed("METRICS_DATABASE is not set.")
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else "unknown"
+        _record(
+            _histogram_rows("lowfat_request_duration_seconds", duration, {"view": view, "method": request.method})
+            + _counter_rows("lowfat_responses_total", 1, {"view": view, "status": response.status_code})
+        )
+        return response
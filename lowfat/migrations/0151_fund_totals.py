@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def compute_fund_totals(apps, schema_editor):  # pylint: disable=unused-argument
+    Fund = apps.get_model("lowfat", "Fund")  # pylint: disable=invalid-name
+    Expense = apps.get_model("lowfat", "Expense")  # pylint: disable=invalid-name
+    Blog = apps.get_model("lowfat", "Blog")  # pylint: disable=invalid-name
+
+    for fund in Fund.objects.all():
+        expenses = Expense.objects.filter(fund=fund)
+        Fund.objects.filter(pk=fund.pk).update(
+            budget_request_total=sum([
+                fund.budget_request_travel,
+                fund.budget_request_attendance_fees,
+                fund.budget_request_subsistence_cost,
+                fund.budget_request_venue_hire,
+                fund.budget_request_catering,
+                fund.budget_request_others,
+            ]),
+            expenses_claimed_total=expenses.filter(
+                status__in=["S", "C", "A", "M"]
+            ).aggregate(total=Sum("amount_claimed"))["total"] or 0,
+            expenses_authorized_total=expenses.filter(
+                status__in=["A", "M"]
+            ).aggregate(total=Sum("amount_authorized_for_payment"))["total"] or 0,
+            blog_posts_total=Blog.objects.filter(fund=fund).exclude(status="X").count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0150_update_default_year'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fund',
+            name='blog_posts_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fund',
+            name='budget_request_total',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='fund',
+            name='expenses_authorized_total',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='fund',
+            name='expenses_claimed_total',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='historicalfund',
+            name='budget_request_total',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(compute_fund_totals, migrations.RunPython.noop),
+    ]
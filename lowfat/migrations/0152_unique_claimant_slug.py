@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:05
+from __future__ import unicode_literals
+
+import itertools
+
+from django.db import migrations, models
+
+
+def deduplicate_slugs(apps, schema_editor):  # pylint: disable=unused-argument
+    Claimant = apps.get_model("lowfat", "Claimant")  # pylint: disable=invalid-name
+
+    used_slugs = set()
+    for claimant in Claimant.objects.order_by("pk"):
+        if claimant.slug not in used_slugs:
+            used_slugs.add(claimant.slug)
+            continue
+
+        # Same sequence used by Claimant.slug_generator
+        for i in itertools.count():
+            slug = '{0}-{1}'.format(claimant.slug, i)
+            if slug not in used_slugs and not Claimant.objects.filter(slug=slug).exists():
+                break
+
+        Claimant.objects.filter(pk=claimant.pk).update(slug=slug)
+        used_slugs.add(slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0151_fund_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='claimant',
+            name='slug',
+            field=models.CharField(max_length=120, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalclaimant',
+            name='slug',
+            field=models.CharField(db_index=True, max_length=120),
+        ),
+    ]
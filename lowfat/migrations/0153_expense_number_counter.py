@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def renumber_expenses(apps, schema_editor):  # pylint: disable=unused-argument
+    Fund = apps.get_model("lowfat", "Fund")  # pylint: disable=invalid-name
+    Expense = apps.get_model("lowfat", "Expense")  # pylint: disable=invalid-name
+
+    for fund in Fund.objects.all():
+        expenses = Expense.objects.filter(fund=fund).order_by("pk")
+        last_expense_number = expenses.aggregate(last=Max("relative_number"))["last"] or 0
+
+        # Expenses created concurrently could share the same number.
+        # The oldest one keeps it and the others are moved to the end.
+        used_numbers = set()
+        for expense in expenses:
+            if expense.relative_number in used_numbers:
+                last_expense_number += 1
+                Expense.objects.filter(pk=expense.pk).update(relative_number=last_expense_number)
+            else:
+                used_numbers.add(expense.relative_number)
+
+        Fund.objects.filter(pk=fund.pk).update(last_expense_number=last_expense_number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0152_unique_claimant_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fund',
+            name='last_expense_number',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(renumber_expenses, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='expense',
+            unique_together=set([('fund', 'relative_number')]),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:49
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def deduplicate_invoice_references(apps, schema_editor):  # pylint: disable=unused-argument
+    Expense = apps.get_model("lowfat", "Expense")  # pylint: disable=invalid-name
+    Sequence = apps.get_model("lowfat", "Sequence")  # pylint: disable=invalid-name
+
+    Expense.objects.filter(invoice_reference="").update(invoice_reference=None)
+
+    sequence = Sequence.objects.create(name="invoice_reference")
+    used_references = set()
+    for expense in Expense.objects.exclude(invoice_reference=None).order_by("pk"):
+        if expense.invoice_reference not in used_references:
+            used_references.add(expense.invoice_reference)
+            continue
+
+        # Same references as lowfat.models.invoice_reference
+        while True:
+            sequence.value += 1
+            digest = hashlib.md5(bytes("SSIF #{}".format(sequence.value), 'utf-8')).hexdigest()
+            reference = "SSIF-{}-{}".format(digest[0:5], digest[5:9])
+            if reference not in used_references and not Expense.objects.filter(invoice_reference=reference).exists():
+                break
+
+        Expense.objects.filter(pk=expense.pk).update(invoice_reference=reference)
+        used_references.add(reference)
+
+    sequence.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0153_expense_number_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=120, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(deduplicate_invoice_references, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='expense',
+            name='invoice_reference',
+            field=models.CharField(blank=True, max_length=15, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalexpense',
+            name='invoice_reference',
+            field=models.CharField(blank=True, db_index=True, max_length=15, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# The history tables are read newest first by date.
+HISTORY_TABLES = ("claimant", "fund", "expense", "blog")
+
+
+def history_index_operations():
+    return [
+        migrations.RunSQL(
+            ["CREATE INDEX lowfat_historical{0}_history_date_idx ON lowfat_historical{0} (history_date, history_id)".format(table)],
+            ["DROP INDEX lowfat_historical{0}_history_date_idx".format(table)]
+        )
+        for table in HISTORY_TABLES
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0154_invoice_reference_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['status'], name='blog_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['author', 'status'], name='blog_author_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimant',
+            index=models.Index(fields=['fellow'], name='claimant_fellow_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimant',
+            index=models.Index(fields=['collaborator'], name='claimant_collaborator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['status'], name='expense_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['fund', 'status'], name='expense_fund_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fund',
+            index=models.Index(fields=['status'], name='fund_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fund',
+            index=models.Index(fields=['claimant', 'status'], name='fund_claimant_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fund',
+            index=models.Index(fields=['category', 'start_date'], name='fund_category_start_idx'),
+        ),
+    ] + history_index_operations()
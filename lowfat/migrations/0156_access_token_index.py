@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:55
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+TOKEN_MODELS = ("fund", "expense", "blog")
+
+
+def index_access_tokens(apps, schema_editor):  # pylint: disable=unused-argument
+    AccessToken = apps.get_model("lowfat", "AccessToken")  # pylint: disable=invalid-name
+    ContentType = apps.get_model("contenttypes", "ContentType")  # pylint: disable=invalid-name
+
+    used_hashes = set()
+    tokens = []
+    for model_name in TOKEN_MODELS:
+        model = apps.get_model("lowfat", model_name)
+        content_type, _ = ContentType.objects.get_or_create(app_label="lowfat", model=model_name)
+        for pk, access_token, expire_date in model.objects.exclude(
+                access_token=None
+        ).exclude(
+            access_token=""
+        ).order_by("pk").values_list("pk", "access_token", "access_token_expire_date"):
+            # Same digest as lowfat.models.hash_access_token
+            token_hash = hashlib.sha256(bytes(access_token, 'utf-8')).hexdigest()
+            if token_hash in used_hashes:
+                continue
+
+            used_hashes.add(token_hash)
+            tokens.append(AccessToken(
+                token_hash=token_hash,
+                content_type=content_type,
+                object_id=pk,
+                expire_date=expire_date
+            ))
+
+    AccessToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('lowfat', '0155_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('expire_date', models.DateField(blank=True, db_index=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accesstoken',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunPython(index_access_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Same tables as lowfat.search.INDEXES
+SEARCH_TABLES = (
+    (
+        "lowfat_claimant_search",
+        "forenames, surname, email, research_area, affiliation, work_description, website, github, twitter",
+        "SELECT id, forenames, surname, email, research_area, affiliation, work_description, website, github, twitter "
+        "FROM lowfat_claimant",
+    ),
+    (
+        "lowfat_fund_search",
+        "claimant, title, url, justification, additional_info",
+        "SELECT lowfat_fund.id, lowfat_claimant.forenames || ' ' || lowfat_claimant.surname, "
+        "lowfat_fund.title, lowfat_fund.url, lowfat_fund.justification, lowfat_fund.additional_info "
+        "FROM lowfat_fund INNER JOIN lowfat_claimant ON lowfat_fund.claimant_id = lowfat_claimant.id",
+    ),
+    (
+        "lowfat_blog_search",
+        "title",
+        "SELECT id, title FROM lowfat_blog",
+    ),
+)
+
+
+def create_search_tables(apps, schema_editor):  # pylint: disable=unused-argument
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    for table, columns, source in SEARCH_TABLES:
+        schema_editor.execute("CREATE VIRTUAL TABLE {} USING fts5({}, prefix='2 3')".format(table, columns))
+        schema_editor.execute("INSERT INTO {} (rowid, {}) {}".format(table, columns, source))
+
+
+def drop_search_tables(apps, schema_editor):  # pylint: disable=unused-argument
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    for table, _, _ in SEARCH_TABLES:
+        schema_editor.execute("DROP TABLE IF EXISTS {}".format(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0156_access_token_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
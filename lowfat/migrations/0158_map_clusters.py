@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 08:11
+from __future__ import unicode_literals
+
+import math
+
+from django.db import migrations, models
+
+
+# Same grid as lowfat.models.map_cell
+MAX_MAP_ZOOM = 12
+MAX_MERCATOR_LATITUDE = 85.0511287798
+MAP_TILE_CELLS = 8
+
+
+def map_cell(lat, lon, zoom):
+    size = (2 ** zoom) * MAP_TILE_CELLS
+    lat = math.radians(max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, lat)))
+    x = (lon + 180.0) / 360.0 * size
+    y = (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * size
+    return (
+        min(size - 1, max(0, int(x))),
+        min(size - 1, max(0, int(y))),
+    )
+
+
+def build_map_clusters(apps, schema_editor):  # pylint: disable=unused-argument
+    Claimant = apps.get_model("lowfat", "Claimant")  # pylint: disable=invalid-name
+    Fund = apps.get_model("lowfat", "Fund")  # pylint: disable=invalid-name
+    MapCluster = apps.get_model("lowfat", "MapCluster")  # pylint: disable=invalid-name
+
+    points = [
+        ("claimants", lat, lon)
+        for lat, lon in Claimant.objects.exclude(home_lat=None).exclude(home_lon=None).values_list("home_lat", "home_lon")
+    ] + [
+        ("funds", lat, lon)
+        for lat, lon in Fund.objects.exclude(lat=None).exclude(lon=None).values_list("lat", "lon")
+    ]
+
+    clusters = {}
+    for kind, lat, lon in points:
+        for zoom in range(MAX_MAP_ZOOM + 1):
+            cell_x, cell_y = map_cell(lat, lon, zoom)
+            cluster = clusters.get((zoom, cell_x, cell_y))
+            if cluster is None:
+                cluster = clusters[(zoom, cell_x, cell_y)] = MapCluster(
+                    zoom=zoom,
+                    cell_x=cell_x,
+                    cell_y=cell_y,
+                    tile_x=cell_x // MAP_TILE_CELLS,
+                    tile_y=cell_y // MAP_TILE_CELLS
+                )
+            setattr(cluster, kind, getattr(cluster, kind) + 1)
+            cluster.lat_sum += lat
+            cluster.lon_sum += lon
+
+    MapCluster.objects.bulk_create(clusters.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lowfat', '0157_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapCluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('tile_x', models.IntegerField()),
+                ('tile_y', models.IntegerField()),
+                ('claimants', models.IntegerField(default=0)),
+                ('funds', models.IntegerField(default=0)),
+                ('lat_sum', models.FloatField(default=0)),
+                ('lon_sum', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mapcluster',
+            index=models.Index(fields=['zoom', 'tile_x', 'tile_y'], name='mapcluster_tile_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mapcluster',
+            unique_together=set([('zoom', 'cell_x', 'cell_y')]),
+        ),
+        migrations.RunPython(build_map_clusters, migrations.RunPython.noop),
+    ]
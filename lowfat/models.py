@@ -1,7 +1,10 @@
 from datetime import datetime, date, timedelta
+from decimal import Decimal
 import hashlib
-import itertools
+import json
+import math
 import re
+import threading
 import uuid
 
 from geopy.geocoders import Nominatim
@@ -11,8 +14,16 @@ from constance import config
 import django.utils
 import django.utils.text
 from django.conf import settings
-from django.db import models
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.mail import EmailMultiAlternatives
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.urls import reverse
+from django.utils.functional import cached_property
 
 from simple_history.models import HistoricalRecords
 
@@ -22,15 +33,22 @@ import tagulous.models
 
 from .validator import pdf, online_document
 from .jacs import JACS_3_0_PRINCIPAL_SUBJECT_CODES
+from .metrics import timer
+from .search import add_to_index, remove_from_index
+from .thumbnails import delete_thumbnails, make_thumbnails
 from .utils import ChoicesEnum
 
-INVOICE_HASH = hashlib.md5()
-
 MAX_CHAR_LENGTH = 120
 MAX_URL_LENGTH = 360
-MAX_INVOICE_REFERENCE_LENGTH = 14  # e.g. SSIF-xxxx-xxxx
+MAX_INVOICE_REFERENCE_LENGTH = 15  # e.g. SSIF-xxxxx-xxxx
+MAX_INVOICE_REFERENCE_ATTEMPTS = 10  # Number of sequence values tried before giving up on collisions
 MAX_PHONE_LENGTH = 14
 MAX_DIGITS = 10
+MAX_SLUG_ATTEMPTS = 5  # Number of slugs tried before giving up on concurrent inserts
+MAX_MAP_ZOOM = 12  # Deepest zoom level of MapCluster
+MAX_MERCATOR_LATITUDE = 85.0511287798
+MAP_TILE_CELLS = 8  # Clusters per side of one map tile
+MAP_LOCATION_DEFERRED = "deferred"  # Location of a record loaded without it, see MapClusterMixin
 
 GENDERS = (
     ('M', 'Male'),
@@ -94,6 +112,21 @@ FUND_STATUS_APPROVED_SET = {
     'M',
 }
 
+#: Set of expense statuses which count as claimed from a fund
+EXPENSE_STATUS_CLAIMED_SET = {
+    'S',
+    'C',
+    'A',
+    'M',
+}
+
+#: Set of expense statuses which are taken from the claimantship grant
+EXPENSE_STATUS_SPENT_SET = {
+    'A',
+    'M',
+    'F',
+}
+
 FUND_STATUS_LONG_DESCRIPTION = {
     'U': "We didn't start to process your request yet.",
     'P': "One of your staffs is reviewing your request. You should have our reply soon.",
@@ -138,6 +171,28 @@ BLOG_POST_STATUS = (
     ('X', 'Remove'),  # When the fellow decided to remove their request.
 )
 
+OUTBOX_STATUS = (
+    ('P', 'Pending'),  # Waiting to be sent, for the first time or after a failure.
+    ('S', 'Sent'),
+    ('D', 'Dead'),  # Failed settings.OUTBOX_MAX_ATTEMPTS times, must be retried from the admin.
+)
+
+#: Fields of Fund that store totals of its expenses and blog posts.
+#:
+#: They are maintained by Expense and Blog (see FundTotalsMixin) and never
+#: written by Fund.save().
+FUND_DENORMALISED_FIELDS = (
+    "expenses_claimed_total",
+    "expenses_authorized_total",
+    "blog_posts_total",
+)
+
+#: Fields of Fund that are counters allocated by other models and never
+#: written by Fund.save().
+FUND_COUNTER_FIELDS = (
+    "last_expense_number",
+)
+
 
 class ApprovalChain(ChoicesEnum):
     """
@@ -168,15 +223,426 @@ def fix_url(url):
     return url
 
 def pair_fund_with_blog(funds, status=None):
-    """Create list of tuples where first element is fund and second is list of blog related with it."""
-    args = {}
+    """Create list of tuples where first element is fund and second is list of blog related with it.
+
+    The blog posts of all the funds are fetched with a single query.
+    """
+    blogs = Blog.objects.all()
     if status:
-        args["status"] = status
+        blogs = blogs.filter(status=status)
+
+    funds = list(funds)
+    prefetch_related_objects(
+        funds,
+        Prefetch("blog_set", queryset=blogs, to_attr="paired_blogs")
+    )
+
+    return [(fund, fund.paired_blogs) for fund in funds]
+
+
+def _aggregate_subquery(queryset, group_by, aggregate, output_field):
+    """Return a correlated subquery with aggregate of queryset grouped by group_by."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_by).annotate(
+                total=aggregate
+            ).values("total")[:1],
+            output_field=output_field
+        ),
+        Value(0)
+    )
+
+
+def _sum_subquery(queryset, group_by, field):
+    """Return a correlated subquery with the sum of field grouped by group_by."""
+    return _aggregate_subquery(
+        queryset,
+        group_by,
+        Sum(field),
+        models.DecimalField(max_digits=MAX_DIGITS, decimal_places=2)
+    )
+
+
+def fund_totals_annotations():
+    """Return annotations with the expected value of FUND_DENORMALISED_FIELDS computed from scratch."""
+    return {
+        "expected_expenses_claimed_total": _sum_subquery(
+            Expense.objects.filter(fund=OuterRef("pk"), status__in=EXPENSE_STATUS_CLAIMED_SET),
+            "fund",
+            "amount_claimed"
+        ),
+        "expected_expenses_authorized_total": _sum_subquery(
+            Expense.objects.filter(fund=OuterRef("pk"), status__in=FUND_STATUS_APPROVED_SET),
+            "fund",
+            "amount_authorized_for_payment"
+        ),
+        "expected_blog_posts_total": _aggregate_subquery(
+            Blog.objects.filter(fund=OuterRef("pk")).exclude(status="X"),
+            "fund",
+            Count("pk"),
+            models.IntegerField()
+        ),
+    }
+
+
+def reconcile_fund_totals(fund_ids):
+    """Set the totals stored in the funds fund_ids to the ones computed from their expenses and blog posts."""
+    expected = Fund.objects.filter(pk__in=fund_ids).order_by().annotate(
+        **fund_totals_annotations()
+    ).values_list("id", *["expected_{}".format(field) for field in FUND_DENORMALISED_FIELDS])
+    for row in expected:
+        Fund.objects.filter(pk=row[0]).update(**dict(zip(FUND_DENORMALISED_FIELDS, row[1:])))
+
+
+def update_fund_totals(old, new):
+    """Apply the difference between two contributions to the totals stored in Fund.
+
+    old and new are pairs of fund id and dictionary with the contribution to
+    each field in FUND_DENORMALISED_FIELDS. Any of them can be None.
+    """
+    deltas = {}
+    for contribution, sign in ((old, -1), (new, 1)):
+        if contribution is None or contribution[0] is None:
+            continue
+        fund_id, values = contribution
+        fund_deltas = deltas.setdefault(fund_id, {})
+        for field, value in values.items():
+            fund_deltas[field] = fund_deltas.get(field, 0) + sign * value
+
+    for fund_id, fund_deltas in deltas.items():
+        changes = {
+            field: F(field) + delta
+            for field, delta in fund_deltas.items()
+            if delta
+        }
+        if changes:
+            Fund.objects.filter(pk=fund_id).update(**changes)
+
+
+class ClaimantLedger:
+    """Committed, spent, available and passed amounts of one claimantship grant.
+
+    All the sums are computed by the database in a single query, see
+    :meth:`annotations`, so the cost is the same regardless of how many
+    funds or expenses the claimant has.
+    """
+    #: Names of the annotations added by :meth:`annotations`
+    FIELDS = (
+        "ledger_committed_budget",
+        "ledger_committed_claimed",
+        "ledger_spent",
+    )
+
+    def __init__(self, claimant, committed_budget, committed_claimed, spent):
+        self.grant = Decimal(str(claimant.claimantship_grant))
+        self.committed = Decimal(committed_budget) - Decimal(committed_claimed)
+        self.spent = Decimal(spent)
+
+        balance = self.grant - self.committed - self.spent
+        today = date.today()
+        self.available = balance if claimant.inauguration_grant_expiration > today else 0
+        self.passed = balance if claimant.inauguration_grant_expiration < today else 0
+
+    @staticmethod
+    def annotations():
+        """Return the annotations required to build the ledger of a Claimant queryset."""
+        approved_funds = Fund.objects.filter(
+            claimant=OuterRef("pk"),
+            status__in=FUND_STATUS_APPROVED_SET,
+            grant_heading="F"
+        )
+        approved_funds_expenses = Expense.objects.filter(
+            fund__claimant=OuterRef("pk"),
+            fund__status__in=FUND_STATUS_APPROVED_SET,
+            fund__grant_heading="F",
+            status__in=EXPENSE_STATUS_SPENT_SET
+        )
+        spent_expenses = Expense.objects.filter(
+            fund__claimant=OuterRef("pk"),
+            status__in=EXPENSE_STATUS_SPENT_SET,
+            grant_heading="F"
+        )
+
+        return {
+            "ledger_committed_budget": _sum_subquery(approved_funds, "claimant", "budget_approved"),
+            "ledger_committed_claimed": _sum_subquery(approved_funds_expenses, "fund__claimant", "amount_claimed"),
+            "ledger_spent": _sum_subquery(spent_expenses, "fund__claimant", "amount_claimed"),
+        }
+
+    @classmethod
+    def for_claimant(cls, claimant):
+        """Build the ledger of claimant reusing annotations when they are present."""
+        if all(hasattr(claimant, field) for field in cls.FIELDS):
+            values = {field: getattr(claimant, field) for field in cls.FIELDS}
+        else:
+            values = Claimant.objects.filter(
+                pk=claimant.pk
+            ).annotate(
+                **cls.annotations()
+            ).values(*cls.FIELDS).get()
+
+        return cls(
+            claimant,
+            values["ledger_committed_budget"],
+            values["ledger_committed_claimed"],
+            values["ledger_spent"]
+        )
+
+
+class ClaimantQuerySet(models.QuerySet):
+    def with_finances(self):
+        """Annotate claimants with the sums used by :attr:`Claimant.ledger`."""
+        return self.annotate(**ClaimantLedger.annotations())
+
+
+class FundQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Fetch the claimant and approver together with the funds.
+
+        The totals of each fund are stored in the row (see FUND_DENORMALISED_FIELDS),
+        so no other query is required to render a list of funds.
+        """
+        return self.select_related(
+            "claimant",
+            "claimant__user",
+            "approver",
+        )
+
+
+class BlogQuerySet(models.QuerySet):
+    def by_author(self, claimant):
+        """Return blog posts where claimant is the author or one of the coauthors.
+
+        The coauthors are matched with a subquery, instead of a join, so the
+        rows are not duplicated and each branch can use an index.
+        """
+        return self.filter(
+            Q(author=claimant) |
+            Q(pk__in=Blog.coauthor.through.objects.filter(
+                claimant=claimant
+            ).values("blog_id"))
+        )
+
+
+class SearchIndexMixin:
+    """Keep the full text search index of :mod:`lowfat.search` up to date.
+
+    The index is updated by the receivers of SEARCH_INDEXED_MODELS, so raw
+    saves, queryset and cascaded deletes are indexed too; save() and
+    delete() only update the record and the index in one transaction.
+    """
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            super(SearchIndexMixin, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            return super(SearchIndexMixin, self).delete(*args, **kwargs)
+
+
+def map_cell(lat, lon, zoom):
+    """Return the (x, y) of the MapCluster cell containing the point at zoom, in Web Mercator."""
+    size = (2 ** zoom) * MAP_TILE_CELLS
+    lat = math.radians(max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, lat)))
+    column = (lon + 180.0) / 360.0 * size
+    row = (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * size
+    return (
+        min(size - 1, max(0, int(column))),
+        min(size - 1, max(0, int(row))),
+    )
+
+
+def map_location(values):
+    """Return the (lat, lon) of the values of the latitude and longitude fields or None."""
+    if None in values or len(values) != 2:
+        return None
+    return float(values[0]), float(values[1])
+
+
+class MapCluster(models.Model):
+    """Claimants and funds located in one cell of the map grid at one zoom level."""
+    class Meta:
+        app_label = 'lowfat'
+        unique_together = (
+            ("zoom", "cell_x", "cell_y"),
+        )
+        indexes = [
+            models.Index(fields=["zoom", "tile_x", "tile_y"], name="mapcluster_tile_idx"),
+        ]
+
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    tile_x = models.IntegerField()
+    tile_y = models.IntegerField()
+    claimants = models.IntegerField(default=0)
+    funds = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0)
+    lon_sum = models.FloatField(default=0)
+
+    def __str__(self):
+        return "{}/{}/{} ({} claimants, {} funds)".format(
+            self.zoom,
+            self.cell_x,
+            self.cell_y,
+            self.claimants,
+            self.funds
+        )
+
+    def centre(self):
+        """Return the (lat, lon) of the centroid of the points in the cell."""
+        count = self.claimants + self.funds
+        return self.lat_sum / count, self.lon_sum / count
+
+    @classmethod
+    def add_point(cls, kind, lat, lon, sign=1):
+        """Add (sign=1) or remove (sign=-1) one point of kind ("claimants" or "funds") at every zoom level.
+
+        The cells of all the zoom levels are updated with one query, then
+        the missing ones are inserted, or the empty ones deleted, with one
+        more query."""
+        cells = {zoom: map_cell(lat, lon, zoom) for zoom in range(MAX_MAP_ZOOM + 1)}
+        query = Q()
+        for zoom, (cell_x, cell_y) in cells.items():
+            query |= Q(zoom=zoom, cell_x=cell_x, cell_y=cell_y)
+        clusters = cls.objects.filter(query)
+
+        updated = clusters.update(**{
+            kind: F(kind) + sign,
+            "lat_sum": F("lat_sum") + sign * lat,
+            "lon_sum": F("lon_sum") + sign * lon,
+        })
+        if sign < 0:
+            clusters.filter(claimants__lte=0, funds__lte=0).delete()
+        elif updated < len(cells):
+            existing = set(clusters.values_list("zoom", flat=True))
+            cls.objects.bulk_create([
+                cls(
+                    zoom=zoom,
+                    cell_x=cell_x,
+                    cell_y=cell_y,
+                    tile_x=cell_x // MAP_TILE_CELLS,
+                    tile_y=cell_y // MAP_TILE_CELLS,
+                    lat_sum=lat,
+                    lon_sum=lon,
+                    **{kind: 1}
+                )
+                for zoom, (cell_x, cell_y) in cells.items()
+                if zoom not in existing
+            ])
+
+    @classmethod
+    def rebuild(cls, points):
+        """Replace every cluster with the ones of points, an iterable of (kind, lat, lon)."""
+        clusters = {}
+        for kind, lat, lon in points:
+            for zoom in range(MAX_MAP_ZOOM + 1):
+                cell_x, cell_y = map_cell(lat, lon, zoom)
+                cluster = clusters.get((zoom, cell_x, cell_y))
+                if cluster is None:
+                    cluster = clusters[(zoom, cell_x, cell_y)] = cls(
+                        zoom=zoom,
+                        cell_x=cell_x,
+                        cell_y=cell_y,
+                        tile_x=cell_x // MAP_TILE_CELLS,
+                        tile_y=cell_y // MAP_TILE_CELLS
+                    )
+                setattr(cluster, kind, getattr(cluster, kind) + 1)
+                cluster.lat_sum += lat
+                cluster.lon_sum += lon
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(clusters.values(), batch_size=500)
+
+
+class MapClusterMixin:
+    """Keep MapCluster up to date with the coordinates of the record.
+
+    Models using it must define ``map_kind`` and ``map_fields``, the names of
+    their latitude and longitude fields. The clusters are updated by the
+    receivers of MAP_CLUSTERED_MODELS, so raw saves, queryset and cascaded
+    deletes are counted too; save() and delete() only update the record and
+    the clusters in one transaction."""
+    map_kind = None
+    map_fields = ()
+
+    # Location counted in MapCluster, or MAP_LOCATION_DEFERRED when the record
+    # was loaded without its location.
+    _clustered_location = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):  # pylint: disable=invalid-name
+        instance = super(MapClusterMixin, cls).from_db(db, field_names, values)
+        if instance.get_deferred_fields().intersection(cls.map_fields):
+            instance._clustered_location = MAP_LOCATION_DEFERRED  # pylint: disable=protected-access
+        else:
+            instance._clustered_location = instance.map_location()  # pylint: disable=protected-access
+        return instance
+
+    def map_location(self):
+        """Return the (lat, lon) of the record or None."""
+        return map_location([self.__dict__.get(field) for field in self.map_fields])
+
+    def stored_map_location(self):
+        """Return the (lat, lon) of the record in the database or None."""
+        return map_location(
+            type(self).objects.filter(pk=self.pk).values_list(*self.map_fields).first() or [None]
+        )
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            super(MapClusterMixin, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            return super(MapClusterMixin, self).delete(*args, **kwargs)
+
+
+class ThumbnailMixin:
+    """Create the variants of :mod:`lowfat.thumbnails` when a photo is uploaded or changed.
+
+    Models using it must define ``thumbnail_fields``, the names of their
+    image fields."""
+    thumbnail_fields = ()
+
+    # Name of the file of each field whose thumbnails exist. Fields loaded
+    # from the database without their file are missing.
+    _thumbnailed_files = {}
 
-    return [(fund, Blog.objects.filter(
-        fund=fund,
-        **args
-    )) for fund in funds]
+    @classmethod
+    def from_db(cls, db, field_names, values):  # pylint: disable=invalid-name
+        instance = super(ThumbnailMixin, cls).from_db(db, field_names, values)
+        instance._thumbnailed_files = instance.thumbnailed_files()  # pylint: disable=protected-access
+        return instance
+
+    def thumbnailed_files(self):
+        """Return the names of the files of the loaded image fields."""
+        return {
+            field: str(self.__dict__[field] or "")
+            for field in self.thumbnail_fields
+            if field in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        old = dict(self._thumbnailed_files)
+        # Fields neither loaded nor set are saved unchanged.
+        loaded = [field for field in self.thumbnail_fields if field in self.__dict__]
+        deferred = [field for field in loaded if field not in old]
+        if self.pk is not None and deferred:
+            # Loaded without the file, then set: the thumbnails to replace are the ones of the stored file.
+            stored = type(self).objects.filter(pk=self.pk).values(*deferred).first() or {}
+            old.update((field, stored.get(field) or "") for field in deferred)
+
+        super(ThumbnailMixin, self).save(*args, **kwargs)
+        new = self.thumbnailed_files()
+        for field in loaded:
+            if new[field] != old.get(field, ""):
+                field_file = getattr(self, field)
+                if old.get(field):
+                    delete_thumbnails(field_file.storage, old[field])
+                make_thumbnails(field_file)
+        self._thumbnailed_files = {field: new[field] for field in loaded}
 
 
 class TermsAndConditions(models.Model):
@@ -204,7 +670,7 @@ class TermsAndConditions(models.Model):
         )
 
 
-class Claimant(models.Model):
+class Claimant(ThumbnailMixin, MapClusterMixin, SearchIndexMixin, models.Model):
     """Describe a claimant."""
 
     class Meta:
@@ -215,6 +681,10 @@ class Claimant(models.Model):
             "forenames",
             "surname",
         ]
+        indexes = [
+            models.Index(fields=["fellow"], name="claimant_fellow_idx"),
+            models.Index(fields=["collaborator"], name="claimant_collaborator_idx"),
+        ]
 
     # Authentication
     #
@@ -377,7 +847,10 @@ class Claimant(models.Model):
     )
 
     # Admin fields
-    slug = models.CharField(max_length=MAX_CHAR_LENGTH)
+    slug = models.CharField(
+        max_length=MAX_CHAR_LENGTH,
+        unique=True
+    )
     terms_and_conditions = models.ForeignKey(
         'TermsAndConditions',
         null=True,
@@ -439,35 +912,45 @@ class Claimant(models.Model):
     updated = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
 
+    objects = ClaimantQuerySet.as_manager()
+
+    map_kind = "claimants"
+    map_fields = ("home_lat", "home_lon")
+    thumbnail_fields = ("photo",)
+
     def get_absolute_url(self):
         return reverse('claimant-slug-resolution', kwargs={'claimant_slug': self.slug})
 
     def slug_generator(self):
         """
         Generate slug for Claimant - checking that it doesn't conflict with an existing Claimant.
+
+        Candidates are base_slug, base_slug-0, base_slug-1, ... and the first
+        one not used is returned. All the slugs sharing base_slug are fetched
+        with a single query.
         """
         base_slug = django.utils.text.slugify("{0}-{1}".format(self.forenames, self.surname))
-        slug = base_slug
-
-        for i in itertools.count():
-            try:
-                # Has this slug already been used?
-                existing = Claimant.objects.get(slug=slug)
-                if existing.pk == self.pk:
-                    break
 
-            except Claimant.DoesNotExist:
-                # No - use this slug
-                break
-
-            except Claimant.MultipleObjectsReturned:
-                # Yes - multiple times - try the next one
-                pass
-
-            # Yes - try the next one
-            slug = '{0}-{1}'.format(base_slug, i)
-
-        return slug
+        used_slugs = set(
+            Claimant.objects.filter(
+                slug__startswith=base_slug
+            ).exclude(
+                pk=self.pk
+            ).values_list("slug", flat=True)
+        )
+        if base_slug not in used_slugs:
+            return base_slug
+
+        suffix = re.compile(r"^{}-(\d+)$".format(re.escape(base_slug)))
+        used_suffixes = {
+            int(match.group(1))
+            for match in (suffix.match(slug) for slug in used_slugs)
+            if match
+        }
+        i = 0
+        while i in used_suffixes:
+            i += 1
+        return '{0}-{1}'.format(base_slug, i)
 
     def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
         if not self.id:
@@ -477,13 +960,27 @@ class Claimant(models.Model):
                 config.FELLOWSHIP_EXPENSES_END_DAY
             )
 
-        if not self.slug:
-            self.slug = self.slug_generator()
-
         self.website = fix_url(self.website)
         self.website_feed = fix_url(self.website_feed)
 
-        super(Claimant, self).save(*args, **kwargs)
+        if self.slug:
+            super(Claimant, self).save(*args, **kwargs)
+            return
+
+        # Another claimant with the same name can take the slug between
+        # slug_generator() and the insert, e.g. concurrent imports.
+        for attempt in range(MAX_SLUG_ATTEMPTS):
+            self.slug = self.slug_generator()
+            try:
+                with transaction.atomic():
+                    super(Claimant, self).save(*args, **kwargs)
+                return
+
+            except IntegrityError:
+                slug_taken = Claimant.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                if not slug_taken or attempt + 1 == MAX_SLUG_ATTEMPTS:
+                    self.slug = ""
+                    raise
 
     def update_latlon(self):
         geolocator = Nominatim(
@@ -491,9 +988,10 @@ class Claimant(models.Model):
             user_agent="lowfat/dev"
         )
         try:
-            location = geolocator.geocode(
-                self.home_city
-            )
+            with timer("lowfat_geocode_duration_seconds", model="claimant"):
+                location = geolocator.geocode(
+                    self.home_city
+                )
             if location is not None:
                 self.home_lon = location.longitude
                 self.home_lat = location.latitude
@@ -526,48 +1024,197 @@ class Claimant(models.Model):
             self.surname
         )
 
+    @cached_property
+    def ledger(self):
+        """Return the :class:`ClaimantLedger` of this claimant, computed once per instance."""
+        return ClaimantLedger.for_claimant(self)
+
     def claimantship_available(self):
         """Return the remaining claimantship grant."""
-        money_available = 0
-        if self.inauguration_grant_expiration > date.today():
-            money_available = self.claimantship_grant - self.claimantship_committed() - self.claimantship_spent()
-
-        return money_available
+        return self.ledger.available
 
     def claimantship_passed(self):
         """Return the amount already spent from the claimantship grant."""
-        money_passed = 0
-        if self.inauguration_grant_expiration < date.today():
-            money_passed = self.claimantship_grant - self.claimantship_committed() - self.claimantship_spent()
-
-        return money_passed
+        return self.ledger.passed
 
     def claimantship_committed(self):
         """Return the amount committed from the claimantship grant."""
-        this_claimant_funds = Fund.objects.filter(
-            claimant=self,
-            status__in=FUND_STATUS_APPROVED_SET,
-            grant_heading="F"
-        )
-
-        spent_from_committed = 0
-        for fund in this_claimant_funds:
-            spent_from_committed += sum([expense.amount_claimed for expense in Expense.objects.filter(
-                fund=fund,
-                status__in=['A', 'M', 'F']
-            )])
-
-        return sum([fund.budget_approved for fund in this_claimant_funds]) - spent_from_committed
+        return self.ledger.committed
 
     def claimantship_spent(self):
         """Return the amount already spent from the claimantship grant."""
-        this_claimant_expenses = Expense.objects.filter(
-            fund__claimant=self,
-            status__in=['A', 'M', 'F'],
-            grant_heading="F"
+        return self.ledger.spent
+
+
+class Sequence(models.Model):
+    """Named counter shared by all the processes using the database."""
+    name = models.CharField(
+        max_length=MAX_CHAR_LENGTH,
+        primary_key=True
+    )
+    value = models.BigIntegerField(
+        default=0
+    )
+
+    def __str__(self):
+        return "{} ({})".format(self.name, self.value)
+
+    @classmethod
+    def next_value(cls, name):
+        """Increment the counter and return the new value."""
+        with transaction.atomic():
+            cls.objects.get_or_create(name=name)
+            sequence = cls.objects.filter(name=name)
+            sequence.update(value=F("value") + 1)
+            return sequence.values_list("value", flat=True).get()
+
+
+def cache_version_name(model_name):
+    return "cache_version.{}".format(model_name)
+
+
+def cache_versions(*model_names):
+    """Return the version counters of model_names, changed by every save or delete of their records."""
+    values = dict(Sequence.objects.filter(
+        name__in=[cache_version_name(model_name) for model_name in model_names]
+    ).values_list("name", "value"))
+    return "-".join(str(values.get(cache_version_name(model_name), 0)) for model_name in model_names)
+
+
+#: Names of the version counters to bump when the transaction of the thread commits
+_PENDING_CACHE_VERSIONS = threading.local()
+
+
+def _bump_pending_cache_versions():
+    names = getattr(_PENDING_CACHE_VERSIONS, "names", set())
+    for name in sorted(names):
+        try:
+            Sequence.next_value(name)
+        except DatabaseError:
+            # The records are already committed, the name stays pending for the next commit.
+            return
+        names.discard(name)
+
+
+def bump_cache_version(sender, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save and post_delete invalidating the caches of lowfat.page_cache.
+
+    The counter is written after the transaction commits, once however many
+    records of the model the transaction changed, so its row is not locked
+    for the rest of the transaction of the caller.
+    """
+    if not hasattr(_PENDING_CACHE_VERSIONS, "names"):
+        _PENDING_CACHE_VERSIONS.names = set()
+    _PENDING_CACHE_VERSIONS.names.add(cache_version_name(sender._meta.model_name))  # pylint: disable=protected-access
+    transaction.on_commit(_bump_pending_cache_versions)
+
+
+def invoice_reference(number):
+    """Return the invoice reference for the number taken from the invoice_reference sequence."""
+    digest = hashlib.md5(bytes("SSIF #{}".format(number), 'utf-8')).hexdigest()
+    return "SSIF-{}-{}".format(
+        digest[0:5],
+        digest[5:9]
+    )
+
+
+def hash_access_token(access_token):
+    """Return the digest under which the access token is indexed."""
+    return hashlib.sha256(bytes(access_token, 'utf-8')).hexdigest()
+
+
+class AccessTokenQuerySet(models.QuerySet):
+    def valid(self):
+        """Tokens that can still be used, see :meth:`ModelWithToken.access_token_is_valid`."""
+        return self.filter(expire_date__gt=date.today())
+
+    def expired(self):
+        return self.filter(Q(expire_date__isnull=True) | Q(expire_date__lte=date.today()))
+
+    def of_record(self, instance):
+        """Token of the record instance."""
+        return self.filter(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk)
+
+    def published(self, queryset, access_token):
+        """Restrict queryset to the record published under the access token."""
+        tokens = self.filter(
+            token_hash=hash_access_token(access_token),
+            content_type=ContentType.objects.get_for_model(queryset.model)
         )
+        return queryset.filter(pk__in=tokens.values("object_id"))
 
-        return sum([expense.amount_claimed for expense in this_claimant_expenses])
+
+class AccessToken(models.Model):
+    """Index of the access tokens of Fund, Expense and Blog used by the public links."""
+    class Meta:
+        app_label = 'lowfat'
+        unique_together = (
+            ("content_type", "object_id"),
+        )
+
+    token_hash = models.CharField(
+        max_length=64,
+        unique=True
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE
+    )
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    expire_date = models.DateField(
+        null=True,
+        blank=True,
+        db_index=True
+    )
+
+    objects = AccessTokenQuerySet.as_manager()
+
+    def __str__(self):
+        return "{} {} ({})".format(self.content_type, self.object_id, self.expire_date)
+
+    @classmethod
+    def index(cls, instance):
+        """Synchronise the index with the access token of instance."""
+        if instance.access_token:
+            cls.objects.update_or_create(
+                content_type=ContentType.objects.get_for_model(instance),
+                object_id=instance.pk,
+                defaults={
+                    "token_hash": hash_access_token(instance.access_token),
+                    "expire_date": instance.access_token_expire_date,
+                }
+            )
+        else:
+            cls.objects.of_record(instance).delete()
+
+    @classmethod
+    def rebuild(cls, models_with_token):
+        """Replace the index with the access tokens of every record of models_with_token."""
+        cls.objects.all().delete()
+        used_hashes = set()
+        tokens = []
+        for model in models_with_token:
+            content_type = ContentType.objects.get_for_model(model)
+            for object_id, access_token, expire_date in model.objects.exclude(
+                    access_token=None
+            ).exclude(
+                access_token=""
+            ).order_by("pk").values_list("pk", "access_token", "access_token_expire_date"):
+                token_hash = hash_access_token(access_token)
+                if token_hash in used_hashes:
+                    continue
+
+                used_hashes.add(token_hash)
+                tokens.append(cls(
+                    token_hash=token_hash,
+                    content_type=content_type,
+                    object_id=object_id,
+                    expire_date=expire_date
+                ))
+
+        cls.objects.bulk_create(tokens)
+        return len(tokens)
 
 
 class ModelWithToken(models.Model):
@@ -585,6 +1232,36 @@ class ModelWithToken(models.Model):
         blank=True
     )
 
+    def __init__(self, *args, **kwargs):
+        super(ModelWithToken, self).__init__(*args, **kwargs)
+        # Access token and expire date stored in AccessToken, set by from_db and save
+        self._indexed_access_token = (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(ModelWithToken, cls).from_db(db, field_names, values)
+        instance._indexed_access_token = (  # pylint: disable=protected-access
+            instance.__dict__.get("access_token"),
+            instance.__dict__.get("access_token_expire_date"),
+        )
+        return instance
+
+    @classmethod
+    def from_access_token(cls, access_token, queryset=None):
+        """Return the record published under a valid access token or None."""
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        return AccessToken.objects.valid().published(queryset, access_token).first()
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            super(ModelWithToken, self).save(*args, **kwargs)
+            token = (self.access_token, self.access_token_expire_date)
+            if token != self._indexed_access_token:
+                AccessToken.index(self)
+                self._indexed_access_token = token
+
     def new_access_token(self):
         self.access_token = uuid.uuid4().hex
         self.access_token_expire_date = date.today() + timedelta(days=30)
@@ -597,7 +1274,41 @@ class ModelWithToken(models.Model):
         return False
 
 
-class Fund(ModelWithToken):
+class FundTotalsMixin:
+    """Keep the totals stored in the related Fund up to date.
+
+    Models using it must have a ``fund`` foreign key and a ``fund_totals()``
+    method returning the contribution of the row to each field in
+    FUND_DENORMALISED_FIELDS. The totals are updated by the receivers of
+    FUND_TOTALS_MODELS, so raw saves, queryset and cascaded deletes are
+    counted too; save() and delete() only hold the stored row until the
+    totals are updated.
+    """
+    # Fund and contribution of the stored row, set before the row is saved or deleted.
+    _stored_fund_totals = None
+
+    def stored_fund_totals(self):
+        """Return the fund id and contribution of the row in the database or None."""
+        if self.pk is None:
+            return None
+
+        try:
+            stored = type(self).objects.select_for_update().get(pk=self.pk)
+        except type(self).DoesNotExist:
+            return None
+
+        return stored.fund_id, stored.fund_totals()
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            super(FundTotalsMixin, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        with transaction.atomic():
+            return super(FundTotalsMixin, self).delete(*args, **kwargs)
+
+
+class Fund(MapClusterMixin, SearchIndexMixin, ModelWithToken):
     """Describe a fund from one claimant."""
     class Meta:
         app_label = 'lowfat'
@@ -606,6 +1317,11 @@ class Fund(ModelWithToken):
             "-end_date",
             "title",
         ]
+        indexes = [
+            models.Index(fields=["status"], name="fund_status_idx"),
+            models.Index(fields=["claimant", "status"], name="fund_claimant_status_idx"),
+            models.Index(fields=["category", "start_date"], name="fund_category_start_idx"),
+        ]
 
     # TODO Make claimant more generic to include staffs.
     claimant = models.ForeignKey('Claimant')
@@ -724,6 +1440,37 @@ class Fund(ModelWithToken):
         blank=True
     )
 
+    # Totals
+    #
+    # budget_request_total is computed by save().
+    # The others are maintained by Expense and Blog, see FUND_DENORMALISED_FIELDS.
+    budget_request_total = models.DecimalField(
+        max_digits=MAX_DIGITS,
+        decimal_places=2,
+        default=0.00,
+        editable=False
+    )
+    expenses_claimed_total = models.DecimalField(
+        max_digits=MAX_DIGITS,
+        decimal_places=2,
+        default=0.00,
+        editable=False
+    )
+    expenses_authorized_total = models.DecimalField(
+        max_digits=MAX_DIGITS,
+        decimal_places=2,
+        default=0.00,
+        editable=False
+    )
+    blog_posts_total = models.IntegerField(
+        default=0,
+        editable=False
+    )
+    last_expense_number = models.IntegerField(  # Allocated by Expense.save(), see sync_raw_expense_number
+        default=0,
+        editable=False
+    )
+
     # Control
     added = models.DateTimeField(auto_now_add=True)
     approved = models.DateTimeField(
@@ -731,7 +1478,14 @@ class Fund(ModelWithToken):
         blank=True
     )
     updated = models.DateTimeField(auto_now=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(
+        excluded_fields=FUND_DENORMALISED_FIELDS + FUND_COUNTER_FIELDS
+    )
+
+    objects = FundQuerySet.as_manager()
+
+    map_kind = "funds"
+    map_fields = ("lat", "lon")
 
     #: Who is required to approve this request?
     approval_chain = models.CharField(
@@ -760,6 +1514,14 @@ class Fund(ModelWithToken):
             self.required_blog_posts = 0 if self.mandatory else 1
 
         self.url = fix_url(self.url)
+        self.budget_request_total = self.budget_total()
+
+        if not self._state.adding and "update_fields" not in kwargs:
+            # Never overwrite the totals and counters maintained by Expense and Blog with a stale copy.
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in FUND_DENORMALISED_FIELDS + FUND_COUNTER_FIELDS
+            ]
 
         super(Fund, self).save(*args, **kwargs)
 
@@ -769,9 +1531,10 @@ class Fund(ModelWithToken):
             user_agent="lowfat/dev"
         )
         try:
-            location = geolocator.geocode(
-                self.city
-            )
+            with timer("lowfat_geocode_duration_seconds", model="fund"):
+                location = geolocator.geocode(
+                    self.city
+                )
             if location is not None:
                 self.lon = location.longitude
                 self.lat = location.latitude
@@ -792,7 +1555,7 @@ class Fund(ModelWithToken):
     def budget_total(self):
         """Return the sum of all `budget_request`s."""
         return sum(
-            [
+            Decimal(str(budget_request)) for budget_request in [
                 self.budget_request_travel,
                 self.budget_request_attendance_fees,
                 self.budget_request_subsistence_cost,
@@ -804,11 +1567,7 @@ class Fund(ModelWithToken):
 
     def expenses_claimed(self):
         """Return the total amount of expenses claimant."""
-        this_fund_expenses = Expense.objects.filter(
-            fund=self,
-            status__in=["S", "C", "A", "M"]
-        )
-        return sum([expense.amount_claimed for expense in this_fund_expenses])
+        return self.expenses_claimed_total
 
     def expenses_claimed_left(self):
         """Return the total amount left to claimant."""
@@ -816,15 +1575,11 @@ class Fund(ModelWithToken):
 
     def expenses_authorized_for_payment(self):
         """Return the total amount of expenses authorized_for_payment."""
-        this_fund_expenses = Expense.objects.filter(
-            fund=self,
-            status__in=FUND_STATUS_APPROVED_SET
-        )
-        return sum([expense.amount_authorized_for_payment for expense in this_fund_expenses])
+        return self.expenses_authorized_total
 
     def total_of_blog_posts(self):
-        """Return number of blog posts."""
-        return Blog.objects.filter(fund=self).count()
+        """Return number of blog posts not removed."""
+        return self.blog_posts_total
 
     def link(self):
         if self.access_token:
@@ -862,7 +1617,7 @@ class Fund(ModelWithToken):
         self.save()
 
 
-class Expense(ModelWithToken):
+class Expense(FundTotalsMixin, ModelWithToken):
     """This describe one expense for one fund."""
     class Meta:
         app_label = 'lowfat'
@@ -870,6 +1625,13 @@ class Expense(ModelWithToken):
             "-added",
             "relative_number",
         ]
+        unique_together = (
+            ("fund", "relative_number"),
+        )
+        indexes = [
+            models.Index(fields=["status"], name="expense_status_idx"),
+            models.Index(fields=["fund", "status"], name="expense_fund_status_idx"),
+        ]
 
     # Internal
     relative_number = models.IntegerField(
@@ -879,7 +1641,8 @@ class Expense(ModelWithToken):
     invoice_reference = models.CharField(
         max_length=MAX_INVOICE_REFERENCE_LENGTH,
         null=True,
-        blank=True
+        blank=True,
+        unique=True
     )
 
     # Form
@@ -978,32 +1741,50 @@ class Expense(ModelWithToken):
         self.status = "X"
         self.save()
 
+    def fund_totals(self):
+        return {
+            "expenses_claimed_total": Decimal(str(self.amount_claimed)) if self.status in EXPENSE_STATUS_CLAIMED_SET else 0,
+            "expenses_authorized_total": Decimal(str(self.amount_authorized_for_payment)) if self.status in FUND_STATUS_APPROVED_SET else 0,
+        }
+
+    def allocate_relative_number(self):
+        """Take the next number from the fund counter.
+
+        Must run inside the transaction that inserts the expense so the
+        counter is locked until the insert is committed.
+        """
+        funds = Fund.objects.filter(pk=self.fund_id)
+        funds.update(last_expense_number=F("last_expense_number") + 1)
+        self.relative_number = funds.values_list("last_expense_number", flat=True).get()
+
+    def allocate_invoice_reference(self):
+        """Take an invoice reference not used by any other expense."""
+        for _ in range(MAX_INVOICE_REFERENCE_ATTEMPTS):
+            reference = invoice_reference(Sequence.next_value("invoice_reference"))
+            if not Expense.objects.filter(invoice_reference=reference).exists():
+                self.invoice_reference = reference
+                return
+
+        raise IntegrityError("Could not allocate an unused invoice reference.")
+
     def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
-        if self.pk is None:
-            previous_expenses = Expense.objects.filter(fund=self.fund).order_by("-pk")
-            if previous_expenses:
-                self.relative_number = previous_expenses[0].relative_number + 1
-            else:
-                self.relative_number = 1
+        if not self.invoice_reference:
+            self.invoice_reference = None  # Empty references would break the unique constraint.
 
-            if self.fund.mandatory:  # pylint: disable=no-member
-                self.grant_heading = 'I'  # Use of Core fund
-            else:
-                self.grant_heading = self.fund.grant_heading  # pylint: disable=no-member
-            self.grant = self.fund.grant  # pylint: disable=no-member
-
-            if self.invoice:
-                INVOICE_HASH.update(bytes("{} - {} #{}".format(
-                    self.fund.claimant.fullname,  # pylint: disable=no-member
-                    self.fund.title,
-                    self.relative_number
-                ), 'utf-8'))
-                self.invoice_reference = "SSIF-{}-{}".format(
-                    INVOICE_HASH.hexdigest()[0:5],
-                    INVOICE_HASH.hexdigest()[5:9]
-                )
+        with transaction.atomic():
+            if self.pk is None:
+                self.allocate_relative_number()
 
-        super(Expense, self).save(*args, **kwargs)
+                if self.fund.mandatory:  # pylint: disable=no-member
+                    self.grant_heading = 'I'  # Use of Core fund
+                else:
+                    self.grant_heading = self.fund.grant_heading  # pylint: disable=no-member
+                self.grant = self.fund.grant  # pylint: disable=no-member
+
+                if self.invoice:
+                    self.allocate_invoice_reference()
+
+            super(Expense, self).save(*args, **kwargs)
 
     def link(self):
         if self.access_token:
@@ -1015,7 +1796,7 @@ class Expense(ModelWithToken):
         return link
 
     def link_review(self):
-        return reverse("expense_review_relative", args=[self.fund.id, self.relative_number])
+        return reverse("expense_review_relative", args=[self.fund_id, self.relative_number])
 
     def link_claim(self):
         return reverse("expense_claim_relative", args=[self.fund.id, self.relative_number])
@@ -1026,13 +1807,17 @@ class Expense(ModelWithToken):
         )
 
 
-class Blog(ModelWithToken):
+class Blog(FundTotalsMixin, SearchIndexMixin, ModelWithToken):
     """Provide the link to the blog post about the fund."""
     class Meta:
         app_label = 'lowfat'
         ordering = [
             "-added",
         ]
+        indexes = [
+            models.Index(fields=["status"], name="blog_status_idx"),
+            models.Index(fields=["author", "status"], name="blog_author_status_idx"),
+        ]
 
     # Form
     fund = models.ForeignKey(
@@ -1098,10 +1883,17 @@ class Blog(ModelWithToken):
     updated = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
 
+    objects = BlogQuerySet.as_manager()
+
     def remove(self):
         self.status = "X"
         self.save()
 
+    def fund_totals(self):
+        return {
+            "blog_posts_total": 0 if self.status == "X" else 1,
+        }
+
     def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
         self.draft_url = fix_url(self.draft_url)
         self.published_url = fix_url(self.published_url)
@@ -1124,6 +1916,133 @@ class Blog(ModelWithToken):
     def link_review(self):
         return reverse("blog_review", args=[self.id])
 
+
+class ActivityPage:
+    """One page of :class:`ActivityFeed`, newest first."""
+    def __init__(self, actions, older=None, newer=None):
+        self.actions = actions
+        self.older = older
+        self.newer = newer
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class ActivityFeed:
+    """Merged history of claimants, funds, expenses and blog posts.
+
+    The four history tables are merged with a UNION ALL in the database and
+    pages are addressed by a (history_date, kind, history_id) cursor, so the
+    cost of one page does not depend on the size of the history. The kind
+    orders the actions of different tables saved at the same time.
+    """
+    CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+    def __init__(self, page_size=10):
+        self.page_size = page_size
+        self.models = {
+            "claimant": Claimant,
+            "fund": Fund,
+            "expense": Expense,
+            "blog": Blog,
+        }
+
+    @classmethod
+    def cursor(cls, action):
+        return "{}-{}-{}".format(
+            action.history_date.strftime(cls.CURSOR_DATE_FORMAT),
+            action.instance_type._meta.model_name,  # pylint: disable=protected-access
+            action.history_id
+        )
+
+    @classmethod
+    def parse_cursor(cls, cursor):
+        """Return the (history_date, kind, history_id) of cursor or None if it is malformed."""
+        try:
+            history_date, kind, history_id = cursor.split("-")
+            return datetime.strptime(history_date, cls.CURSOR_DATE_FORMAT), kind, int(history_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def _older(kind, cursor):
+        """Filter of the actions of kind older than cursor."""
+        history_date, cursor_kind, history_id = cursor
+        if kind < cursor_kind:
+            return Q(history_date__lte=history_date)
+        if kind == cursor_kind:
+            return Q(history_date__lt=history_date) | Q(history_date=history_date, history_id__lt=history_id)
+        return Q(history_date__lt=history_date)
+
+    @staticmethod
+    def _newer(kind, cursor):
+        """Filter of the actions of kind newer than cursor."""
+        history_date, cursor_kind, history_id = cursor
+        if kind > cursor_kind:
+            return Q(history_date__gte=history_date)
+        if kind == cursor_kind:
+            return Q(history_date__gt=history_date) | Q(history_date=history_date, history_id__gt=history_id)
+        return Q(history_date__gt=history_date)
+
+    def _keys(self, before=None, after=None):
+        querysets = []
+        for kind, model in self.models.items():
+            queryset = model.history.order_by()  # pylint: disable=E1101
+            if before is not None:
+                queryset = queryset.filter(self._older(kind, before))
+            if after is not None:
+                queryset = queryset.filter(self._newer(kind, after))
+            querysets.append(queryset.annotate(
+                activity_kind=Value(kind, output_field=models.CharField())
+            ).values_list("history_date", "history_id", "activity_kind"))
+
+        ordering = ("history_date", "activity_kind", "history_id")
+        if after is None:
+            ordering = tuple("-{}".format(field) for field in ordering)
+        return list(querysets[0].union(*querysets[1:], all=True).order_by(*ordering)[:self.page_size + 1])
+
+    def _actions(self, keys):
+        ids = {}
+        for _, history_id, kind in keys:
+            ids.setdefault(kind, []).append(history_id)
+
+        rows = {}
+        for kind, history_ids in ids.items():
+            for action in self.models[kind].history.filter(
+                    history_id__in=history_ids
+            ).select_related("history_user"):
+                rows[(kind, action.history_id)] = action
+
+        return [rows[(kind, history_id)] for _, history_id, kind in keys]
+
+    def page(self, before=None, after=None):
+        """Return the page older than the before cursor, newer than the after cursor or the newest one."""
+        before = self.parse_cursor(before)
+        after = None if before is not None else self.parse_cursor(after)
+
+        keys = self._keys(before, after)
+        more = len(keys) > self.page_size
+        keys = keys[:self.page_size]
+        if after is not None:
+            keys.reverse()
+
+        actions = self._actions(keys)
+        if not actions:
+            # Stale cursor, e.g. history was pruned.
+            return ActivityPage(actions) if before is None and after is None else self.page()
+
+        has_older = more if after is None else True
+        has_newer = more if after is not None else before is not None
+        return ActivityPage(
+            actions,
+            older=self.cursor(actions[-1]) if has_older else None,
+            newer=self.cursor(actions[0]) if has_newer else None
+        )
+
+
 class GeneralSentMail(models.Model):
     """Emails sent with custom text."""
     class Meta:
@@ -1154,3 +2073,293 @@ class ExpenseSentMail(GeneralSentMail):
 
 class BlogSentMail(GeneralSentMail):
     blog = models.ForeignKey('Blog')
+
+
+class OutboxMessage(models.Model):
+    """Email waiting to be sent by ``manage.py send_outbox``.
+
+    Requests only insert the message, so a slow or failing SMTP server
+    neither delays them nor makes them fail.
+    """
+    class Meta:
+        app_label = 'lowfat'
+        ordering = [
+            "added",
+        ]
+        indexes = [
+            models.Index(fields=["status", "next_attempt"], name="outbox_due_idx"),
+        ]
+
+    subject = models.TextField()
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    from_email = models.CharField(max_length=MAX_CHAR_LENGTH)
+    addresses = models.TextField()  # JSON with the lists "to", "cc", "bcc" and "reply_to"
+    recipient = models.CharField(  # "staff" or "claimant", label of lowfat.metrics
+        max_length=MAX_CHAR_LENGTH
+    )
+
+    # Delivery
+    status = models.CharField(
+        choices=OUTBOX_STATUS,
+        max_length=1,
+        default="P"
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=django.utils.timezone.now)
+    last_error = models.TextField(blank=True)
+
+    # Control
+    added = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    def __str__(self):
+        return "{} ({})".format(self.subject, self.get_status_display())
+
+    @classmethod
+    def from_message(cls, msg, recipient):
+        """Return the unsaved outbox message of msg, an EmailMultiAlternatives."""
+        html = [content for content, mimetype in msg.alternatives if mimetype == "text/html"]
+        return cls(
+            subject=msg.subject,
+            body=msg.body,
+            html=html[0] if html and html[0] else "",
+            from_email=msg.from_email,
+            addresses=json.dumps({
+                "to": msg.to,
+                "cc": msg.cc,
+                "bcc": msg.bcc,
+                "reply_to": msg.reply_to,
+            }),
+            recipient=recipient
+        )
+
+    def message(self, connection=None):
+        """Return the EmailMultiAlternatives to send."""
+        msg = EmailMultiAlternatives(
+            self.subject,
+            self.body,
+            self.from_email,
+            connection=connection,
+            **json.loads(self.addresses)
+        )
+        if self.html:
+            msg.attach_alternative(self.html, "text/html")
+        return msg
+
+    @classmethod
+    def claim(cls, batch_size, now):
+        """Return up to batch_size messages due at now, reserved for this worker.
+
+        Each message is reserved with a conditional update, so concurrent
+        workers never send the same message. A worker that dies leaves its
+        messages to be retried once settings.OUTBOX_LEASE is over.
+        """
+        due = cls.objects.filter(status="P", next_attempt__lte=now)
+        lease = now + timedelta(seconds=settings.OUTBOX_LEASE)
+        claimed = [
+            pk
+            for pk in due.order_by("next_attempt", "id").values_list("id", flat=True)[:batch_size]
+            if due.filter(pk=pk).update(attempts=F("attempts") + 1, next_attempt=lease)
+        ]
+        return list(cls.objects.filter(pk__in=claimed).order_by("next_attempt", "id"))
+
+    def mark_sent(self, now):
+        self.status = "S"
+        self.sent = now
+        self.last_error = ""
+        self.save(update_fields=["status", "sent", "last_error"])
+
+    def mark_failed(self, error, now):
+        """Schedule the next attempt with exponential backoff, or give up after settings.OUTBOX_MAX_ATTEMPTS."""
+        if self.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.status = "D"
+        else:
+            self.next_attempt = now + timedelta(seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1))
+        self.last_error = str(error)
+        self.save(update_fields=["status", "next_attempt", "last_error"])
+
+
+#: Models whose changes invalidate the caches of lowfat.page_cache
+CACHE_VERSIONED_MODELS = (
+    Claimant,
+    Fund,
+    Expense,
+    Blog,
+)
+
+for _model in CACHE_VERSIONED_MODELS:
+    post_save.connect(bump_cache_version, sender=_model)
+    post_delete.connect(bump_cache_version, sender=_model)
+
+
+#: Models published through AccessToken
+MODELS_WITH_TOKEN = (
+    Fund,
+    Expense,
+    Blog,
+)
+
+
+def index_raw_access_token(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save indexing the access token of records saved by loaddata.
+
+    Raw saves skip ModelWithToken.save(), which indexes the other records."""
+    if raw:
+        AccessToken.index(instance)
+
+
+def delete_access_token(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_delete removing the access token of the record from AccessToken."""
+    AccessToken.objects.of_record(instance).delete()
+
+
+for _model in MODELS_WITH_TOKEN:
+    post_save.connect(index_raw_access_token, sender=_model)
+    post_delete.connect(delete_access_token, sender=_model)
+
+
+#: Models whose rows contribute to FUND_DENORMALISED_FIELDS, see FundTotalsMixin
+FUND_TOTALS_MODELS = (
+    Expense,
+    Blog,
+)
+
+
+def store_fund_totals(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of pre_save and pre_delete keeping the contribution of the stored row."""
+    instance._stored_fund_totals = instance.stored_fund_totals()  # pylint: disable=protected-access
+
+
+def save_fund_totals(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save replacing the contribution of the stored row with the one of instance.
+
+    The fund of a raw save, e.g. by loaddata, may already count the row, so
+    its totals are computed again instead."""
+    old = instance._stored_fund_totals  # pylint: disable=protected-access
+    if raw:
+        reconcile_fund_totals({instance.fund_id} | ({old[0]} if old is not None else set()))
+    else:
+        update_fund_totals(old, (instance.fund_id, instance.fund_totals()))
+    instance._stored_fund_totals = None  # pylint: disable=protected-access
+
+
+def delete_fund_totals(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_delete removing the contribution of the deleted row."""
+    update_fund_totals(instance._stored_fund_totals, None)  # pylint: disable=protected-access
+    instance._stored_fund_totals = None  # pylint: disable=protected-access
+
+
+def reconcile_raw_fund_totals(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save computing the totals of a fund saved by loaddata, whose row may hold stale ones."""
+    if raw:
+        reconcile_fund_totals([instance.pk])
+
+
+for _model in FUND_TOTALS_MODELS:
+    pre_save.connect(store_fund_totals, sender=_model)
+    post_save.connect(save_fund_totals, sender=_model)
+    pre_delete.connect(store_fund_totals, sender=_model)
+    post_delete.connect(delete_fund_totals, sender=_model)
+post_save.connect(reconcile_raw_fund_totals, sender=Fund)
+
+
+def sync_raw_expense_number(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save raising Fund.last_expense_number to the expenses saved by loaddata.
+
+    Expense.allocate_relative_number() only increments the counter, which
+    raw saves of funds and expenses do not."""
+    if not raw:
+        return
+
+    fund_id = instance.fund_id if sender is Expense else instance.pk
+    largest = Expense.objects.filter(fund_id=fund_id).aggregate(Max("relative_number"))["relative_number__max"] or 0
+    Fund.objects.filter(pk=fund_id, last_expense_number__lt=largest).update(last_expense_number=largest)
+
+
+for _model in (Fund, Expense):
+    post_save.connect(sync_raw_expense_number, sender=_model)
+
+
+#: Models indexed by lowfat.search, see SearchIndexMixin
+SEARCH_INDEXED_MODELS = (
+    Claimant,
+    Fund,
+    Blog,
+)
+
+
+def index_record(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save adding the record, and the records including it, to the search index."""
+    try:
+        add_to_index(instance)
+    except ObjectDoesNotExist:
+        if not raw:
+            raise
+        # loaddata saved the record before the one its document includes, which indexes it.
+
+
+def unindex_record(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_delete removing the record from the search index."""
+    remove_from_index(instance)
+
+
+for _model in SEARCH_INDEXED_MODELS:
+    post_save.connect(index_record, sender=_model)
+    post_delete.connect(unindex_record, sender=_model)
+
+
+#: Models counted in MapCluster, see MapClusterMixin
+MAP_CLUSTERED_MODELS = (
+    Claimant,
+    Fund,
+)
+
+
+def store_saved_map_location(sender, instance, raw, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of pre_save reading the stored location when the instance does not know it.
+
+    Raw saves, e.g. by loaddata, may replace a stored record. A location
+    neither loaded nor set stays MAP_LOCATION_DEFERRED, it is saved unchanged."""
+    deferred = instance._clustered_location == MAP_LOCATION_DEFERRED  # pylint: disable=protected-access
+    if raw or (deferred and not instance.get_deferred_fields().issuperset(instance.map_fields)):
+        instance._clustered_location = instance.stored_map_location()  # pylint: disable=protected-access
+
+
+def store_deleted_map_location(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of pre_delete reading the stored location of a record loaded without it."""
+    if instance._clustered_location == MAP_LOCATION_DEFERRED:  # pylint: disable=protected-access
+        instance._clustered_location = instance.stored_map_location()  # pylint: disable=protected-access
+
+
+def save_map_location(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_save moving the point of the record in MapCluster."""
+    old = instance._clustered_location  # pylint: disable=protected-access
+    if old == MAP_LOCATION_DEFERRED:
+        return
+
+    new = map_location([getattr(instance, field) for field in instance.map_fields])
+    if new != old:
+        if old is not None:
+            MapCluster.add_point(instance.map_kind, *old, sign=-1)
+        if new is not None:
+            MapCluster.add_point(instance.map_kind, *new)
+    instance._clustered_location = new  # pylint: disable=protected-access
+
+
+def delete_map_location(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Receiver of post_delete removing the point of the record from MapCluster."""
+    old = instance._clustered_location  # pylint: disable=protected-access
+    if old is not None:
+        MapCluster.add_point(instance.map_kind, *old, sign=-1)
+    instance._clustered_location = None  # pylint: disable=protected-access
+
+
+for _model in MAP_CLUSTERED_MODELS:
+    pre_save.connect(store_saved_map_location, sender=_model)
+    post_save.connect(save_map_location, sender=_model)
+    pre_delete.connect(store_deleted_map_location, sender=_model)
+    post_delete.connect(delete_map_location, sender=_model)
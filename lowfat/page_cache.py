@@ -0,0 +1,59 @@
+"""Cache of the public pages and of their heavy fragments.
+
+The cache keys include the version counters of the models a page shows
+(see :func:`lowfat.models.cache_versions`), bumped when a transaction saving
+or deleting their records commits, so a page is served from the cache until
+one of its records changes. They also include the current hour because some
+pages depend on the date, e.g. the upcoming events.
+"""
+import functools
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import cache_versions
+
+#: Seconds a page or fragment is kept, the cache key changes every hour anyway
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+
+def cache_stamp(*model_names):
+    return "{}-{}".format(
+        cache_versions(*model_names),
+        timezone.now().strftime("%Y%m%d%H")
+    )
+
+
+def page_key(request, stamp):
+    return "lowfat.page.{}.{}".format(
+        hashlib.md5(bytes(request.get_full_path(), 'utf-8')).hexdigest(),
+        stamp
+    )
+
+
+def cache_page_versions(*model_names, anonymous_only=True):
+    """Cache the responses of the view until a record of model_names changes.
+
+    The stamp of the cache is also available to the template as
+    ``request.cache_stamp`` to key fragments with ``{% cache %}``. With
+    anonymous_only, the pages of signed in users, which include their
+    name and permissions, are not cached."""
+    def decorator(view):
+        @functools.wraps(view)
+        def cached_view(request, *args, **kwargs):
+            request.cache_stamp = cache_stamp(*model_names)
+            cacheable = request.method in ("GET", "HEAD") and not get_messages(request)
+            if not cacheable or (anonymous_only and request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, request.cache_stamp)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, response, PAGE_CACHE_TIMEOUT)
+            return response
+        return cached_view
+    return decorator
@@ -0,0 +1,85 @@
+"""ZIP archive of the photos of the fellows.
+
+The archive is streamed to the response, reading each photo from the disk
+by chunks, so a download never holds more than one chunk in memory. Only
+the list of photos, with their size and modification time, is cached. It
+is keyed by the version of the claimants, changed by every saved photo.
+"""
+from functools import partial
+import hashlib
+import os
+import time
+import zipfile
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .models import Claimant, cache_versions
+
+PHOTOS_CACHE_TIMEOUT = 24 * 60 * 60
+
+#: Bytes of a photo read and sent at once
+PHOTOS_CHUNK_SIZE = 64 * 1024
+
+
+def fellows_photos():
+    """Return the (member name, path, size, modification time) of the photo of every fellow."""
+    key = "lowfat.photos.{}".format(cache_versions("claimant"))
+    photos = cache.get(key)
+    if photos is not None:
+        return photos
+
+    photos = []
+    fellows = Claimant.objects.filter(fellow=True).exclude(photo="").exclude(photo=None)
+    for slug, photo in fellows.order_by("slug").values_list("slug", "photo"):
+        path = default_storage.path(photo)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        photos.append(("{}.jpg".format(slug), path, stat.st_size, int(stat.st_mtime)))
+    cache.set(key, photos, PHOTOS_CACHE_TIMEOUT)
+    return photos
+
+
+def photos_etag(photos):
+    return hashlib.md5(bytes(repr(photos), 'utf-8')).hexdigest()
+
+
+class ChunkWriter:
+    """Write only file object collecting what ZipFile writes until it is yielded."""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(photos):
+    """Yield the ZIP archive of photos by chunks of at most PHOTOS_CHUNK_SIZE bytes of each photo."""
+    writer = ChunkWriter()
+    # JPEG do not shrink when deflated.
+    with zipfile.ZipFile(writer, "w", zipfile.ZIP_STORED) as archive:
+        for name, path, size, mtime in photos:
+            try:
+                photo = open(path, "rb")
+            except FileNotFoundError:
+                continue  # Removed since the list was made.
+
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.file_size = size
+            with photo, archive.open(info, "w") as member:
+                for chunk in iter(partial(photo.read, PHOTOS_CHUNK_SIZE), b""):
+                    member.write(chunk)
+                    yield writer.pop()
+            yield writer.pop()
+    yield writer.pop()
@@ -0,0 +1,118 @@
+"""Count the SQL queries of each request and spot N+1 patterns.
+
+Enabled by the QUERY_PROFILER setting, off by default because recording
+the queries costs time and memory on every request.
+"""
+from collections import defaultdict, deque
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+FINGERPRINT_SUBSTITUTIONS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # Strings
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),  # Numbers
+    (re.compile(r"\bIN \([^)]*\)"), "IN (...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def fingerprint(sql):
+    """Return sql without its literal values, the same for every run of one query of the code."""
+    for pattern, replacement in FINGERPRINT_SUBSTITUTIONS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class RequestProfile:
+    """Queries of one request."""
+    def __init__(self, view, queries):
+        self.view = view
+        self.count = len(queries)
+        self.time = sum(float(query["time"]) for query in queries)
+
+        fingerprints = defaultdict(int)
+        for query in queries:
+            fingerprints[fingerprint(query["sql"])] += 1
+        # Same query run again and again with other values, usually from a loop over the rows of another query.
+        self.repeated = sorted(
+            [
+                (count, sql)
+                for sql, count in fingerprints.items()
+                if count >= settings.QUERY_PROFILER_REPEAT_THRESHOLD
+            ],
+            reverse=True
+        )
+
+
+class ProfileStore:
+    """Last QUERY_PROFILER_WINDOW profiles of each view of this process."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = defaultdict(deque)
+
+    def add(self, profile):
+        with self.lock:
+            profiles = self.profiles[profile.view]
+            profiles.append(profile)
+            while len(profiles) > settings.QUERY_PROFILER_WINDOW:
+                profiles.popleft()
+
+    def clear(self):
+        with self.lock:
+            self.profiles.clear()
+
+    def summary(self):
+        """Return one dictionary per view, the views with most queries first."""
+        with self.lock:
+            profiles = {view: list(view_profiles) for view, view_profiles in self.profiles.items()}
+
+        summary = []
+        for view, view_profiles in profiles.items():
+            summary.append({
+                "view": view,
+                "requests": len(view_profiles),
+                "queries_mean": sum(profile.count for profile in view_profiles) / len(view_profiles),
+                "queries_max": max(profile.count for profile in view_profiles),
+                "time_mean": 1000 * sum(profile.time for profile in view_profiles) / len(view_profiles),
+                "n_plus_one": sum(1 for profile in view_profiles if profile.repeated),
+            })
+        return sorted(summary, key=lambda row: row["queries_mean"], reverse=True)
+
+
+PROFILES = ProfileStore()
+
+
+class QueryProfilerMiddleware:
+    """Record the number, time and repeated fingerprints of the queries of each request."""
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILER:
+            raise MiddlewareNotUsed("QUERY_PROFILER is off.")
+        self.get_response = get_response
+
+    def __call__(self, request):
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        # The log keeps only the last queries_limit queries, an offset into it is wrong once it is full.
+        connection.queries_log.clear()
+        try:
+            response = self.get_response(request)
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+        queries = list(connection.queries_log)
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else request.path
+        profile = RequestProfile(view, queries)
+        PROFILES.add(profile)
+
+        for count, sql in profile.repeated:
+            logger.warning("Possible N+1 in %s: %d times %s", view, count, sql)
+        logger.debug("%s ran %d queries in %.1f ms", view, profile.count, 1000 * profile.time)
+
+        return response
@@ -0,0 +1,179 @@
+"""Full text search over claimants, funds and blog posts.
+
+On SQLite each model has an FTS5 table whose rowid is the primary key of the
+record, kept up to date by :class:`lowfat.models.SearchIndexMixin`. Other
+database backends fall back to ``LIKE`` lookups.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+SEARCH_LIMIT = 50
+
+
+class SearchIndex:
+    """FTS5 table indexing one model."""
+    def __init__(self, table, columns, document, source, lookups, dependents=None):  # pylint: disable=too-many-arguments
+        self.table = table
+        self.columns = columns
+        # Return the values of columns for one instance.
+        self.document = document
+        # SELECT returning the rowid and columns of every record, used to (re)build the table.
+        self.source = source
+        # Field lookups of columns used when FTS5 is not available.
+        self.lookups = lookups
+        # Return the instances whose document include this instance.
+        self.dependents = dependents
+
+    def rebuild_sql(self):
+        return "INSERT INTO {} (rowid, {}) {}".format(
+            self.table,
+            ", ".join(self.columns),
+            self.source
+        )
+
+
+CLAIMANT_COLUMNS = (
+    "forenames",
+    "surname",
+    "email",
+    "research_area",
+    "affiliation",
+    "work_description",
+    "website",
+    "github",
+    "twitter",
+)
+
+INDEXES = {
+    "claimant": SearchIndex(
+        "lowfat_claimant_search",
+        CLAIMANT_COLUMNS,
+        lambda claimant: [getattr(claimant, column) for column in CLAIMANT_COLUMNS],
+        "SELECT id, {} FROM lowfat_claimant".format(", ".join(CLAIMANT_COLUMNS)),
+        CLAIMANT_COLUMNS,
+        lambda claimant: claimant.fund_set.select_related("claimant")
+    ),
+    "fund": SearchIndex(
+        "lowfat_fund_search",
+        ("claimant", "title", "url", "justification", "additional_info"),
+        lambda fund: [
+            fund.claimant.fullname(),
+            fund.title,
+            fund.url,
+            fund.justification,
+            fund.additional_info,
+        ],
+        """SELECT lowfat_fund.id, lowfat_claimant.forenames || ' ' || lowfat_claimant.surname,
+                  lowfat_fund.title, lowfat_fund.url, lowfat_fund.justification, lowfat_fund.additional_info
+           FROM lowfat_fund INNER JOIN lowfat_claimant ON lowfat_fund.claimant_id = lowfat_claimant.id""",
+        ("claimant__forenames", "claimant__surname", "title", "url", "justification", "additional_info")
+    ),
+    "blog": SearchIndex(
+        "lowfat_blog_search",
+        ("title",),
+        lambda blog: [blog.title],
+        "SELECT id, title FROM lowfat_blog",
+        ("title",)
+    ),
+}
+
+
+def is_enabled():
+    return connection.vendor == "sqlite"
+
+
+def match_expression(text):
+    """Return the FTS5 query matching the records with all the words of text as prefix."""
+    return " ".join('"{}"*'.format(word) for word in re.findall(r"\w+", text or ""))
+
+
+def add_to_index(instance):
+    """Add or replace instance, and the records including it, in the index."""
+    if not is_enabled():
+        return
+
+    search_index = INDEXES[instance._meta.model_name]  # pylint: disable=protected-access
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {} WHERE rowid = %s".format(search_index.table),
+            [instance.pk]
+        )
+        cursor.execute(
+            "INSERT INTO {} (rowid, {}) VALUES (%s, {})".format(
+                search_index.table,
+                ", ".join(search_index.columns),
+                ", ".join(["%s"] * len(search_index.columns))
+            ),
+            [instance.pk] + search_index.document(instance)
+        )
+
+    if search_index.dependents is not None:
+        for dependent in search_index.dependents(instance):
+            add_to_index(dependent)
+
+
+def remove_from_index(instance):
+    if not is_enabled():
+        return
+
+    search_index = INDEXES[instance._meta.model_name]  # pylint: disable=protected-access
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {} WHERE rowid = %s".format(search_index.table),
+            [instance.pk]
+        )
+
+
+def rebuild_index():
+    """Rebuild every index from the tables."""
+    if not is_enabled():
+        return
+
+    with connection.cursor() as cursor:
+        for search_index in INDEXES.values():
+            cursor.execute("DELETE FROM {}".format(search_index.table))
+            cursor.execute(search_index.rebuild_sql())
+
+
+def _search_substring(queryset, search_index, text, limit):
+    query = Q()
+    for lookup in search_index.lookups:
+        query |= Q(**{"{}__contains".format(lookup): text})
+    return list(queryset.filter(query)[:limit])
+
+
+def search_records(queryset, text, limit=SEARCH_LIMIT):
+    """Return the records of queryset matching text, best match first.
+
+    With FTS5, records match when each word of text starts a word of the
+    record, e.g. "lov" finds "Lovelace". When no record matches, text is
+    looked for anywhere in the fields as without FTS5, e.g. "son" finds
+    "Wilson" unless a word of another record starts with "son".
+    """
+    expression = match_expression(text)
+    if not expression:
+        return []
+
+    search_index = INDEXES[queryset.model._meta.model_name]  # pylint: disable=protected-access
+    if not is_enabled():
+        return _search_substring(queryset, search_index, text, limit)
+
+    sql = "SELECT rowid FROM {0} WHERE {0} MATCH %s".format(search_index.table)
+    params = [expression]
+    if queryset.query.where:
+        # Restrict before the LIMIT so records outside queryset do not take the places.
+        restriction, restriction_params = queryset.order_by().values("pk").query.sql_with_params()
+        sql += " AND rowid IN ({})".format(restriction)
+        params.extend(restriction_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql + " ORDER BY rank LIMIT %s", params + [limit])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    if not ids:
+        return _search_substring(queryset, search_index, text, limit)
+
+    records = queryset.in_bulk(ids)
+    return [records[pk] for pk in ids if pk in records]
@@ -63,6 +63,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lowfat.metrics.MetricsMiddleware',
+    'lowfat.profiler.QueryProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,6 +121,36 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Public pages, calendar and map are cached per process, see lowfat/page_cache.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lowfat',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
+
+# Query profiler
+# Record the SQL queries of each request, see lowfat/profiler.py. Keep it off in production.
+
+QUERY_PROFILER = False
+QUERY_PROFILER_REPEAT_THRESHOLD = 5  # Runs of the same query in one request reported as N+1
+QUERY_PROFILER_WINDOW = 100  # Requests per view kept for the summary in the staff page
+
+
+# Metrics
+# SQLite database shared by the processes to aggregate the metrics of lowfat/metrics.py,
+# e.g. os.path.join(BASE_DIR, 'metrics.sqlite3'). None disables them.
+
+METRICS_DATABASE = None
+
+
 # Logging
 # https://docs.djangoproject.com/en/1.11/ref/settings/#logging
 
@@ -249,6 +281,11 @@ ADMINS = [
 # Subject-line prefix for email messages sent
 EMAIL_SUBJECT_PREFIX = ""
 
+# Emails are queued in lowfat.models.OutboxMessage and sent by manage.py send_outbox.
+OUTBOX_MAX_ATTEMPTS = 8  # Failed attempts before a message is dead
+OUTBOX_RETRY_DELAY = 60  # Seconds before the first retry, doubled after each failure
+OUTBOX_LEASE = 600  # Seconds a worker owns the messages it is sending
+
 
 # Backup
 DBBACKUP_STORAGE = 'django.core.files.storage.FileSystemStorage'
@@ -0,0 +1,16 @@
+from django import template
+
+register = template.Library()  # pylint: disable=invalid-name
+
+@register.simple_tag(takes_context=True)
+def query_string(context, *pairs):
+    """Query string of the current request with the parameters of the (name, value) pairs replaced.
+
+    A value of None removes the parameter, e.g. to go back to the first page."""
+    query = context["request"].GET.copy()
+    for name, value in zip(pairs[::2], pairs[1::2]):
+        if value is None:
+            query.pop(name, None)
+        else:
+            query[name] = value
+    return "?{}".format(query.urlencode())
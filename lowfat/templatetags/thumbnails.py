@@ -0,0 +1,15 @@
+from django import template
+
+from ..thumbnails import thumbnail_url
+
+register = template.Library()  # pylint: disable=invalid-name
+
+@register.inclusion_tag("lowfat/photo.html")
+def photo(claimant, size, css_class=""):
+    """Picture of the photo of claimant with the WebP and JPEG variants of size, or the original."""
+    return {
+        "claimant": claimant,
+        "css_class": css_class,
+        "webp": thumbnail_url(claimant.photo, size, "webp"),
+        "jpg": thumbnail_url(claimant.photo, size, "jpg") or claimant.photo.url,
+    }
@@ -1530,3 +1530,44 @@ class BlogReviewFormTest(TestCase):
 
         form = BlogReviewForm(data)
         self.assertTrue(form.is_valid())
+
+
+class AutocompleteWidgetTest(TestCase):
+    def setUp(self):
+        self.claimants = [
+            Claimant.objects.create(
+                forenames="Claimant",
+                surname="{:03}".format(i),
+                home_city="L",
+                phone=0
+            )
+            for i in range(AUTOCOMPLETE_PRELOAD + 10)
+        ]
+
+    @staticmethod
+    def render_claimant(**kwargs):
+        form = FundForm(is_staff=True, **kwargs)
+        return str(form["claimant"])
+
+    def test_preload(self):
+        html = self.render_claimant()
+
+        self.assertEqual(html.count("<option"), AUTOCOMPLETE_PRELOAD + 1)
+        self.assertIn('data-autocomplete-url="/autocomplete/claimant/"', html)
+
+    def test_selected(self):
+        claimant = Claimant.objects.order_by("-id")[0]
+        html = self.render_claimant(initial={"claimant": claimant.id})
+
+        self.assertEqual(html.count("<option"), AUTOCOMPLETE_PRELOAD + 2)
+        self.assertIn('<option value="{}" selected>'.format(claimant.id), html)
+
+    def test_constant_queries(self):
+        with self.assertNumQueries(1):
+            self.render_claimant()
+
+        for i in range(10):
+            Claimant.objects.create(forenames="More", surname=str(i), home_city="L", phone=0)
+
+        with self.assertNumQueries(1):
+            self.render_claimant()
@@ -1,6 +1,39 @@
-from django.test import TestCase
+from contextlib import closing, redirect_stdout
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import io
+import os
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock, skipIf
 
-from .models import Claimant, fix_url
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.core import mail, serializers
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .email_templates import EMAIL_TEMPLATE_REVISION_TTL, email_template, html2text_fix
+from .jobs.daily import tokens
+from .mail import mail_staffs, send_outbox
+from .search import INDEXES, search_records
+from .thumbnails import THUMBNAIL_SIZES, Image, thumbnail_name, thumbnail_url
+from .testwrapper import create_bare_claimant, create_bare_fund, load_fixture
+from .models import (
+    MAX_INVOICE_REFERENCE_LENGTH, MAX_MAP_ZOOM, MODELS_WITH_TOKEN, AccessToken, ActivityFeed, Blog, BlogSentMail,
+    Claimant, Expense, ExpenseSentMail, Fund, FundSentMail, GeneralSentMail, MapCluster, OutboxMessage, Sequence,
+    cache_version_name, fix_url, invoice_reference, map_cell
+)
 
 class FixURLTest(TestCase):
     def test_none(self):
@@ -36,18 +69,975 @@ class FixURLTest(TestCase):
 
 class ClaimantSlugTest(TestCase):
     def test_same_name(self):
-        claimant1 = Claimant.objects.create(
-            forenames='First Person',
-            surname='Test',
+        claimant1 = create_bare_claimant(forenames='First Person')
+        claimant2 = create_bare_claimant(forenames='Second Person')
+
+        self.assertNotEqual(claimant1.slug, claimant2.slug)
+
+    @staticmethod
+    def create_claimant():
+        return create_bare_claimant(forenames='Same', surname='Name')
+
+    def test_sequence(self):
+        slugs = [self.create_claimant().slug for _ in range(4)]
+
+        self.assertEqual(slugs, ['same-name', 'same-name-0', 'same-name-1', 'same-name-2'])
+
+    def test_reuse_free_suffix(self):
+        claimants = [self.create_claimant() for _ in range(3)]
+        claimants[1].delete()
+
+        self.assertEqual(self.create_claimant().slug, 'same-name-0')
+
+    def test_constant_number_of_queries(self):
+        for _ in range(10):
+            self.create_claimant()
+
+        claimant = Claimant(forenames='Same', surname='Name')
+        with self.assertNumQueries(1):
+            self.assertEqual(claimant.slug_generator(), 'same-name-9')
+
+    def test_retry_when_slug_is_taken(self):
+        self.create_claimant()
+        claimant = Claimant(
+            forenames='Same',
+            surname='Name',
             home_city='Testville',
             phone=0
         )
 
-        claimant2 = Claimant.objects.create(
-            forenames='Second Person',
-            surname='Test',
-            home_city='Testville',
+        # Simulate another process taking the slug after it was generated
+        with mock.patch.object(Claimant, 'slug_generator', side_effect=['same-name', 'same-name-0']):
+            claimant.save()
+
+        self.assertEqual(claimant.slug, 'same-name-0')
+
+
+class ClaimantLedgerTest(TestCase):
+    def setUp(self):
+        self.claimant = create_bare_claimant(forenames='Ledger', claimantship_grant=3000)
+
+    def add_fund(self, budget_approved, amount_claimed):
+        fund = create_bare_fund(self.claimant, status='A', budget_approved=budget_approved)
+        Expense.objects.create(
+            fund=fund,
+            amount_claimed=amount_claimed,
+            status='A',
+            claim='fake-claim.pdf'
+        )
+
+    def test_values(self):
+        self.add_fund(500, 100)
+        self.add_fund(250, 50)
+
+        ledger = Claimant.objects.get(pk=self.claimant.pk).ledger
+
+        self.assertEqual(ledger.committed, Decimal('600.00'))
+        self.assertEqual(ledger.spent, Decimal('150.00'))
+        self.assertEqual(ledger.available, Decimal('2250.00'))
+        self.assertEqual(ledger.passed, 0)
+
+    def test_constant_number_of_queries(self):
+        for number_of_funds in (1, 5, 20):
+            while Fund.objects.filter(claimant=self.claimant).count() < number_of_funds:
+                self.add_fund(100, 10)
+
+            claimant = Claimant.objects.get(pk=self.claimant.pk)
+            with self.assertNumQueries(1):
+                claimant.claimantship_available()
+                claimant.claimantship_passed()
+                claimant.claimantship_committed()
+                claimant.claimantship_spent()
+
+    def test_with_finances(self):
+        self.add_fund(500, 100)
+
+        claimant = Claimant.objects.with_finances().get(pk=self.claimant.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(claimant.claimantship_available(), Decimal('2500.00'))
+
+
+class FundTotalsTest(TestCase):
+    def setUp(self):
+        self.fund = create_bare_fund(status='A', budget_request_travel=100, budget_request_others=50)
+
+    def stored_fund(self):
+        return Fund.objects.get(pk=self.fund.pk)
+
+    def test_budget_request_total(self):
+        self.assertEqual(self.stored_fund().budget_request_total, Decimal('150.00'))
+
+    def test_expense_lifecycle(self):
+        expense = Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='100.00',
+            claim='fake-claim.pdf'
+        )
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('100.00'))
+        self.assertEqual(self.stored_fund().expenses_authorized_for_payment(), Decimal('0.00'))
+
+        expense.status = 'A'
+        expense.amount_authorized_for_payment = '80.00'
+        expense.save()
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('100.00'))
+        self.assertEqual(self.stored_fund().expenses_authorized_for_payment(), Decimal('80.00'))
+
+        expense.remove()
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('0.00'))
+        self.assertEqual(self.stored_fund().expenses_authorized_for_payment(), Decimal('0.00'))
+
+    def test_blog_lifecycle(self):
+        blog = Blog.objects.create(
+            fund=self.fund,
+            draft_url='http://software.ac.uk'
+        )
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 1)
+
+        blog.remove()
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 0)
+
+        blog.status = 'U'
+        blog.save()
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 1)
+
+        blog.delete()
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 0)
+
+    def test_fund_save_keeps_totals(self):
+        stale_fund = self.stored_fund()
+        Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='100.00',
+            claim='fake-claim.pdf'
+        )
+
+        stale_fund.title = 'New title'
+        stale_fund.save()
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('100.00'))
+
+    def test_reconcile_fund_totals(self):
+        Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='100.00',
+            claim='fake-claim.pdf'
+        )
+        Fund.objects.filter(pk=self.fund.pk).update(expenses_claimed_total=0, blog_posts_total=3)
+
+        with self.assertRaises(CommandError):
+            with redirect_stdout(io.StringIO()):
+                call_command('reconcile_fund_totals', check=True)
+
+        with redirect_stdout(io.StringIO()):
+            call_command('reconcile_fund_totals')
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('100.00'))
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 0)
+
+    def test_queryset_delete(self):
+        Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='100.00',
+            claim='fake-claim.pdf'
+        )
+        Blog.objects.create(
+            fund=self.fund,
+            draft_url='http://software.ac.uk'
+        )
+
+        Expense.objects.filter(fund=self.fund).delete()
+        Blog.objects.filter(fund=self.fund).delete()
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('0.00'))
+        self.assertEqual(self.stored_fund().total_of_blog_posts(), 0)
+
+    def test_raw_save(self):
+        expense = Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='100.00',
+            claim='fake-claim.pdf'
+        )
+        Fund.objects.filter(pk=self.fund.pk).update(expenses_claimed_total=0)  # A stale dump
+        fixture = serializers.serialize("json", [self.stored_fund(), expense])
+        for deserialized in serializers.deserialize("json", fixture):
+            deserialized.save()  # As loaddata does
+
+        self.assertEqual(self.stored_fund().expenses_claimed(), Decimal('100.00'))
+
+
+def indexed_ids(model):
+    """Return the primary keys of the records of model in the search index."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT rowid FROM {} ORDER BY rowid".format(INDEXES[model._meta.model_name].table))  # pylint: disable=protected-access
+        return [row[0] for row in cursor.fetchall()]
+
+
+class FixtureTest(TestCase):
+    """Records of fixtures/demo.json, saved raw as loaddata does."""
+    def setUp(self):
+        load_fixture("demo.json")
+
+    def test_fund_totals(self):
+        with redirect_stdout(io.StringIO()):
+            call_command('reconcile_fund_totals', check=True)
+        self.assertTrue(Fund.objects.filter(expenses_claimed_total__gt=0).exists())
+        self.assertTrue(Fund.objects.filter(blog_posts_total__gt=0).exists())
+
+    @skipIf(connection.vendor != 'sqlite', "The search index uses SQLite FTS5.")
+    def test_search_index(self):
+        for model in (Claimant, Fund, Blog):
+            self.assertEqual(indexed_ids(model), list(model.objects.order_by("pk").values_list("pk", flat=True)))
+
+    def test_map_clusters(self):
+        clusters = MapCluster.objects.filter(zoom=0).aggregate(Sum("claimants"), Sum("funds"))
+
+        self.assertEqual(clusters["claimants__sum"], Claimant.objects.exclude(home_lat=None).exclude(home_lon=None).count())
+        self.assertEqual(clusters["funds__sum"], Fund.objects.exclude(lat=None).exclude(lon=None).count())
+        self.assertGreater(clusters["funds__sum"], 0)
+
+    def test_expense_number(self):
+        fund = Fund.objects.annotate(expenses=Count("expense")).filter(expenses__gt=0).first()
+        expense = Expense.objects.create(
+            fund=fund,
+            amount_claimed='10.00',
+            claim='fake-claim.pdf'
+        )
+
+        self.assertEqual(expense.relative_number, fund.expenses + 1)
+
+
+class ExpenseNumberTest(TestCase):
+    def setUp(self):
+        self.fund = create_bare_fund()
+
+    def create_expense(self):
+        return Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='10.00',
+            claim='fake-claim.pdf'
+        )
+
+    def test_sequence(self):
+        numbers = [self.create_expense().relative_number for _ in range(3)]
+
+        self.assertEqual(numbers, [1, 2, 3])
+
+    def test_number_not_reused(self):
+        self.create_expense()
+        self.create_expense().delete()
+
+        self.assertEqual(self.create_expense().relative_number, 3)
+
+    def test_fund_save_keeps_counter(self):
+        stale_fund = Fund.objects.get(pk=self.fund.pk)
+        self.create_expense()
+        stale_fund.save()
+
+        self.assertEqual(self.create_expense().relative_number, 2)
+
+    def test_unique_number(self):
+        expense = self.create_expense()
+        duplicate = Expense(
+            fund=self.fund,
+            amount_claimed='10.00',
+            claim='fake-claim.pdf',
+            relative_number=expense.relative_number
+        )
+
+        with self.assertRaises(IntegrityError):
+            # Bypass Expense.save() that would allocate a new number
+            Expense.objects.bulk_create([duplicate])
+
+
+class ExpenseNumberConcurrencyTest(TransactionTestCase):
+    """Expenses submitted at the same time for the same fund must get different numbers."""
+    THREADS = 8
+    ATTEMPTS = 100
+
+    def setUp(self):
+        self.fund = create_bare_fund()
+
+        self.settings_dict = connection.settings_dict
+        self.directory = None
+        if connection.vendor == 'sqlite':
+            # The in memory test database ignores WAL, so the threads use a file copy of it.
+            self.directory = tempfile.TemporaryDirectory()
+            self.settings_dict = dict(connection.settings_dict, NAME=os.path.join(self.directory.name, "wal.sqlite3"))
+            connection.ensure_connection()
+            with closing(sqlite3.connect(self.settings_dict["NAME"])) as copy:
+                connection.connection.backup(copy)
+                self.assertEqual(copy.execute("PRAGMA journal_mode=WAL").fetchone()[0], "wal")
+
+    def tearDown(self):
+        if self.directory is not None:
+            self.directory.cleanup()
+
+    def in_thread(self, function, *args):
+        """Run function in a thread with its own connection, to the copy on SQLite."""
+        def target():
+            connections['default'].settings_dict = self.settings_dict
+            try:
+                function(*args)
+            finally:
+                connections.close_all()
+        return threading.Thread(target=target)
+
+    def submit_expense(self, barrier, numbers, errors):
+        try:
+            barrier.wait()
+            for _ in range(self.ATTEMPTS):
+                try:
+                    expense = Expense.objects.create(
+                        fund_id=self.fund.pk,
+                        amount_claimed='10.00',
+                        claim='fake-claim.pdf'
+                    )
+                    numbers.append(expense.relative_number)
+                    return
+                except OperationalError:
+                    # SQLite allows one writer at a time, the others see the database locked.
+                    time.sleep(0.01)
+            errors.append("Database locked after {} attempts".format(self.ATTEMPTS))
+        except Exception as exception:  # pylint: disable=broad-except
+            errors.append(exception)
+
+    def read_counter(self, counters):
+        counters.append(Fund.objects.get(pk=self.fund.pk).last_expense_number)
+
+    def test_parallel_submissions(self):
+        barrier = threading.Barrier(self.THREADS)
+        numbers = []
+        errors = []
+        threads = [
+            self.in_thread(self.submit_expense, barrier, numbers, errors)
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(numbers), list(range(1, self.THREADS + 1)))
+        counters = []
+        reader = self.in_thread(self.read_counter, counters)
+        reader.start()
+        reader.join()
+        self.assertEqual(counters, [self.THREADS])
+
+
+class InvoiceReferenceTest(TestCase):
+    def setUp(self):
+        self.fund = create_bare_fund()
+
+    def create_expense(self, invoice=True):
+        return Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='10.00',
+            claim='fake-claim.pdf',
+            invoice=invoice
+        )
+
+    def test_deterministic(self):
+        expense = self.create_expense()
+
+        self.assertEqual(expense.invoice_reference, invoice_reference(1))
+        self.assertEqual(len(expense.invoice_reference), MAX_INVOICE_REFERENCE_LENGTH)
+        self.assertRegex(expense.invoice_reference, r'^SSIF-[0-9a-f]{5}-[0-9a-f]{4}$')
+
+    def test_without_invoice(self):
+        expense = self.create_expense(invoice=False)
+
+        self.assertIsNone(expense.invoice_reference)
+        self.assertIsNone(self.create_expense(invoice=False).invoice_reference)
+
+    def test_unique(self):
+        references = {self.create_expense().invoice_reference for _ in range(5)}
+
+        self.assertEqual(len(references), 5)
+
+    def test_collision(self):
+        expense = self.create_expense(invoice=False)
+        expense.invoice_reference = invoice_reference(2)
+        expense.save()
+
+        self.assertEqual(self.create_expense().invoice_reference, invoice_reference(1))
+        self.assertEqual(self.create_expense().invoice_reference, invoice_reference(3))
+
+
+class AccessTokenTest(TestCase):
+    def setUp(self):
+        self.fund = create_bare_fund()
+        self.fund.new_access_token()
+
+    def test_indexed(self):
+        token = AccessToken.objects.get()
+
+        self.assertEqual(token.content_object, self.fund)
+        self.assertEqual(token.expire_date, self.fund.access_token_expire_date)
+        self.assertNotEqual(token.token_hash, self.fund.access_token)
+        self.assertEqual(Fund.from_access_token(self.fund.access_token), self.fund)
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Fund.from_access_token(self.fund.access_token), self.fund)
+
+    def test_other_model(self):
+        self.assertIsNone(Expense.from_access_token(self.fund.access_token))
+        self.assertIsNone(Fund.from_access_token("0" * 32))
+
+    def test_new_token(self):
+        old_token = self.fund.access_token
+        self.fund.new_access_token()
+
+        self.assertEqual(AccessToken.objects.count(), 1)
+        self.assertIsNone(Fund.from_access_token(old_token))
+        self.assertEqual(Fund.from_access_token(self.fund.access_token), self.fund)
+
+    def test_unchanged_token(self):
+        fund = Fund.objects.get(pk=self.fund.pk)
+        fund.title = 'Renamed'
+        with mock.patch.object(AccessToken, 'index') as index:
+            fund.save()
+
+        index.assert_not_called()
+
+    def test_expired(self):
+        fund = Fund.objects.get(pk=self.fund.pk)
+        fund.access_token_expire_date = date.today()
+        fund.save()
+
+        self.assertFalse(fund.access_token_is_valid())
+        self.assertIsNone(Fund.from_access_token(fund.access_token))
+
+    def test_purge(self):
+        expense = Expense.objects.create(
+            fund=self.fund,
+            amount_claimed='10.00',
+            claim='fake-claim.pdf'
+        )
+        expense.new_access_token()
+        AccessToken.objects.of_record(self.fund).update(expire_date=date.today() - timedelta(days=1))
+
+        with redirect_stdout(io.StringIO()):
+            tokens.Job().execute()
+
+        self.assertEqual(list(AccessToken.objects.all()), [AccessToken.objects.of_record(expense).get()])
+
+    def test_delete(self):
+        self.fund.delete()
+
+        self.assertFalse(AccessToken.objects.exists())
+
+    def test_raw_save(self):
+        fixture = serializers.serialize("json", [self.fund])
+        AccessToken.objects.all().delete()
+        for deserialized in serializers.deserialize("json", fixture):
+            deserialized.save()  # As loaddata does
+
+        self.assertEqual(Fund.from_access_token(self.fund.access_token), self.fund)
+
+    def test_rebuild(self):
+        AccessToken.objects.all().delete()
+        with redirect_stdout(io.StringIO()):
+            call_command("rebuild_access_tokens")
+
+        self.assertEqual(Fund.from_access_token(self.fund.access_token), self.fund)
+
+
+class ActivityFeedTest(TestCase):
+    def setUp(self):
+        self.claimant = create_bare_claimant(forenames='Activity')
+        for i in range(4):
+            fund = create_bare_fund(self.claimant, title='Fund {}'.format(i))
+            Blog.objects.create(
+                fund=fund,
+                author=self.claimant,
+                draft_url='http://software.ac.uk'
+            )
+
+    @staticmethod
+    def expected():
+        actions = []
+        for model in (Claimant, Fund, Expense, Blog):
+            actions.extend(model.history.all())  # pylint: disable=no-member
+        actions.sort(
+            key=lambda action: (action.history_date, action.instance_type._meta.model_name, action.history_id),  # pylint: disable=protected-access
+            reverse=True
+        )
+        return [(type(action), action.history_id) for action in actions]
+
+    @staticmethod
+    def keys(page):
+        return [(type(action), action.history_id) for action in page]
+
+    def test_pages(self):
+        feed = ActivityFeed(page_size=3)
+        expected = self.expected()
+
+        pages = [feed.page()]
+        self.assertIsNone(pages[0].newer)
+        while pages[-1].older is not None:
+            pages.append(feed.page(before=pages[-1].older))
+
+        self.assertEqual(sum((self.keys(page) for page in pages), []), expected)
+        self.assertEqual(len(pages), (len(expected) + 2) // 3)
+
+        # Walk back to the newest page.
+        page = pages[-1]
+        for older_page in reversed(pages[:-1]):
+            page = feed.page(after=page.newer)
+            self.assertEqual(self.keys(page), self.keys(older_page))
+        self.assertIsNone(page.newer)
+
+    def test_constant_queries(self):
+        feed = ActivityFeed(page_size=3)
+        page = feed.page()
+        with self.assertNumQueries(3):
+            feed.page(before=page.older)
+
+    def test_stale_cursor(self):
+        feed = ActivityFeed(page_size=3)
+
+        self.assertEqual(self.keys(feed.page(before="foo")), self.expected()[:3])
+        self.assertEqual(self.keys(feed.page(after="99990101000000000000-1")), self.expected()[:3])
+        self.assertEqual(self.keys(feed.page(after="99990101000000000000-fund-1")), self.expected()[:3])
+
+    def test_same_date(self):
+        """Actions of different tables saved at the same time are neither skipped nor repeated."""
+        for model in (Claimant, Fund, Expense, Blog):
+            model.history.update(history_date=datetime(2017, 1, 1))  # pylint: disable=E1101
+        self.test_pages()
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.claimant = Claimant.objects.create(
+            forenames='Ada',
+            surname='Lovelace',
+            home_city='London',
+            research_area='Analytical engines',
             phone=0
         )
+        self.fund = Fund.objects.create(
+            claimant=self.claimant,
+            title='Workshop on notes',
+            city='London',
+            start_date='2014-02-20',
+            end_date='2014-02-22',
+            justification='Discuss Bernoulli numbers'
+        )
+        self.blog = Blog.objects.create(
+            fund=self.fund,
+            author=self.claimant,
+            draft_url='http://software.ac.uk',
+            title='Computing Bernoulli numbers'
+        )
 
-        self.assertNotEqual(claimant1.slug, claimant2.slug)
+    def test_prefix(self):
+        self.assertEqual(search_records(Claimant.objects.all(), 'lovel'), [self.claimant])
+        self.assertEqual(search_records(Claimant.objects.all(), 'analytical eng'), [self.claimant])
+        self.assertEqual(search_records(Fund.objects.all(), 'Ada'), [self.fund])
+        self.assertEqual(search_records(Blog.objects.all(), 'bernoulli'), [self.blog])
+        self.assertEqual(search_records(Claimant.objects.all(), 'babbage'), [])
+
+    def test_no_words(self):
+        self.assertEqual(search_records(Fund.objects.all(), None), [])
+        self.assertEqual(search_records(Fund.objects.all(), '" * ()'), [])
+
+    def test_ranked(self):
+        fund = Fund.objects.create(
+            claimant=self.claimant,
+            title='Bernoulli numbers',
+            city='London',
+            start_date='2014-02-20',
+            end_date='2014-02-22',
+            justification='Bernoulli numbers'
+        )
+
+        self.assertEqual(search_records(Fund.objects.all(), 'bernoulli'), [fund, self.fund])
+
+    def test_substring(self):
+        self.assertEqual(search_records(Claimant.objects.all(), 'velace'), [self.claimant])
+        self.assertEqual(search_records(Claimant.objects.all(), 'ada lovelace'), [self.claimant])
+
+    def test_restricted_before_limit(self):
+        for i in range(3):
+            Fund.objects.create(
+                claimant=self.claimant,
+                title='Bernoulli numbers {}'.format(i),
+                city='London',
+                start_date='2014-02-20',
+                end_date='2014-02-22',
+                justification='Bernoulli numbers'
+            )
+
+        self.assertEqual(search_records(Fund.objects.filter(pk=self.fund.pk), 'bernoulli', limit=2), [self.fund])
+
+    def test_update(self):
+        self.claimant.surname = 'King'
+        self.claimant.save()
+
+        self.assertEqual(search_records(Claimant.objects.all(), 'lovelace'), [])
+        self.assertEqual(search_records(Claimant.objects.all(), 'king'), [self.claimant])
+        self.assertEqual(search_records(Fund.objects.all(), 'king'), [self.fund])
+
+    def test_delete(self):
+        self.blog.delete()
+
+        self.assertEqual(search_records(Blog.objects.all(), 'bernoulli'), [])
+
+    @skipIf(connection.vendor != 'sqlite', "The search index uses SQLite FTS5.")
+    def test_queryset_delete(self):
+        Claimant.objects.filter(pk=self.claimant.pk).delete()
+
+        self.assertEqual(indexed_ids(Claimant), [])
+        self.assertEqual(indexed_ids(Fund), [])
+        self.assertEqual(indexed_ids(Blog), [])
+
+    def test_rebuild(self):
+        Fund.objects.filter(pk=self.fund.pk).update(title='Symposium')
+        with redirect_stdout(io.StringIO()):
+            call_command('rebuild_search_index')
+
+        self.assertEqual(search_records(Fund.objects.all(), 'symposium'), [self.fund])
+        self.assertEqual(search_records(Claimant.objects.all(), 'lovelace'), [self.claimant])
+
+
+class MapClusterTest(TestCase):
+    def setUp(self):
+        self.claimant = Claimant.objects.create(
+            forenames='Ada',
+            surname='Lovelace',
+            home_city='London',
+            home_lat=51.51,
+            home_lon=-0.13,
+            phone=0
+        )
+        self.fund = Fund.objects.create(
+            claimant=self.claimant,
+            title='Workshop',
+            city='Edinburgh',
+            lat=55.95,
+            lon=-3.19,
+            start_date='2014-02-20',
+            end_date='2014-02-22'
+        )
+
+    @staticmethod
+    def clusters():
+        return sorted(
+            MapCluster.objects.values_list("zoom", "cell_x", "cell_y", "tile_x", "tile_y", "claimants", "funds")
+        )
+
+    def test_map_cell(self):
+        self.assertEqual(map_cell(0, 0, 0), (4, 4))
+        self.assertEqual(map_cell(89.9, -180, 0), (0, 0))
+        self.assertEqual(map_cell(-89.9, 180, 0), (7, 7))
+
+    def test_add(self):
+        world = MapCluster.objects.get(zoom=0, cell_x=3, cell_y=2)
+        self.assertEqual((world.claimants, world.funds), (1, 1))
+        self.assertAlmostEqual(world.centre()[0], (51.51 + 55.95) / 2)
+        self.assertEqual(MapCluster.objects.filter(zoom=MAX_MAP_ZOOM).count(), 2)
+
+    def test_move(self):
+        self.fund.lat = -33.87
+        self.fund.lon = 151.21
+        self.fund.save()
+
+        self.assertEqual(
+            MapCluster.objects.filter(funds=1, lat_sum__lt=0).count(),
+            MAX_MAP_ZOOM + 1
+        )
+        self.assertFalse(MapCluster.objects.filter(funds__gt=0, lat_sum__gt=55).exists())
+
+    def test_unchanged(self):
+        before = self.clusters()
+        Fund.objects.get(pk=self.fund.pk).save()
+        self.claimant.save()
+
+        self.assertEqual(self.clusters(), before)
+
+    def test_move_queries(self):
+        fund = Fund.objects.get(pk=self.fund.pk)
+        fund.lat = -33.87
+        fund.lon = 151.21
+        # Fund.save(), AccessToken and search index, then 2 queries to remove the point and 3 to add it.
+        with CaptureQueriesContext(connection) as queries:
+            fund.save()
+
+        self.assertEqual(len([query for query in queries if "lowfat_mapcluster" in query["sql"]]), 5)
+
+    def test_deferred_location(self):
+        before = self.clusters()
+        fund = Fund.objects.only("id", "title").get(pk=self.fund.pk)
+        fund.title = 'Renamed'
+        fund.save()
+        self.assertEqual(self.clusters(), before)
+
+        fund = Fund.objects.only("id").get(pk=self.fund.pk)
+        fund.lat = -33.87
+        fund.lon = 151.21
+        fund.save()
+        self.assertEqual(MapCluster.objects.filter(zoom=0).aggregate(Sum("funds"))["funds__sum"], 1)
+        self.assertFalse(MapCluster.objects.filter(funds__gt=0, lat_sum__gt=55).exists())
+
+    def test_delete(self):
+        self.fund.delete()
+        self.claimant.delete()
+
+        self.assertFalse(MapCluster.objects.exists())
+
+    def test_cascaded_delete(self):
+        Claimant.objects.filter(pk=self.claimant.pk).delete()
+
+        self.assertFalse(MapCluster.objects.exists())
+
+    def test_rebuild(self):
+        Claimant.objects.create(forenames='Charles', surname='Babbage', home_lat=51.5, home_lon=-0.12, phone=0)
+        incremental = self.clusters()
+        MapCluster.objects.all().delete()
+        with redirect_stdout(io.StringIO()):
+            call_command('rebuild_map_clusters')
+
+        self.assertEqual(self.clusters(), incremental)
+
+
+@skipIf(Image is None, "Pillow is not installed")
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        self.claimant = Claimant.objects.create(
+            forenames='Ada',
+            surname='Lovelace',
+            photo=self.upload('ada.jpg', (400, 600)),
+            phone=0
+        )
+
+    def tearDown(self):
+        for name in self.variants() + [self.claimant.photo.name]:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+
+    @staticmethod
+    def upload(name, size):
+        content = io.BytesIO()
+        Image.new("RGB", size, "red").save(content, "JPEG")
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def variants(self, name=None):
+        return [
+            thumbnail_name(name or self.claimant.photo.name, size, extension)
+            for size in THUMBNAIL_SIZES
+            for extension in ("webp", "jpg")
+        ]
+
+    def test_upload(self):
+        for name in self.variants():
+            self.assertTrue(default_storage.exists(name), name)
+        with default_storage.open(thumbnail_name(self.claimant.photo.name, "grid", "webp")) as variant:
+            self.assertEqual(Image.open(variant).size, (THUMBNAIL_SIZES["grid"], THUMBNAIL_SIZES["grid"]))
+        self.assertTrue(thumbnail_url(self.claimant.photo, "detail", "jpg").endswith("_detail.jpg"))
+
+    def test_unchanged(self):
+        with mock.patch("lowfat.models.make_thumbnails") as make_thumbnails:
+            claimant = Claimant.objects.get(pk=self.claimant.pk)
+            claimant.surname = 'King'
+            claimant.save()
+        make_thumbnails.assert_not_called()
+
+    def test_changed(self):
+        old = self.variants()
+        self.claimant.photo = self.upload('ada-2.jpg', (150, 150))
+        self.claimant.save()
+
+        for name in old:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self.variants():
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_deferred_photo(self):
+        old = self.variants()
+        claimant = Claimant.objects.only("id", "surname").get(pk=self.claimant.pk)
+        claimant.surname = 'King'
+        with mock.patch("lowfat.models.make_thumbnails") as make_thumbnails:
+            claimant.save()
+        make_thumbnails.assert_not_called()
+
+        claimant = Claimant.objects.only("id").get(pk=self.claimant.pk)
+        claimant.photo = self.upload('ada-2.jpg', (150, 150))
+        claimant.save()
+        self.claimant = claimant
+
+        for name in old:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self.variants():
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_not_an_image(self):
+        self.claimant.photo = SimpleUploadedFile('ada.jpg', b'000')
+        self.claimant.save()
+
+        self.assertIsNone(thumbnail_url(self.claimant.photo, "grid", "webp"))
+
+    def test_decompression_bomb(self):
+        self.claimant.photo = self.upload('ada-2.jpg', (150, 150))
+        with mock.patch("lowfat.thumbnails.Image.MAX_IMAGE_PIXELS", 1000), self.assertLogs("lowfat.thumbnails", "WARNING"):
+            self.claimant.save()
+
+        self.assertIsNone(thumbnail_url(self.claimant.photo, "grid", "webp"))
+
+
+class GenerateSyntheticDataTest(TestCase):
+    def setUp(self):
+        with redirect_stdout(io.StringIO()):
+            call_command('generate_synthetic_data', claimants=12, batch_size=5, seed=1)
+
+    def tearDown(self):
+        default_storage.delete(Expense.objects.first().claim.name)
+
+    def test_records(self):
+        self.assertEqual(Claimant.objects.count(), 12)
+        self.assertTrue(Fund.objects.exists())
+        self.assertTrue(Expense.objects.exists())
+        self.assertEqual(Claimant.history.count(), 12)  # pylint: disable=E1101
+        self.assertEqual(
+            GeneralSentMail.objects.count(),
+            FundSentMail.objects.count() + ExpenseSentMail.objects.count() + BlogSentMail.objects.count()
+        )
+
+        # The records must be usable as if they were created by save().
+        with redirect_stdout(io.StringIO()):
+            call_command('reconcile_fund_totals', check=True)
+        fund = Expense.objects.first().fund
+        self.assertEqual(fund.last_expense_number, fund.expense_set.count())
+        self.assertEqual(
+            MapCluster.objects.filter(zoom=0).aggregate(Sum("claimants"))["claimants__sum"],
+            Claimant.objects.exclude(home_lat=None).count()
+        )
+        claimant = Claimant.objects.first()
+        self.assertIn(claimant, search_records(Claimant.objects.all(), claimant.surname))
+        shared = [record for model in MODELS_WITH_TOKEN for record in model.objects.exclude(access_token=None)]
+        self.assertTrue(shared)
+        self.assertEqual(AccessToken.objects.count(), len(shared))
+        self.assertTrue(AccessToken.objects.of_record(shared[0]).exists())
+        self.assertIsNotNone(Claimant.objects.create(forenames='Ada', surname='Lovelace', phone=0).pk)
+
+    def test_no_history(self):
+        with redirect_stdout(io.StringIO()):
+            call_command('generate_synthetic_data', claimants=3, no_history=True)
+
+        self.assertEqual(Claimant.objects.count(), 15)
+        self.assertEqual(Claimant.history.count(), 12)  # pylint: disable=E1101
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        mail_staffs("Subject", "Message", html_message="<p>Message</p>")
+        self.message = OutboxMessage.objects.get()
+
+    def test_queue(self):
+        self.assertEqual(self.message.status, "P")
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_outbox(), (1, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Subject")
+        self.assertEqual(mail.outbox[0].alternatives, [("<p>Message</p>", "text/html")])
+        self.assertTrue(mail.outbox[0].reply_to)
+        self.assertEqual(OutboxMessage.objects.get().status, "S")
+        self.assertEqual(send_outbox(), (0, 0))
+
+    def test_retry(self):
+        with mock.patch("lowfat.mail.send_message", side_effect=smtplib.SMTPException("Unavailable")):
+            self.assertEqual(send_outbox(), (0, 1))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "P")
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, "Unavailable")
+        self.assertGreater(message.next_attempt, self.message.next_attempt + timedelta(seconds=59))
+        self.assertEqual(send_outbox(), (0, 0))  # Not due yet
+
+        with mock.patch("lowfat.mail.timezone.now", return_value=message.next_attempt):
+            self.assertEqual(send_outbox(), (1, 0))
+        self.assertEqual(OutboxMessage.objects.get().attempts, 2)
+
+    def test_dead(self):
+        OutboxMessage.objects.update(attempts=settings.OUTBOX_MAX_ATTEMPTS - 1)
+        with mock.patch("lowfat.mail.get_connection") as get_connection:
+            get_connection.return_value.open.side_effect = OSError("Connection refused")
+            self.assertEqual(send_outbox(), (0, 1))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "D")
+        self.assertEqual(message.last_error, "Connection refused")
+
+    def test_claim(self):
+        now = self.message.next_attempt
+        self.assertEqual(OutboxMessage.claim(10, now), [self.message])
+        # Reserved until the lease is over, e.g. for a concurrent worker.
+        self.assertEqual(OutboxMessage.claim(10, now), [])
+        self.assertEqual(OutboxMessage.claim(10, now + timedelta(seconds=settings.OUTBOX_LEASE)), [self.message])
+
+
+class EmailTemplateTest(TestCase):
+    def setUp(self):
+        self.flatpage = FlatPage.objects.create(
+            url="/email/template/test/",
+            title="Test",
+            content="""<p>Dear {{ claimant.fullname }},</p>
+<p>Visit <a href="{{ protocol }}://{{ site.domain }}{{ claimant.link }}">{{ protocol }}://{{ site.domain }}{{ claimant.link }}</a>.</p>
+{% if notes %}<p>Notes: {{ notes }}</p>{% endif %}"""
+        )
+        self.claimant = Claimant.objects.create(forenames='Ada', surname='Lovelace', phone=0)
+        self.context = {
+            "claimant": self.claimant,
+            "protocol": "https",
+            "site": Site(domain="lowfat.example.com"),
+            "notes": "Fish & chips",
+        }
+
+    def test_render(self):
+        html, plain_text = email_template(self.flatpage.url).render(self.context)
+
+        self.assertIn("Fish &amp; chips", html)
+        self.assertEqual(plain_text, html2text_fix(html))
+
+    def test_cached(self):
+        template = email_template(self.flatpage.url)
+
+        with self.assertNumQueries(0):
+            self.assertIs(email_template(self.flatpage.url), template)
+
+    def test_saved(self):
+        email_template(self.flatpage.url)
+        self.flatpage.title = "New title"
+        self.flatpage.save()
+
+        self.assertEqual(email_template(self.flatpage.url).title, "New title")
+
+    def test_saved_by_other_process(self):
+        template = email_template(self.flatpage.url)
+        FlatPage.objects.filter(pk=self.flatpage.pk).update(title="New title")
+        Sequence.next_value(cache_version_name("flatpage"))
+
+        self.assertIs(email_template(self.flatpage.url), template)
+        with mock.patch("lowfat.email_templates.time.monotonic", return_value=time.monotonic() + EMAIL_TEMPLATE_REVISION_TTL + 1):
+            self.assertEqual(email_template(self.flatpage.url).title, "New title")
+
+    def test_html_output(self):
+        self.flatpage.content = "{% load markdown %}<blockquote>{{ notes | markdown | safe }}</blockquote>"
+        self.flatpage.save()
+        html, plain_text = email_template(self.flatpage.url).render(self.context)
+
+        self.assertEqual(plain_text, html2text_fix(html))
+        self.assertIn("> Fish & chips", plain_text)
+
+    def test_static_text(self):
+        self.flatpage.content = "<p>Your request was <b>approved</b>.</p>"
+        self.flatpage.save()
+        template = email_template(self.flatpage.url)
+
+        with mock.patch("lowfat.email_templates.html2text") as html2text:
+            html, plain_text = template.render(self.context)
+        html2text.assert_not_called()
+        self.assertEqual(plain_text, html2text_fix(html))
@@ -1,7 +1,32 @@
-from django.test import TestCase, Client
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import re
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from .testwrapper import *
 from .models import *
+from .benchmarks import compare
+from .mail import mail_staffs, send_outbox
+from .metrics import exposition, increment
+from .photos import PHOTOS_CHUNK_SIZE
+from .profiler import PROFILES, QueryProfilerMiddleware, fingerprint
+from .validator import pdf
+from .views import AUTOCOMPLETE_LIMIT, DASHBOARD_PAGE_SIZE, DASHBOARD_QUERY_BUDGET
 
 
 class URLTest(TestCase):
@@ -1068,6 +1093,99 @@ class URLTest(TestCase):
 
         self.run_requests(url, queries)
 
+    def test_search(self):
+        url = '/search/'
+        queries = [
+            {
+                "user": self.claimant_a,
+                "expect_code": 200,
+                "post_data": {"search": "Fund"},
+                "final_url": "/admin/login/?next=/search/",
+            },
+            {
+                "user": self.admin,
+                "expect_code": 200,
+                "post_data": {"search": "Fund"},
+            },
+            {
+                "user": self.admin,
+                "expect_code": 200,
+                "post_data": {"search": ""},
+            },
+            ]
+
+        self.run_requests(url, queries)
+
+    def test_autocomplete(self):
+        for url in ['/autocomplete/claimant/?q=a', '/autocomplete/fund/?q=a']:
+            queries = [
+                {
+                    "user": self.public,
+                    "expect_code": 200,
+                    "final_url": "/login/?next={}".format(url.replace("/?q=a", "/%3Fq%3Da")),
+                },
+                {
+                    "user": self.claimant_a,
+                    "expect_code": 200,
+                },
+                {
+                    "user": self.admin,
+                    "expect_code": 200,
+                },
+                ]
+
+            self.run_requests(url, queries)
+
+    def test_autocomplete_results(self):
+        claimant = Claimant.objects.get(id=self.claimant_id)
+        response = self.admin.get('/autocomplete/claimant/', {"q": claimant.surname[:3]})
+
+        self.assertIn(
+            {"id": claimant.id, "text": str(claimant)},
+            response.json()["results"]
+        )
+        self.assertEqual(self.admin.get('/autocomplete/claimant/').json(), {"results": []})
+
+    def test_autocomplete_outranked(self):
+        fund = Fund.objects.get(id=self.fund_id)
+        other_claimant = Claimant.objects.get(user__username='claimant-b')
+        for i in range(AUTOCOMPLETE_LIMIT + 5):
+            Fund.objects.create(
+                claimant=other_claimant,
+                status='A',
+                title='Fake fake fake {}'.format(i),
+                city='L',
+                start_date='2014-02-20',
+                end_date='2014-02-22',
+                justification='Fake fake fake'
+            )
+
+        response = self.claimant_a.get('/autocomplete/fund/', {"q": "fake"})
+
+        self.assertEqual(response.json()["results"], [{"id": fund.id, "text": str(fund)}])
+
+    def test_recent_actions(self):
+        url = '/recent-actions/'
+        queries = [
+            {
+                "user": self.public,
+                "expect_code": 200,
+                "final_url": "/admin/login/?next=/recent-actions/",
+            },
+            {
+                "user": self.claimant_a,
+                "expect_code": 200,
+                "final_url": "/admin/login/?next=/recent-actions/",
+            },
+            {
+                "user": self.admin,
+                "expect_code": 200,
+            },
+            ]
+
+        self.run_requests(url, queries)
+        self.run_requests(url + '?before=foo', queries[-1:])
+
     def test_index(self):
         url = '/'
 
@@ -1091,3 +1209,715 @@ class URLTest(TestCase):
             ]
 
         self.run_requests(url, queries)
+
+
+class QueryCountTest(TestCase):
+    """The number of queries of list pages must not grow with the number of rows."""
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def add_items(self, number, fund_status="U", blog_status="U", **fund_data):
+        claimant = Claimant.objects.get(id=self.claimant_id)
+        for i in range(number):
+            fund = Fund.objects.create(
+                claimant=claimant,
+                status=fund_status,
+                title="Fund {}".format(i),
+                city="L",
+                start_date="2014-02-20",
+                end_date="2014-02-22",
+                justification=":-)",
+                **fund_data
+            )
+            Expense.objects.create(
+                fund=fund,
+                amount_claimed="10.00",
+                claim="fake-claim.pdf"
+            )
+            for _ in range(2):
+                Blog.objects.create(
+                    fund=fund,
+                    author=claimant,
+                    draft_url="http://software.ac.uk",
+                    status=blog_status
+                )
+
+    def count_queries(self, url):
+        self.admin.get(url)  # Warm up the per process caches, e.g. Site and constance.
+        with CaptureQueriesContext(connection) as context:
+            response = self.admin.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_dashboard(self):
+        url = '/dashboard/'
+        self.add_items(2, blog_status="P")
+        few = self.count_queries(url)
+
+        self.add_items(10, blog_status="P")
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_past_events(self):
+        url = '/fund/previous/'
+        self.add_items(2, fund_status="A", blog_status="P", category="H", can_be_advertise_after=True)
+        few = self.count_queries(url)
+
+        self.add_items(10, fund_status="A", blog_status="P", category="H", can_be_advertise_after=True)
+        self.assertEqual(self.count_queries(url), few)
+
+
+class QueryPlanTest(TestCase):
+    """The filtered queries of the busiest pages must be answered from an index."""
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+        self.claimant_b = Client()
+        self.claimant_b.login(
+            username='claimant-b',
+            password=CLAIMED_B_PASSWORD
+        )
+
+    def full_scans(self, client, url):
+        """Return the plans of the queries of url that scan a whole lowfat table."""
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, follow=True)
+        self.assertEqual(response.status_code, 200, url)
+
+        scans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query["sql"]
+                if not sql.startswith("SELECT") or " WHERE " not in sql or "lowfat_" not in sql:
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN {}".format(sql))
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if re.match(r"SCAN (TABLE )?lowfat_\w+( AS \w+)?$", detail):
+                        scans.append("{}\n    {}".format(sql, detail))
+        return scans
+
+    def assertNoFullScan(self, client, url):  # pylint: disable=invalid-name
+        scans = self.full_scans(client, url)
+        self.assertFalse(scans, "{} scans:\n{}".format(url, "\n".join(scans)))
+
+    def test_staff_pages(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite only.")
+
+        fund = Fund.objects.get(id=self.fund_id)
+        fund.new_access_token()
+        expense = Expense.objects.get(id=self.expense_id)
+        expense.new_access_token()
+        blog = Blog.objects.get(id=self.blog_id)
+        blog.new_access_token()
+        for url in [
+                '/dashboard/',
+                '/claimant/{}/'.format(Claimant.objects.get(id=self.claimant_id).slug),
+                '/fund/{}/'.format(self.fund_id),
+                '/fund/{}/expense/{}/'.format(self.fund_id, expense.relative_number),
+                '/blog/{}/'.format(self.blog_id),
+                '/public/request/{}/'.format(fund.access_token),
+                '/public/expense/{}/'.format(expense.access_token),
+                '/public/blog/{}/'.format(blog.access_token),
+                '/fund/previous/',
+                '/promote/',
+        ]:
+            self.assertNoFullScan(self.admin, url)
+
+    def test_dashboard_tables(self):
+        """Every status filter and sort of the staff dashboard uses the status indexes."""
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite only.")
+
+        for funding_requests, expenses, blogs in [
+                ("UP", "WSCP", "URCGL"),  # Pending, the default
+                ("A", "A", "P"),
+                ("F", "F", "X"),
+        ]:
+            for sort in ("newest", "oldest", "fellow"):
+                self.assertNoFullScan(
+                    self.admin,
+                    "/dashboard/?funding_requests={}&expenses={}&blogs={}&funds_sort={sort}&expenses_sort={sort}&blogs_sort={sort}".format(
+                        funding_requests, expenses, blogs, sort=sort
+                    )
+                )
+
+    def test_claimant_pages(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite only.")
+
+        for url in [
+                '/dashboard/',
+                '/dashboard/?funding_requests=A&expenses=A&blogs=P',
+                '/my-profile/',
+        ]:
+            self.assertNoFullScan(self.claimant_b, url)
+
+
+class GeoJSONTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        Claimant.objects.filter(id=self.claimant_id).update(home_lon=-0.13, home_lat=51.51)
+        Fund.objects.filter(id=self.fund_id).update(lon=-3.19, lat=55.95)
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+        cache.clear()
+
+    def get(self, **headers):
+        response = self.admin.get('/geojson/', **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_valid(self):
+        response, body = self.get()
+        geojson = json.loads(body.decode())
+
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        self.assertEqual(geojson["type"], "FeatureCollection")
+        self.assertEqual(
+            [feature["geometry"]["coordinates"] for feature in geojson["features"]],
+            [[-0.13, 51.51], [-3.19, 55.95]]
+        )
+        self.assertEqual(geojson["features"][1]["properties"]["Fund"], Fund.objects.get(id=self.fund_id).title)
+
+    def test_cached(self):
+        response, body = self.get()
+        self.assertTrue(response.streaming)
+
+        with self.assertNumQueries(4):  # Session, user and ETag
+            cached, cached_body = self.get()
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached_body, body)
+
+        not_modified, _ = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_changed(self):
+        response, _ = self.get()
+        fund = Fund.objects.get(id=self.fund_id)
+        fund.title = "Moved"
+        fund.save()
+
+        changed, body = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn(b'"Fund": "Moved"', body)
+
+
+class GeoJSONTileTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        claimant = Claimant.objects.get(id=self.claimant_id)
+        claimant.home_lat, claimant.home_lon = 51.51, -0.13
+        claimant.save()
+        fund = Fund.objects.get(id=self.fund_id)
+        fund.lat, fund.lon = 55.95, -3.19
+        fund.save()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def test_tile(self):
+        response = self.admin.get('/geojson/0/0/0.json')
+        geojson = json.loads(response.content.decode())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertEqual(len(geojson["features"]), 1)
+        self.assertEqual(geojson["features"][0]["properties"], {"count": 2, "claimants": 1, "funds": 1})
+
+    def test_split(self):
+        response = self.admin.get('/geojson/3/3/2.json')
+        geojson = json.loads(response.content.decode())
+
+        self.assertEqual(
+            sorted(feature["properties"]["count"] for feature in geojson["features"]),
+            [1, 1]
+        )
+
+    def test_not_modified(self):
+        etag = self.admin.get('/geojson/0/0/0.json')["ETag"]
+
+        response = self.admin.get('/geojson/0/0/0.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        fund = Fund.objects.get(id=self.fund_id)
+        fund.lat = -33.87
+        fund.save()
+        response = self.admin.get('/geojson/0/0/0.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_out_of_range(self):
+        self.assertEqual(self.admin.get('/geojson/0/1/0.json').status_code, 404)
+        self.assertEqual(self.admin.get('/geojson/99/0/0.json').status_code, 404)
+
+    def test_staff_only(self):
+        response = Client().get('/geojson/0/0/0.json')
+        self.assertEqual(response.status_code, 302)
+
+
+class ICalTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        self.fund = Fund.objects.get(id=self.fund_id)
+        self.fund.can_be_included_in_calendar = True
+        self.fund.save()
+        self.token = config.CALENDAR_ACCESS_TOKEN
+        cache.clear()
+
+    def test_feed(self):
+        hidden = Fund.objects.create(
+            claimant=self.fund.claimant,
+            title='Private meeting',
+            city='London',
+            start_date='2014-02-20',
+            end_date='2014-02-22'
+        )
+
+        response = Client().get('/fund/ical/{}/'.format(self.token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar")
+        self.assertIn("UID:lowFAT-fund-{}".format(self.fund_id), response.content.decode())
+        self.assertNotIn("UID:lowFAT-fund-{}".format(hidden.id), response.content.decode())
+        self.assertEqual(Client().get('/fund/ical/{}/'.format("0" * 32)).status_code, 404)
+
+    def test_conditional(self):
+        response = Client().get('/fund/ical/{}/'.format(self.token))
+
+        with self.assertNumQueries(2):  # Token and state.
+            not_modified = Client().get(
+                '/fund/ical/{}/'.format(self.token),
+                HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = Client().get(
+            '/fund/ical/{}/'.format(self.token),
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.fund.title = "Renamed"
+        self.fund.save()
+        run_on_commit()
+        changed = Client().get('/fund/ical/{}/'.format(self.token), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("SUMMARY:Renamed", changed.content.decode())
+
+    def test_claimant_feed(self):
+        other = Claimant.objects.create(forenames='Charles', surname='Babbage', phone=0)
+        shared = Client().get('/fund/ical/{}/'.format(self.token)).content.decode()
+
+        with self.assertNumQueries(4):  # Token, state, claimant and funds: the event comes from the cache.
+            own = Client().get('/fund/ical/{}/{}/'.format(self.token, self.claimant_id))
+        self.assertIn(shared[shared.index("BEGIN:VEVENT"):shared.index("END:VEVENT")], own.content.decode())
+        self.assertNotIn("BEGIN:VEVENT", Client().get('/fund/ical/{}/{}/'.format(self.token, other.id)).content.decode())
+        self.assertEqual(Client().get('/fund/ical/{}/0/'.format(self.token)).status_code, 404)
+
+
+class FellowsPhotosTest(TestCase):
+    def setUp(self):
+        create_all()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+        cache.clear()
+
+    def get(self, **headers):
+        response = self.admin.get('/staff/photos', **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_archive(self):
+        response, body = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()),
+                sorted("{}.jpg".format(fellow.slug) for fellow in Claimant.objects.filter(fellow=True))
+            )
+            self.assertEqual(archive.read(archive.namelist()[0]), b'000')
+
+    def test_cached(self):
+        response, body = self.get()
+        self.assertTrue(response.streaming)
+
+        # Only the list of photos is cached, the archive is read from the disk again.
+        with mock.patch("lowfat.photos.os.stat") as mock_stat:
+            again, again_body = self.get()
+            not_modified, _ = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        mock_stat.assert_not_called()
+        self.assertTrue(again.streaming)
+        self.assertEqual(again_body, body)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_chunks(self):
+        fellow = Claimant.objects.filter(fellow=True).first()
+        fellow.photo.save('c_c.jpg', ContentFile(b'1' * (3 * PHOTOS_CHUNK_SIZE)))
+
+        response = self.admin.get('/staff/photos')
+        chunks = list(response.streaming_content)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), PHOTOS_CHUNK_SIZE + 1024)
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertEqual(archive.read("{}.jpg".format(fellow.slug)), b'1' * (3 * PHOTOS_CHUNK_SIZE))
+
+    def test_changed(self):
+        response, _ = self.get()
+        Claimant.objects.filter(fellow=True).first().photo.save('c_c.jpg', ContentFile(b'111'))
+        run_on_commit()
+
+        changed, body = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertIn(b'111', [archive.read(name) for name in archive.namelist()])
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        self.fund = Fund.objects.get(id=self.fund_id)
+        self.fund.category = "H"
+        self.fund.save()
+        cache.clear()
+
+    def test_hit(self):
+        self.assertEqual(Client().get('/fund/previous/').status_code, 200)
+
+        with self.assertNumQueries(1):  # Versions.
+            response = Client().get('/fund/previous/')
+        self.assertContains(response, self.fund.title)
+
+    def test_invalidated(self):
+        Client().get('/fund/previous/')
+        self.fund.title = "Renamed"
+        self.fund.save()
+        run_on_commit()
+
+        self.assertContains(Client().get('/fund/previous/'), "Renamed")
+
+    def test_once_per_transaction(self):
+        run_on_commit()
+        version = int(cache_versions("fund"))
+        with transaction.atomic():
+            for title in ("First", "Second", "Third"):
+                self.fund.title = title
+                self.fund.save()
+        self.assertEqual(int(cache_versions("fund")), version)
+
+        run_on_commit()
+        self.assertEqual(int(cache_versions("fund")), version + 1)
+
+    def test_signed_in(self):
+        admin = Client()
+        admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+        staff_page = admin.get('/fund/previous/')
+        public_page = Client().get('/fund/previous/')
+
+        self.assertIn(b'Sign out', staff_page.content)
+        self.assertNotIn(b'Sign out', public_page.content)
+        self.assertContains(admin.get('/fund/previous/'), 'Sign out')
+
+    def test_fragment(self):
+        admin = Client()
+        admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+        admin.get('/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = admin.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "lowfat_fund"' in query['sql']])
+
+    def test_benchmark(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command('benchmark_page_cache', '/fund/previous/', repeat=1)
+
+        self.assertIn("/fund/previous/", output.getvalue())
+
+
+class DashboardTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        fund = Fund.objects.get(id=self.fund_id)
+        for i in range(DASHBOARD_PAGE_SIZE + 5):
+            Fund.objects.create(
+                claimant=fund.claimant,
+                title="Pending {:02}".format(i),
+                city='London',
+                start_date='2014-02-20',
+                end_date='2014-02-22'
+            )
+            Expense.objects.create(fund=fund, amount_claimed=i)
+            Blog.objects.create(
+                fund=fund,
+                author=fund.claimant,
+                draft_url='http://software.ac.uk',
+                title="Draft {:02}".format(i)
+            )
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def test_query_budget(self):
+        self.admin.get('/dashboard/')  # Warm up the per process caches, e.g. Site and constance.
+
+        for query in ['', '?funding_requests=UPAMRF&expenses=WSCPAF&blogs=URCGLPMDOX', '?funds_page=2&funds_sort=fellow']:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.admin.get('/dashboard/{}'.format(query))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(queries), DASHBOARD_QUERY_BUDGET, [query["sql"] for query in queries])
+
+    def test_pages(self):
+        response = self.admin.get('/dashboard/')
+        self.assertEqual(len(response.context['funds']), DASHBOARD_PAGE_SIZE)
+        self.assertEqual(len(response.context['expenses']), DASHBOARD_PAGE_SIZE)
+
+        response = self.admin.get('/dashboard/?funds_page=2')
+        self.assertEqual(len(response.context['funds']), 5)
+        self.assertEqual(self.admin.get('/dashboard/?funds_page=99').context['funds_page'].number, 2)
+        self.assertEqual(self.admin.get('/dashboard/?funds_page=x').context['funds_page'].number, 1)
+
+    def test_sort(self):
+        response = self.admin.get('/dashboard/?funds_sort=title')
+        titles = [fund.title for fund, _ in response.context['funds']]
+        self.assertEqual(titles, sorted(titles))
+
+        response = self.admin.get('/dashboard/?expenses_sort=amount')
+        amounts = [expense.amount_claimed for expense in response.context['expenses']]
+        self.assertEqual(amounts, sorted(amounts, reverse=True))
+        self.assertEqual(self.admin.get('/dashboard/?blogs_sort=drop').context['blogs_sort'], "newest")
+
+    def test_filter(self):
+        response = self.admin.get('/dashboard/?q=draft+07')
+
+        self.assertEqual([blog.title for blog in response.context['blogs']], ["Draft 07"])
+        self.assertEqual(response.context['funds'], [])
+        self.assertContains(response, 'value="draft 07"')
+
+
+@override_settings(QUERY_PROFILER=True)
+class QueryProfilerTest(TestCase):
+    def setUp(self):
+        self.claimant_id, self.fund_id, self.expense_id, self.blog_id = create_all()
+        PROFILES.clear()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 12 AND b = 'it''s'  AND c IN (1, 2)"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)"
+        )
+
+    def test_summary(self):
+        self.admin.get('/dashboard/')
+        self.admin.get('/dashboard/')
+
+        summary = {row["view"]: row for row in PROFILES.summary()}
+        self.assertEqual(summary["dashboard"]["requests"], 2)
+        self.assertGreater(summary["dashboard"]["queries_mean"], 0)
+        self.assertContains(self.admin.get('/staff/'), '<td>dashboard</td>')
+
+    def test_n_plus_one(self):
+        for i in range(5):
+            Claimant.objects.create(forenames='C', surname=str(i), phone=0)
+
+        def view(request):  # pylint: disable=unused-argument
+            for claimant_id in Claimant.objects.values_list("id", flat=True):
+                Claimant.objects.get(id=claimant_id)
+            return HttpResponse()
+
+        with self.assertLogs('lowfat.profiler', 'WARNING') as logs:
+            QueryProfilerMiddleware(view)(RequestFactory().get('/loop/'))
+
+        self.assertIn("Possible N+1 in /loop/", logs.output[0])
+        self.assertEqual(PROFILES.summary()[0]["n_plus_one"], 1)
+
+    def test_full_queries_log(self):
+        def view(request):  # pylint: disable=unused-argument
+            Claimant.objects.count()
+            return HttpResponse()
+
+        connection.queries_log.extend({"sql": "SELECT 1", "time": "0.000"} for _ in range(connection.queries_limit))
+        QueryProfilerMiddleware(view)(RequestFactory().get('/count/'))
+
+        self.assertEqual(PROFILES.summary()[0]["queries_max"], 1)
+
+    @override_settings(QUERY_PROFILER=False)
+    def test_disabled(self):
+        Client().get('/')
+
+        self.assertEqual(PROFILES.summary(), [])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        create_all()
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(METRICS_DATABASE=os.path.join(self.directory.name, "metrics.sqlite3"))
+        self.settings.enable()
+
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_requests(self):
+        self.admin.get('/dashboard/')
+        self.admin.get('/dashboard/')
+        Client().get('/does/not/exist/')
+
+        response = self.admin.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn('# TYPE lowfat_request_duration_seconds histogram', body)
+        self.assertIn('lowfat_request_duration_seconds_count{method="GET",view="dashboard"} 2', body)
+        self.assertIn('lowfat_request_duration_seconds_bucket{method="GET",view="dashboard",le="+Inf"} 2', body)
+        self.assertIn('lowfat_responses_total{status="200",view="dashboard"} 2', body)
+
+    def test_staff_only(self):
+        self.assertEqual(Client().get('/metrics/').status_code, 302)
+
+    def test_one_transaction(self):
+        with mock.patch('lowfat.metrics._record') as record:
+            Client().get('/does/not/exist/')
+
+        record.assert_called_once()
+        self.assertEqual(
+            sorted({row[0] for row in record.call_args[0][0]}),
+            ["lowfat_request_duration_seconds", "lowfat_responses_total"]
+        )
+
+    def test_mail(self):
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            mail_staffs("Subject", "Message", html_message="<p>Message</p>")
+            send_outbox()
+
+        self.assertIn('lowfat_mail_total{recipient="staff",result="sent"} 1', exposition())
+        self.assertIn('lowfat_mail_duration_seconds_count{recipient="staff"} 1', exposition())
+
+    def test_validator(self):
+        with self.assertRaises(ValidationError):
+            pdf(SimpleUploadedFile('claim.txt', b'000'))
+
+        self.assertIn('lowfat_validator_duration_seconds_count{validator="pdf"} 1', exposition())
+
+    def test_broken_store(self):
+        with override_settings(METRICS_DATABASE=self.directory.name):  # A directory can not be opened.
+            with self.assertLogs('lowfat.metrics', 'WARNING'):
+                increment("lowfat_mail_total", recipient="staff", result="sent")
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        create_all()
+        self.directory = tempfile.TemporaryDirectory()
+        self.report = os.path.join(self.directory.name, "benchmark.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command('benchmark', repeat=1, output=self.report)
+
+        with open(self.report) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report["dataset"]["claimant"], Claimant.objects.count())
+        self.assertGreater(report["results"]["dashboard_staff"]["queries"], 0)
+        self.assertIn("reminder_job", output.getvalue())
+        # The benchmark records are rolled back.
+        self.assertFalse(User.objects.filter(username__startswith="benchmark-").exists())
+
+    def test_compare(self):
+        with redirect_stdout(io.StringIO()):
+            call_command('benchmark', 'search', repeat=1, output=self.report)
+            call_command('benchmark', 'search', repeat=1, compare=self.report, tolerance=100)
+
+        with open(self.report) as report_file:
+            report = json.load(report_file)
+        report["results"]["search"]["queries"] -= 1
+        with open(self.report, "w") as report_file:
+            json.dump(report, report_file)
+
+        with redirect_stdout(io.StringIO()), self.assertRaises(CommandError):
+            call_command('benchmark', 'search', repeat=1, compare=self.report)
+
+    def test_slower(self):
+        baseline = {"results": {"search": {"time_ms": 10, "queries": 3}}}
+
+        self.assertEqual(compare({"results": {"search": {"time_ms": 11, "queries": 3}}}, baseline), [])
+        self.assertEqual(len(compare({"results": {"search": {"time_ms": 20, "queries": 3}}}, baseline)), 1)
+
+
+class OutboxAdminTest(TestCase):
+    def setUp(self):
+        create_users()
+        self.admin = Client()
+        self.admin.login(
+            username='admin',
+            password=ADMIN_PASSWORD
+        )
+
+    def test_retry(self):
+        mail_staffs("Subject", "Message", html_message="<p>Message</p>")
+        dead = OutboxMessage.objects.get()
+        dead.status = "D"
+        dead.save()
+        mail_staffs("Subject", "Message", html_message="<p>Message</p>")
+
+        response = self.admin.post(
+            '/admin/lowfat/outboxmessage/',
+            {
+                'action': 'retry',
+                '_selected_action': [message.pk for message in OutboxMessage.objects.all()],
+            },
+            follow=True
+        )
+
+        self.assertContains(response, "1 messages queued again.")
+        self.assertEqual(OutboxMessage.objects.get(pk=dead.pk).status, "P")
@@ -1,10 +1,15 @@
 """
 Wrapper around tests
 """
+from datetime import date
 import io
+import os
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core import serializers
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
 from django.utils import timezone
 
 from .models import *
@@ -13,6 +18,21 @@ ADMIN_PASSWORD = '123456'
 CLAIMED_A_PASSWORD = '123456'
 CLAIMED_B_PASSWORD = '123456'
 
+def load_fixture(name):
+    """Save the objects of fixtures/name with raw saves, as loaddata does.
+
+    loaddata itself fails its final constraint check on SQLite 3.26 or later
+    with the tables renamed by the migrations of Django 1.11."""
+    with open(os.path.join(settings.BASE_DIR, "fixtures", name)) as fixture, transaction.atomic():
+        for deserialized in serializers.deserialize("json", fixture):
+            deserialized.save()
+
+def run_on_commit():
+    """Run the callbacks of transaction.on_commit, TestCase never commits its transaction."""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
 def create_users():
     User.objects.create_superuser(
         'admin',
@@ -119,6 +139,30 @@ def create_fund():
     fund.save()
     return claimant_id, fund.id
 
+def create_bare_claimant(**fields):
+    """Return a new claimant without user or photo, fields override the defaults."""
+    data = {
+        "forenames": "Test",
+        "surname": "Test",
+        "home_city": "Testville",
+        "phone": 0,
+        }
+    data.update(fields)
+    return Claimant.objects.create(**data)
+
+def create_bare_fund(claimant=None, **fields):
+    """Return a new fund of claimant, a new bare claimant by default, fields override the defaults."""
+    data = {
+        "claimant": claimant or create_bare_claimant(),
+        "title": "Fund",
+        "city": "Testville",
+        "start_date": date(2014, 2, 20),
+        "end_date": date(2014, 2, 22),
+        "justification": ":-)",
+        }
+    data.update(fields)
+    return Fund.objects.create(**data)
+
 def create_all():
     claimant_id, fund_id = create_fund()
     fund = Fund.objects.get(id=fund_id)
@@ -0,0 +1,80 @@
+"""Resized variants of the uploaded photos.
+
+Each variant is stored next to the original, e.g. ``photos/a_a.jpg`` has
+``photos/a_a_grid.webp`` and ``photos/a_a_grid.jpg``. Pillow is optional:
+without it no variant is created and the original is served.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+#: Side in pixels of each variant, twice the size in lowfat.css for high density screens
+THUMBNAIL_SIZES = {
+    "grid": 240,
+    "detail": 300,
+}
+
+#: Pillow format of each variant extension
+THUMBNAIL_FORMATS = {
+    "webp": "WEBP",
+    "jpg": "JPEG",
+}
+
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnail_name(name, size, extension):
+    root, _ = os.path.splitext(name)
+    return "{}_{}.{}".format(root, size, extension)
+
+
+def make_thumbnails(field_file):
+    """Create every variant of field_file, replacing the ones already there."""
+    if Image is None or not field_file:
+        return
+
+    storage = field_file.storage
+    delete_thumbnails(storage, field_file.name)
+    try:
+        with storage.open(field_file.name, "rb") as _file:
+            image = Image.open(_file)
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as exception:
+        logger.warning("Can not create thumbnails of %s: %s", field_file.name, exception)
+        return
+
+    for size, pixels in THUMBNAIL_SIZES.items():
+        thumbnail = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+        for extension, image_format in THUMBNAIL_FORMATS.items():
+            content = io.BytesIO()
+            thumbnail.save(content, image_format, quality=THUMBNAIL_QUALITY)
+            storage.save(thumbnail_name(field_file.name, size, extension), ContentFile(content.getvalue()))
+
+
+def delete_thumbnails(storage, name):
+    """Delete the variants of the file called name."""
+    for size in THUMBNAIL_SIZES:
+        for extension in THUMBNAIL_FORMATS:
+            thumbnail = thumbnail_name(name, size, extension)
+            if storage.exists(thumbnail):
+                storage.delete(thumbnail)
+
+
+def thumbnail_url(field_file, size, extension):
+    """Return the URL of one variant of field_file or None if it was not created."""
+    if not field_file:
+        return None
+
+    name = thumbnail_name(field_file.name, size, extension)
+    if not field_file.storage.exists(name):
+        return None
+    return field_file.storage.url(name)
@@ -61,6 +61,7 @@ FUND_PATTERNS = [
     url(r'^(?P<fund_id>[0-9]+)/remove', views.fund_remove, name="fund_remove"),
     url(r'^(?P<fund_id>[0-9]+)/', views.fund_detail, name="fund_detail"),
     url(r'^previous/', views.fund_past, name="fund_past"),
+    url(r'^ical/(?P<token>[0-9A-Za-z]{32})/(?P<claimant_id>[0-9]+)/', views.fund_ical, name="claimant_ical"),
     url(r'^ical/(?P<token>[0-9A-Za-z]{32})/', views.fund_ical, name="fund_ical"),
     url(r'^import/', views.fund_import, name="fund_import"),
     url(r'^', views.fund_form, name="fund"),
@@ -114,10 +115,14 @@ urlpatterns = [  # pylint: disable=invalid-name
     url(r'^dashboard/', views.dashboard, name="dashboard"),
     url(r'^promote/', views.promote, name="promote"),
     url(r'^my-profile/', views.my_profile, name="my_profile"),
+    url(r'^geojson/(?P<zoom>[0-9]+)/(?P<tile_x>[0-9]+)/(?P<tile_y>[0-9]+)\.json$', views.geojson_tile, name="geojson_tile"),
     url(r'^geojson/', views.geojson, name="geojson"),
+    url(r'^metrics/', views.metrics, name="metrics"),
     url(r'^report/(?P<report_filename>.+)', views.report_by_name, name="report_by_name"),
     url(r'^report/', views.report, name="report"),
     url(r'^search/', views.search, name="search"),
+    url(r'^autocomplete/claimant/', views.autocomplete_claimant, name="autocomplete_claimant"),
+    url(r'^autocomplete/fund/', views.autocomplete_fund, name="autocomplete_fund"),
     url(r'^recent-actions/', views.recent_actions, name="recent_actions"),
     url(r'^staff/', include(STAFF_PATTERNS)),
     url(r'^admin/', admin.site.urls),
@@ -8,6 +8,9 @@ from django.core.exceptions import ValidationError
 
 import PyPDF2
 
+from .metrics import timed
+
+@timed("lowfat_validator_duration_seconds", validator="online_document")
 def online_document(url):
     """Check if online document is available."""
     try:
@@ -28,6 +31,7 @@ def online_document(url):
     if url != online_resource.geturl() or online_resource.getcode() != 200:
         raise ValidationError("Can't access online document.")
 
+@timed("lowfat_validator_duration_seconds", validator="pdf")
 def pdf(value):
     """Check if filename looks like a PDF file."""
 
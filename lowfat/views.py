@@ -1,22 +1,27 @@
-from datetime import datetime
 import copy
+import hashlib
 import io
 import logging
 import os
 import shutil
-import zipfile
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 import django.utils
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
 
 from constance import config
 
@@ -26,10 +31,98 @@ from .management.commands import loadoldfunds
 from .models import *
 from .forms import *
 from .mail import *
+from .geo import cache_stream, geojson_etag, map_tile, stream_geojson
+from .ical import calendar_state, render_calendar
+from .metrics import exposition
+from .page_cache import cache_page_versions
+from .photos import fellows_photos, photos_etag, stream_zip
+from .profiler import PROFILES
+from .search import search_records
 
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+#: Options returned by the autocomplete endpoints
+AUTOCOMPLETE_LIMIT = 20
+
+GEOJSON_CONTENT_TYPE = "application/geo+json"
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ICAL_CONTENT_TYPE = "text/calendar"
+
+#: Seconds a browser can reuse a map tile without revalidating it
+MAP_TILE_MAX_AGE = 5 * 60
+
+#: Relations followed by expenses.html for each row
+EXPENSE_LIST_RELATED = (
+    "fund",
+    "fund__claimant",
+    "fund__claimant__user",
+)
+
+#: Relations followed by blogs.html for each row
+BLOG_LIST_RELATED = (
+    "author",
+    "fund",
+    "reviewer",
+)
+
+#: Rows per page of each table of the staff dashboard
+DASHBOARD_PAGE_SIZE = 25
+
+#: Maximum number of SQL queries of the staff dashboard, whatever the number of pending requests
+DASHBOARD_QUERY_BUDGET = 15
+
+#: Columns of the claimants loaded for the rows of the staff dashboard
+DASHBOARD_CLAIMANT_FIELDS = ("id", "forenames", "surname", "email", "slug")
+
+#: Columns loaded for the rows of each table of the staff dashboard, see funds.html, expenses.html and blogs.html
+DASHBOARD_FIELDS = {
+    "funds": (
+        "id", "title", "url", "status", "added", "approved", "start_date", "end_date",
+    ) + tuple("claimant__{}".format(field) for field in DASHBOARD_CLAIMANT_FIELDS),
+    "expenses": (
+        "id", "fund_id", "relative_number", "status", "added", "claim", "access_token",
+        "amount_claimed", "amount_authorized_for_payment", "fund__id", "fund__title",
+    ) + tuple("fund__claimant__{}".format(field) for field in DASHBOARD_CLAIMANT_FIELDS),
+    "blogs": (
+        "id", "title", "status", "added", "updated", "draft_url", "published_url", "tweet_url",
+        "fund__id", "fund__title",
+        "reviewer__id", "reviewer__first_name", "reviewer__last_name", "reviewer__email",
+    ) + tuple("author__{}".format(field) for field in DASHBOARD_CLAIMANT_FIELDS),
+}
+
+#: Fields matched by the filter of each table of the staff dashboard
+DASHBOARD_FILTER_FIELDS = {
+    "funds": ("title", "claimant__forenames", "claimant__surname"),
+    "expenses": ("fund__title", "fund__claimant__forenames", "fund__claimant__surname"),
+    "blogs": ("title", "author__forenames", "author__surname"),
+}
+
+#: (key, label, ordering) of the sorts of each table of the staff dashboard, the first one is the default
+DASHBOARD_SORTS = {
+    "funds": (
+        ("newest", "Newest", ("-added",)),
+        ("oldest", "Oldest", ("added",)),
+        ("start", "Start date", ("start_date",)),
+        ("fellow", "Fellow", ("claimant__surname", "claimant__forenames")),
+        ("title", "Title", ("title",)),
+    ),
+    "expenses": (
+        ("newest", "Newest", ("-added",)),
+        ("oldest", "Oldest", ("added",)),
+        ("fellow", "Fellow", ("fund__claimant__surname", "fund__claimant__forenames")),
+        ("amount", "Amount", ("-amount_claimed",)),
+    ),
+    "blogs": (
+        ("newest", "Newest", ("-added",)),
+        ("oldest", "Oldest", ("added",)),
+        ("fellow", "Fellow", ("author__surname", "author__forenames")),
+        ("title", "Title", ("title",)),
+    ),
+}
+
 
 def get_terms_and_conditions_url(request):
     """Return the terms and conditions link associated with the user."""
@@ -86,19 +179,54 @@ def get_terms_and_conditions_url(request):
     return url
 
 
+@cache_page_versions("claimant", "fund", "expense", "blog")
 def index(request):
     context = {
         'claimants': Claimant.objects.filter(
             Q(fellow=True) | Q(collaborator=True)
-        ),
-        'funds': [(fund, Blog.objects.filter(
-            fund=fund,
-            status="P"
-        )) for fund in Fund.objects.filter(category="H", start_date__gte=django.utils.timezone.now(), can_be_advertise_before=True)],
+        ).with_finances(),
+        # Lazy so the query is skipped when the fragment is cached.
+        'funds': SimpleLazyObject(lambda: pair_fund_with_blog(
+            Fund.objects.with_totals().filter(category="H", start_date__gte=django.utils.timezone.now(), can_be_advertise_before=True),
+            "P"
+        )),
     }
 
     return render(request, 'lowfat/index.html', context)
 
+def _dashboard_table(request, name, queryset):
+    """Filter, sort and paginate queryset for one table of the staff dashboard.
+
+    Return the page and the entries of the context used by pagination.html."""
+    for word in request.GET.get("q", "").split():
+        query = Q()
+        for field in DASHBOARD_FILTER_FIELDS[name]:
+            query |= Q(**{"{}__icontains".format(field): word})
+        queryset = queryset.filter(query)
+
+    sorts = DASHBOARD_SORTS[name]
+    orderings = {key: ordering for key, _, ordering in sorts}
+    sort = request.GET.get("{}_sort".format(name))
+    if sort not in orderings:
+        sort = sorts[0][0]
+
+    paginator = Paginator(
+        queryset.only(*DASHBOARD_FIELDS[name]).order_by(*orderings[sort] + ("-id",)),
+        DASHBOARD_PAGE_SIZE
+    )
+    try:
+        page = paginator.page(request.GET.get("{}_page".format(name), 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    return page, {
+        "{}_page".format(name): page,
+        "{}_sort".format(name): sort,
+        "{}_sorts".format(name): [(key, label) for key, label, _ in sorts],
+    }
+
 @login_required
 def dashboard(request):
     context = {
@@ -124,23 +252,21 @@ def dashboard(request):
                 'expenses_status': expenses_status,
                 'blogs_status': blogs_status,
                 'claimant': claimant,
-                'budget_available': claimant.claimantship_available(),
+                'budget_available': claimant.ledger.available,
                 'funds': pair_fund_with_blog(
-                    Fund.objects.filter(
+                    Fund.objects.with_totals().filter(
                         claimant=claimant,
                         status__in=funding_requests_status
                     ),
                     "P"
                 ),
-                'expenses': Expense.objects.filter(
+                'expenses': Expense.objects.select_related(*EXPENSE_LIST_RELATED).filter(
                     fund__claimant=claimant,
                     status__in=expenses_status
                 ),
-                'blogs': Blog.objects.filter(
-                    Q(author=claimant, status__in=blogs_status) | Q(coauthor=claimant, status__in=blogs_status)
-                    # Need to get distinct otherwise posts will be shown twice if user is author and coauthor
-                    # This happens here because the two ORed filter components operate on different table joins
-                ).distinct(),
+                'blogs': Blog.objects.select_related(*BLOG_LIST_RELATED).by_author(claimant).filter(
+                    status__in=blogs_status
+                ),
             }
         )
     else:
@@ -149,23 +275,34 @@ def dashboard(request):
         expenses_status = request.GET["expenses"] if "expenses" in request.GET else "WSCP"  # Pending
         blogs_status = request.GET["blogs"] if "blogs" in request.GET else "URCGL"  # Pending
 
+        funds, funds_context = _dashboard_table(
+            request,
+            "funds",
+            Fund.objects.select_related("claimant").filter(status__in=funding_requests_status)
+        )
+        expenses, expenses_context = _dashboard_table(
+            request,
+            "expenses",
+            Expense.objects.select_related("fund", "fund__claimant").filter(status__in=expenses_status)
+        )
+        blogs, blogs_context = _dashboard_table(
+            request,
+            "blogs",
+            Blog.objects.select_related(*BLOG_LIST_RELATED).filter(status__in=blogs_status)
+        )
+
+        context.update(funds_context)
+        context.update(expenses_context)
+        context.update(blogs_context)
         context.update(
             {
                 'funding_requests_status': funding_requests_status,
                 'expenses_status': expenses_status,
                 'blogs_status': blogs_status,
-                'funds': pair_fund_with_blog(
-                    Fund.objects.filter(
-                        status__in=funding_requests_status
-                    ),
-                    "P"
-                ),
-                'expenses': Expense.objects.filter(
-                    status__in=expenses_status
-                ),
-                'blogs': Blog.objects.filter(
-                    status__in=blogs_status
-                ),
+                'dashboard_filter': request.GET.get("q", ""),
+                'funds': pair_fund_with_blog(funds.object_list, "P"),
+                'expenses': expenses.object_list,
+                'blogs': blogs.object_list,
             }
         )
 
@@ -173,29 +310,31 @@ def dashboard(request):
 
 @staff_member_required
 def staff(request):
-    context = {}
+    context = {
+        'query_profiler': settings.QUERY_PROFILER,
+        'query_profiles': PROFILES.summary(),
+    }
     return render(request, 'lowfat/staff.html', context)
 
+def _fellows_photos_etag(request):
+    if not hasattr(request, "fellows_photos_etag"):
+        request.fellows_photos = fellows_photos()
+        request.fellows_photos_etag = photos_etag(request.fellows_photos)
+    return request.fellows_photos_etag
+
 @staff_member_required
+@condition(etag_func=_fellows_photos_etag)
 def get_fellows_photos(request):
-    zip_filename = "/tmp/fellows_photos{}.zip".format(
-        datetime.now().isoformat(timespec='minutes')
-    )
-
-    with zipfile.ZipFile(zip_filename, "w") as fellows_photos_zip:
-        for fellow in Claimant.objects.filter(fellow=True):
-            fellows_photos_zip.write(
-                fellow.photo.path,
-                "{}.jpg".format(fellow.slug)
-            )
-
-    # TODO Use BytesIO instead of real files
-    return HttpResponse(
-        open(zip_filename, 'rb'),
+    _fellows_photos_etag(request)
+    response = StreamingHttpResponse(
+        stream_zip(request.fellows_photos),
         content_type='application/zip'
     )
+    response["Content-Disposition"] = 'attachment; filename="fellows_photos.zip"'
+    return response
 
 @staff_member_required
+@cache_page_versions("claimant", anonymous_only=False)
 def rss(request):
     context = {
         'claimants': Claimant.objects.filter(fellow=True),
@@ -207,42 +346,33 @@ def search(request):
     search_text = request.POST.get("search")
     context = {
         "search": search_text,
-        "fellows": Claimant.objects.filter(
-            (Q(forenames__contains=search_text) |
-             Q(surname__contains=search_text) |
-             Q(email__contains=search_text) |
-             Q(research_area__contains=search_text) |
-             Q(affiliation__contains=search_text) |
-             Q(work_description__contains=search_text) |
-             Q(website__contains=search_text) |
-             Q(github__contains=search_text) |
-             Q(twitter__contains=search_text)) &
-            (Q(fellow=True) | Q(collaborator=True))
-        ),
-        "claimants": Claimant.objects.filter(
-            (Q(forenames__contains=search_text) |
-             Q(surname__contains=search_text) |
-             Q(email__contains=search_text) |
-             Q(research_area__contains=search_text) |
-             Q(affiliation__contains=search_text) |
-             Q(work_description__contains=search_text) |
-             Q(website__contains=search_text) |
-             Q(github__contains=search_text) |
-             Q(twitter__contains=search_text)) &
-            Q(fellow=False)
-        ),
-        "funds": Fund.objects.filter(
-            Q(claimant__forenames__contains=search_text) |
-            Q(claimant__surname__contains=search_text) |
-            Q(title__contains=search_text) |
-            Q(url__contains=search_text) |
-            Q(justification__contains=search_text) |
-            Q(additional_info__contains=search_text)
-        ),
+        "fellows": search_records(Claimant.objects.filter(Q(fellow=True) | Q(collaborator=True)), search_text),
+        "claimants": search_records(Claimant.objects.filter(fellow=False), search_text),
+        "funds": search_records(Fund.objects.all(), search_text),
+        "blogs": search_records(Blog.objects.all(), search_text),
     }
 
     return render(request, 'lowfat/search.html', context)
 
+def _autocomplete(request, queryset):
+    """JSON options for the autocomplete widgets of lowfat.forms."""
+    records = search_records(queryset, request.GET.get("q"), limit=AUTOCOMPLETE_LIMIT)
+    return JsonResponse({
+        "results": [{"id": record.pk, "text": str(record)} for record in records],
+    })
+
+@login_required
+def autocomplete_claimant(request):
+    return _autocomplete(request, Claimant.objects.all())
+
+@login_required
+def autocomplete_fund(request):
+    funds = Fund.objects.filter(status__in=FUND_STATUS_APPROVED_SET)
+    if not request.user.is_staff:
+        funds = funds.filter(claimant__user=request.user)
+
+    return _autocomplete(request, funds)
+
 @staff_member_required
 def promote(request):
     context = {
@@ -339,25 +469,24 @@ def _claimant_detail(request, claimant):
     }
 
     if request.user.is_staff:
-        funds = Fund.objects.filter(
+        funds = Fund.objects.with_totals().filter(
             claimant=claimant,
             status__in=funding_requests_status
         )
         context.update(
             {
                 'funds': pair_fund_with_blog(funds, "P"),
-                'expenses': Expense.objects.filter(
+                'expenses': Expense.objects.select_related(*EXPENSE_LIST_RELATED).filter(
                     fund__claimant=claimant,
                     status__in=expenses_status
                 ),
-                'blogs': Blog.objects.filter(
-                    Q(author=claimant, status__in=blogs_status) | Q(coauthor=claimant, status__in=blogs_status)
-                    # Distinct is required here - see comment in dashboard view
-                ).distinct(),
+                'blogs': Blog.objects.select_related(*BLOG_LIST_RELATED).by_author(claimant).filter(
+                    status__in=blogs_status
+                ),
             }
         )
     else:
-        funds = Fund.objects.filter(
+        funds = Fund.objects.with_totals().filter(
             claimant=claimant,
             can_be_advertise_after=True,
             status__in=FUND_STATUS_APPROVED_SET
@@ -365,10 +494,9 @@ def _claimant_detail(request, claimant):
         context.update(
             {
                 'funds': pair_fund_with_blog(funds, "P"),
-                'blogs': Blog.objects.filter(
-                    Q(author=claimant, status="P") | Q(coauthor=claimant, status="P")
-                    # Distinct is required here - see comment in dashboard view
-                ).distinct(),
+                'blogs': Blog.objects.select_related(*BLOG_LIST_RELATED).by_author(claimant).filter(
+                    status="P"
+                ),
             }
         )
 
@@ -378,6 +506,7 @@ def claimant_detail(request, claimant_id):
     raise Http404("URL not supported in lowFAT 2.x.")
 
 
+@cache_page_versions("claimant", "fund", "expense", "blog")
 def claimant_slug_resolution(request, claimant_slug):
     """
     Resolve claimant slug and return the details.
@@ -598,11 +727,11 @@ def _fund_detail(request, fund):
         'expenses_status': expenses_status,
         'blogs_status': blogs_status,
         'fund': fund,
-        'expenses': Expense.objects.filter(
+        'expenses': Expense.objects.select_related(*EXPENSE_LIST_RELATED).filter(
             fund=fund,
             status__in=expenses_status
         ),
-        'blogs': Blog.objects.filter(
+        'blogs': Blog.objects.select_related(*BLOG_LIST_RELATED).filter(
             fund=fund,
             status__in=blogs_status
         ),
@@ -612,16 +741,19 @@ def _fund_detail(request, fund):
     return render(request, 'lowfat/fund_detail.html', context)
 
 def fund_detail_public(request, access_token):
-    fund = Fund.objects.get(access_token=access_token)
+    fund = Fund.from_access_token(access_token, Fund.objects.with_totals())
+    if fund is None:
+        raise Http404("Funding request does not exist.")
+
     return _fund_detail(request, fund)
 
 @login_required
 def fund_detail(request, fund_id):
-    fund = Fund.objects.get(id=fund_id)
+    fund = Fund.objects.with_totals().get(id=fund_id)
 
     if request.user.is_staff:
         pass
-    elif Claimant.objects.get(user=request.user) == fund.claimant:
+    elif Claimant.objects.get(user=request.user).id == fund.claimant_id:
         pass
     else:
         raise Http404("Funding request does not exist.")
@@ -705,8 +837,9 @@ def fund_remove(request, fund_id):
 
     return HttpResponseRedirect(redirect_url)
 
+@cache_page_versions("claimant", "fund", "expense", "blog")
 def fund_past(request):
-    funds = Fund.objects.filter(
+    funds = Fund.objects.with_totals().filter(
         start_date__lt=django.utils.timezone.now(),
         category="H",
         status__in=FUND_STATUS_APPROVED_SET,
@@ -714,27 +847,32 @@ def fund_past(request):
     )
 
     context = {
-        'funds': [(fund, Blog.objects.filter(
-            fund=fund,
-            status="P"
-        )) for fund in funds],
+        # Lazy so the query is skipped when the fragment is cached.
+        'funds': SimpleLazyObject(lambda: pair_fund_with_blog(funds, "P")),
     }
 
     return render(request, 'lowfat/fund_past.html', context)
 
-def fund_ical(request, token):
-    if token != config.CALENDAR_ACCESS_TOKEN:
-        raise Http404("Expense claim does not exist.")
+def _calendar_state(request, token, claimant_id=None):
+    if not hasattr(request, "calendar_state"):
+        if token != config.CALENDAR_ACCESS_TOKEN:
+            raise Http404("Calendar does not exist.")
+        request.calendar_state = calendar_state(claimant_id)
+    return request.calendar_state
 
-    funds = Fund.objects.filter(
-        can_be_advertise_after=True,
-    )
+def _calendar_etag(request, token, claimant_id=None):
+    return _calendar_state(request, token, claimant_id)[0]
 
-    context = {
-        'funds': funds,
-    }
+def _calendar_last_modified(request, token, claimant_id=None):
+    return _calendar_state(request, token, claimant_id)[1]
 
-    return render(request, 'lowfat/ical.html', context)
+@condition(etag_func=_calendar_etag, last_modified_func=_calendar_last_modified)
+def fund_ical(request, token, claimant_id=None):
+    if claimant_id is not None and not Claimant.objects.filter(id=claimant_id).exists():
+        raise Http404("Claimant does not exist.")
+
+    etag, _ = _calendar_state(request, token, claimant_id)
+    return HttpResponse(render_calendar(etag, claimant_id), content_type=ICAL_CONTENT_TYPE)
 
 @staff_member_required
 def fund_import(request):
@@ -844,13 +982,7 @@ def expense_form(request, **kargs):
     return render(request, 'lowfat/form.html', context)
 
 def expense_form_public(request, access_token):
-    try:
-        fund = Fund.objects.get(access_token=access_token)
-        if not fund.access_token_is_valid():
-            fund = None
-    except ObjectDoesNotExist:
-        fund = None
-
+    fund = Fund.from_access_token(access_token)
     if fund is None:
         raise Http404("Funding request does not exist.")
 
@@ -893,12 +1025,7 @@ def _expense_detail(request, expense):
     return render(request, 'lowfat/expense_detail.html', context)
 
 def expense_detail_public(request, access_token):
-    try:
-        expense = Expense.objects.get(access_token=access_token)
-        if not expense.access_token_is_valid():
-            expense = None
-    except ObjectDoesNotExist:
-        expense = None
+    expense = Expense.from_access_token(access_token)
 
     return _expense_detail(request, expense)
 
@@ -910,7 +1037,7 @@ def expense_detail_relative(request, fund_id, expense_relative_number):
     this_fund = Fund.objects.get(id=fund_id)
     this_expense = Expense.objects.get(fund=this_fund, relative_number=expense_relative_number)
 
-    if not (request.user.is_staff or Claimant.objects.get(user=request.user) == this_expense.fund.claimant):
+    if not (request.user.is_staff or Claimant.objects.get(user=request.user).id == this_fund.claimant_id):
         this_expense = None
 
     return _expense_detail(request, this_expense)
@@ -1083,12 +1210,7 @@ def expense_claim_relative(request, fund_id, expense_relative_number):
     return _expense_claim(request, expense)
 
 def expense_claim_public(request, access_token):
-    try:
-        expense = Expense.objects.get(access_token=access_token)
-        if not expense.access_token_is_valid():
-            expense = None
-    except ObjectDoesNotExist:
-        expense = None
+    expense = Expense.from_access_token(access_token)
 
     return _expense_claim(request, expense)
 
@@ -1131,7 +1253,7 @@ def blog_form(request, **kargs):  # pylint: disable=too-many-branches
         # Handle blog post not related with a funding request
         if not blog.author:
             if formset.cleaned_data["author"]:  # Because blog.author is None!
-                blog.author = Claimant.objects.get(id=formset.cleaned_data["author"])
+                blog.author = formset.cleaned_data["author"]
             elif blog.fund:
                 blog.author = blog.fund.claimant
             elif not request.user.is_staff:
@@ -1177,13 +1299,7 @@ def blog_form(request, **kargs):  # pylint: disable=too-many-branches
     return render(request, 'lowfat/form.html', context)
 
 def blog_form_public(request, access_token):  # pylint: disable=too-many-branches
-    try:
-        fund = Fund.objects.get(access_token=access_token)
-        if not fund.access_token_is_valid():
-            fund = None
-    except ObjectDoesNotExist:
-        fund = None
-
+    fund = Fund.from_access_token(access_token)
     if fund is None:
         raise Http404("Funding request does not exist.")
 
@@ -1232,10 +1348,10 @@ def blog_detail(request, blog_id):
     try:
         blog = Blog.objects.get(id=blog_id)
 
-        if not (request.user.is_staff or
-                Claimant.objects.get(user=request.user) == blog.author or
-                Claimant.objects.get(user=request.user) in blog.coauthor.all()):
-            blog = None
+        if not request.user.is_staff:
+            claimant = Claimant.objects.get(user=request.user)
+            if not (claimant.id == blog.author_id or blog.coauthor.filter(id=claimant.id).exists()):
+                blog = None
 
     except ObjectDoesNotExist:
         blog = None
@@ -1243,12 +1359,7 @@ def blog_detail(request, blog_id):
     return _blog_detail(request, blog)
 
 def blog_detail_public(request, access_token):
-    try:
-        blog = Blog.objects.get(access_token=access_token)
-        if not blog.access_token_is_valid():
-            blog = None
-    except ObjectDoesNotExist:
-        blog = None
+    blog = Blog.from_access_token(access_token)
 
     return _blog_detail(request, blog)
 
@@ -1330,22 +1441,10 @@ def blog_remove(request, blog_id):
 @staff_member_required
 def recent_actions(request):
     """Recent actions view."""
-    action_list = []
-    action_list.extend([(claimant.history_date, claimant) for claimant in Claimant.history.all()])  # pylint: disable=E1101
-    action_list.extend([(fund.history_date, fund) for fund in Fund.history.all()])  # pylint: disable=E1101
-    action_list.extend([(expense.history_date, expense) for expense in Expense.history.all()])  # pylint: disable=E1101
-    action_list.extend([(blog.history_date, blog) for blog in Blog.history.all()])  # pylint: disable=E1101
-
-    action_list.sort(key=lambda x: x[0], reverse=True)
-    paginator = Paginator([action[1] for action in action_list], 10)
-
-    page = request.GET.get('page')
-    try:
-        actions = paginator.page(page)
-    except PageNotAnInteger:
-        actions = paginator.page(1)
-    except EmptyPage:
-        actions = paginator.page(paginator.num_pages)
+    actions = ActivityFeed().page(
+        before=request.GET.get('before'),
+        after=request.GET.get('after')
+    )
 
     context = {
         "actions": actions,
@@ -1372,13 +1471,37 @@ def report(request):
 
     return render(request, 'lowfat/report.html', context)
 
+def _geojson_etag(request):
+    if not hasattr(request, "geojson_etag"):
+        request.geojson_etag = geojson_etag()
+    return request.geojson_etag
+
 @staff_member_required
+@condition(etag_func=_geojson_etag)
 def geojson(request):
     """Return the GeoJSON file."""
+    key = "lowfat.geojson.{}".format(_geojson_etag(request))
+    body = cache.get(key)
+    if body is not None:
+        return HttpResponse(body, content_type=GEOJSON_CONTENT_TYPE)
 
-    context = {
-        'claimants': Claimant.objects.all(),
-        'funds': Fund.objects.all(),
-    }
+    return StreamingHttpResponse(cache_stream(key, stream_geojson()), content_type=GEOJSON_CONTENT_TYPE)
 
-    return render(request, 'lowfat/map.geojson', context)
+@staff_member_required
+def geojson_tile(request, zoom, tile_x, tile_y):
+    """Return the clusters of one map tile."""
+    zoom, tile_x, tile_y = int(zoom), int(tile_x), int(tile_y)
+    if zoom > MAX_MAP_ZOOM or max(tile_x, tile_y) >= 2 ** zoom:
+        raise Http404("Tile does not exist.")
+
+    body = map_tile(zoom, tile_x, tile_y)
+    etag = quote_etag(hashlib.md5(bytes(body, 'utf-8')).hexdigest())
+    response = HttpResponse(body, content_type=GEOJSON_CONTENT_TYPE)
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=MAP_TILE_MAX_AGE)
+    return get_conditional_response(request, etag=etag, response=response)
+
+@staff_member_required
+def metrics(request):
+    """Return the metrics of lowfat.metrics for Prometheus."""
+    return HttpResponse(exposition(), content_type=METRICS_CONTENT_TYPE)